@@ -0,0 +1,67 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from calc_team_stats import get_teams, load_pbp, calc_possessions, calc_points_W_L
+from calc_lineup_stints import calc_lineup_stints
+
+'''
+Game-sharded execution
+Every stat in calc_team_stats and calc_lineup_stints only looks inside one
+game at a time, so the pbp data can be split into shards of whole games,
+worked on in a process pool and added back together by team.
+'''
+
+def shard_games(data, n_shards):
+    '''
+    Split pbp data into shards of whole games
+    Input: PBP Data, number of shards
+    Output: List of PBP DFs, each holding about the same number of games
+    '''
+    game_ids = np.sort(data['game_id'].unique())
+    shard_ids = pd.Series(np.arange(len(game_ids)) * n_shards // len(game_ids), index=game_ids)
+    shard = shard_ids[data['game_id'].values].values
+    return [shard_data for _, shard_data in data.groupby(shard)]
+
+def calc_shard(data, remove_projected_heaves=True):
+    '''
+    Possessions, W/L, points and stints for one shard of games
+    Input: PBP Data for whole games
+    Output: Team totals DF, stints DF
+    '''
+    teams = get_teams(data)
+    team_stats = pd.merge(calc_points_W_L(data, teams=teams),
+                          calc_possessions(data, remove_projected_heaves, teams=teams),
+                          on='team_abbrv')
+    return team_stats, calc_lineup_stints(data, remove_projected_heaves)
+
+def calc_team_stats_parallel(data, n_jobs=-1, remove_projected_heaves=True):
+    '''
+    Calculate team totals and lineup stints over a process pool
+    Input: PBP Data, number of worker processes (-1 for all cores)
+    Output: Team totals DF (each row is a team), stints DF
+    '''
+    if data.shape[0] == 0:
+        raise ValueError("No rows in the data")
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    n_games = data['game_id'].nunique()
+    # A few shards per worker keeps the pool busy when games differ in size
+    shards = shard_games(data, min(n_games, n_jobs * 4))
+    if n_jobs == 1:
+        results = [calc_shard(shard, remove_projected_heaves) for shard in shards]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            results = list(pool.map(calc_shard, shards, [remove_projected_heaves] * len(shards)))
+
+    # Every team stat is a count, so the shards reduce with a sum
+    team_stats = pd.concat([team_stats for team_stats, _ in results])\
+        .groupby('team_abbrv').sum().reset_index()
+    team_stats = pd.merge(get_teams(data), team_stats, on='team_abbrv', how='left').fillna(0)
+    stints = pd.concat([stints for _, stints in results], ignore_index=True)
+    return team_stats, stints
+
+if __name__ == '__main__':
+    # Read in pbp data
+    pbp_data = load_pbp('Documents/nba_projects/data/nba/pbp/pbp_season2020_month_november.csv')
+    team_stats, stints = calc_team_stats_parallel(pbp_data)
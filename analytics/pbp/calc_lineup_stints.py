@@ -0,0 +1,333 @@
+import numpy as np
+import pandas as pd
+from calc_team_stats import clock_to_seconds, running_score, load_pbp, flag_possessions
+
+'''
+Lineup stints
+Walk the substitution events of each game to find which five players each
+team had on the court for every event. A stint is a run of events where
+neither lineup changes. Possessions (from flag_possessions) and points (from
+the running score) are attributed to the stint, and through the stint to the
+five-man unit and each player.
+
+Players come from the player1_id/player2_id/player3_id columns. On a
+substitution player1 is the player leaving and player2 the player entering.
+'''
+
+PLAYER_COLS = ['player1_id', 'player2_id', 'player3_id']
+TEAM_COLS = ['player1_team_abbreviation', 'player2_team_abbreviation',
+             'player3_team_abbreviation']
+
+# Sorts after every real player id when lining up the five players on the court
+OFF_COURT = np.iinfo(np.int64).max
+
+def period_start_seconds(period):
+    '''
+    Seconds elapsed in the game when the period starts
+    12 minute quarters and 5 minute overtimes
+    '''
+    period = np.asarray(period)
+    return np.where(period <= 4, (period - 1) * 720, 2880 + (period - 5) * 300)
+
+def period_length_seconds(period):
+    return np.where(np.asarray(period) <= 4, 720, 300)
+
+def lineup_strings(lineups):
+    '''
+    Lineup key, the sorted player ids joined by '-'
+    Input: Array of sorted player ids, one row per lineup
+    Output: List of lineup keys
+    '''
+    return ['-'.join(str(p) for p in lineup if p != OFF_COURT) for lineup in lineups]
+
+def sort_events(data):
+    '''
+    Put every game's events in the order they happened
+    Input: PBP Data
+    Output: PBP Data sorted by game, period and game clock, with seconds_left
+    '''
+    pbp = data.copy()
+    pbp['seconds_left'] = clock_to_seconds(pbp['pctimestring'])
+    return pbp.sort_values(['game_id', 'period', 'seconds_left', 'eventnum'],
+                           ascending=[True, True, False, True]).reset_index(drop=True)
+
+def period_appearances(pbp):
+    '''
+    First appearance of every player in each period, and whether it was being
+    subbed in
+    Input: Sorted PBP Data
+    Output: DF of game_id, period, player_id, team_abbrv, subbed_in
+    '''
+    appearances = []
+    for player_col, team_col in zip(PLAYER_COLS, TEAM_COLS):
+        app = pd.DataFrame({'order': np.arange(pbp.shape[0]),
+                            'game_id': pbp['game_id'].values,
+                            'period': pbp['period'].values,
+                            'player_id': pbp[player_col].values,
+                            'team_abbrv': pbp[team_col].values,
+                            'home_team_abbrev': pbp['home_team_abbrev'].values,
+                            'away_team_abbrev': pbp['away_team_abbrev'].values,
+                            'subbed_in': (pbp['event_type_de'].values == 'substitution') &
+                                         (player_col == 'player2_id')})
+        appearances.append(app)
+    appearances = pd.concat(appearances)
+    # Team events (timeouts, team rebounds) have no player
+    appearances = appearances[appearances['player_id'].notnull() &
+                              (appearances['player_id'] != 0) &
+                              ((appearances['team_abbrv'] == appearances['home_team_abbrev']) |
+                               (appearances['team_abbrv'] == appearances['away_team_abbrev']))]
+    # player1 before player2 before player3 on the same event
+    first = appearances.sort_values('order', kind='mergesort')\
+        .drop_duplicates(['game_id', 'period', 'player_id'])
+    return first[['game_id', 'period', 'player_id', 'team_abbrv', 'subbed_in']]
+
+def infer_period_starters(pbp):
+    '''
+    Players on the court at the start of each period. A player started the
+    period if their first appearance in the period is anything but being
+    subbed in. Starters without any event in the period are filled in by
+    game_lineups.
+    Input: Sorted PBP Data
+    Output: DF of game_id, period, player_id, team_abbrv
+    '''
+    first = period_appearances(pbp)
+    return first.loc[~first['subbed_in'], ['game_id', 'period', 'player_id', 'team_abbrv']]
+
+def player_index(players, ids):
+    '''
+    Position of every id in the sorted player array
+    Input: Sorted array of player ids, array of ids to look up
+    Output: Positions (clipped to the array) and whether each id was found
+    '''
+    if len(players) == 0:
+        return np.zeros(len(ids), dtype=int), np.zeros(len(ids), dtype=bool)
+    pos = np.minimum(np.searchsorted(players, ids), len(players) - 1)
+    return pos, players[pos] == ids
+
+def sorted_lineups(on_court, ids):
+    '''
+    Sorted player ids on the court for every event, padded with OFF_COURT to
+    at least five columns. Events with more than five players on the court
+    keep all of them.
+    Input: Events x players on-court mask, player ids of the columns
+    Output: Events x max(5, most players on the court) array of player ids
+    '''
+    width = max(5, int(on_court.sum(axis=1).max()) if on_court.size else 0)
+    lineups = np.full((on_court.shape[0], max(width, on_court.shape[1])), OFF_COURT, dtype=np.int64)
+    lineups[:, :on_court.shape[1]] = np.where(on_court, ids, OFF_COURT)
+    return np.sort(lineups, axis=1)[:, :width]
+
+def game_lineups(period, is_sub, sub_out, sub_in, sub_team, appearances, home_team):
+    '''
+    Single vectorized pass over each period of one game's events to find the
+    lineups on the court. The lineup for an event is the one on the court
+    before that event's own substitution.
+
+    Starters are the players whose first appearance in the period is not
+    being subbed in. A team with fewer than five of them keeps the players
+    it had on the court at the end of the last period who never appear in
+    this one, when there are exactly as many of them as starters missing.
+
+    An event's lineups are flagged as incomplete when either team does not
+    have exactly five players on the court, or when an earlier substitution
+    in the period subbed out a player who was not on the court (or unknown)
+    or subbed in a player who already was.
+    Input: Arrays for the game's sorted events, the game's period_appearances
+        and the home team abbrv
+    Output: Stint number of every event, home and away lineups (sorted player
+        ids, see sorted_lineups) and whether both lineups are complete for
+        every event
+    '''
+    n_events = len(period)
+    # Index every player who appears in the game
+    sub_rows = np.flatnonzero(is_sub & pd.notnull(sub_in) & (sub_in != 0))
+    players = np.concatenate([appearances['player_id'].values, sub_in[sub_rows]]).astype(np.float64)
+    teams = np.concatenate([appearances['team_abbrv'].values, sub_team[sub_rows]])
+    players, first = np.unique(players, return_index=True)
+    home_mask = teams[first] == home_team
+    starts = np.zeros(len(players), dtype=bool)
+
+    # +1 when a player checks in, -1 when they check out
+    sub_rows = np.flatnonzero(is_sub)
+    out_pos, out_found = player_index(players, sub_out[sub_rows].astype(np.float64))
+    in_pos, in_found = player_index(players, sub_in[sub_rows].astype(np.float64))
+    toggles = np.zeros((n_events, len(players)), dtype=np.int8)
+    np.subtract.at(toggles, (sub_rows[out_found], out_pos[out_found]), 1)
+    np.add.at(toggles, (sub_rows[in_found], in_pos[in_found]), 1)
+
+    on_court = np.zeros((n_events, len(players)), dtype=bool)
+    bad_sub = np.zeros(n_events, dtype=bool)
+    bad_sub[sub_rows[~(out_found & in_found)]] = True
+    after_bad_sub = np.zeros(n_events, dtype=bool)
+    end_of_last = None
+    bounds = np.r_[0, np.flatnonzero(np.diff(period)) + 1, n_events]
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        in_period = appearances[appearances['period'].values == period[lo]]
+        starts[:] = False
+        starts[player_index(players, in_period.loc[~in_period['subbed_in'], 'player_id'].values
+                            .astype(np.float64))[0]] = True
+        # Carry over starters who have no event in the period
+        if end_of_last is not None:
+            appeared = np.zeros(len(players), dtype=bool)
+            appeared[player_index(players, in_period['player_id'].values.astype(np.float64))[0]] = True
+            for team_mask in [home_mask, ~home_mask]:
+                carried = end_of_last & team_mask & ~appeared
+                if carried.sum() == 5 - (starts & team_mask).sum():
+                    starts |= carried
+        # Running substitutions within the period
+        running = np.cumsum(toggles[lo:hi], axis=0, dtype=np.int16)
+        state = starts + running - toggles[lo:hi]
+        on_court[lo:hi] = state > 0
+        end_of_last = (starts + running[-1]) > 0
+        # A player can only be subbed out from the court and in from the bench
+        checked = (sub_rows >= lo) & (sub_rows < hi) & out_found & in_found
+        bad_sub[sub_rows[checked]] |= ((state[sub_rows[checked] - lo, out_pos[checked]] != 1) |
+                                       (state[sub_rows[checked] - lo, in_pos[checked]] != 0))
+        # The substitution's own event still has the lineup from before it
+        after_bad_sub[lo:hi] = np.r_[False, np.maximum.accumulate(bad_sub[lo:hi])[:-1]]
+
+    # Sorted lineup of each team for every event
+    ids = players.astype(np.int64)
+    home_lineup = sorted_lineups(on_court[:, home_mask], ids[home_mask])
+    away_lineup = sorted_lineups(on_court[:, ~home_mask], ids[~home_mask])
+    complete = ((on_court[:, home_mask].sum(axis=1) == 5) &
+                (on_court[:, ~home_mask].sum(axis=1) == 5) & ~after_bad_sub)
+    # A new stint starts with every period and every change of either lineup
+    changed = np.ones(n_events, dtype=bool)
+    changed[1:] = ((period[1:] != period[:-1]) |
+                   (home_lineup[1:] != home_lineup[:-1]).any(axis=1) |
+                   (away_lineup[1:] != away_lineup[:-1]).any(axis=1))
+    return np.cumsum(changed) - 1, home_lineup, away_lineup, complete
+
+def calc_lineup_stints(data, remove_projected_heaves=True):
+    '''
+    Stints for every game in the pbp data
+    Input: PBP Data
+    Output: DF each row is a stint for one team. complete_lineups is False
+        when either lineup did not have exactly five players for the whole
+        stint (see game_lineups)
+    '''
+    if data.shape[0] == 0:
+        raise ValueError("No rows in the data")
+    pbp = sort_events(data)
+    period = pbp['period'].values
+    elapsed = period_start_seconds(period) + period_length_seconds(period) - pbp['seconds_left'].values
+
+    # Points scored during each event from the running score
+    home_score, away_score = running_score(pbp)
+    new_game = np.r_[True, pbp['game_id'].values[1:] != pbp['game_id'].values[:-1]]
+    home_points = np.where(new_game, home_score, np.diff(home_score, prepend=0))
+    away_points = np.where(new_game, away_score, np.diff(away_score, prepend=0))
+    # Possessions ended during each event
+    poss = flag_possessions(pbp, remove_projected_heaves)
+    home_poss = np.zeros(pbp.shape[0], dtype=int)
+    away_poss = np.zeros(pbp.shape[0], dtype=int)
+    home_poss[poss.index] = poss['home_team_possession']
+    away_poss[poss.index] = poss['away_team_possession']
+
+    # Lineups, one game at a time
+    appearances = period_appearances(pbp)
+    game_bounds = np.r_[np.flatnonzero(new_game), pbp.shape[0]]
+    appearance_bounds = np.searchsorted(appearances['game_id'].values, pbp['game_id'].values[game_bounds[:-1]])
+    appearance_bounds = np.r_[appearance_bounds, appearances.shape[0]]
+    is_sub = pbp['event_type_de'].values == 'substitution'
+    sub_out = pbp['player1_id'].values
+    sub_in = pbp['player2_id'].values
+    sub_team = pbp['event_team'].values
+    home_team = pbp['home_team_abbrev'].values
+    stint = np.empty(pbp.shape[0], dtype=int)
+    complete = np.empty(pbp.shape[0], dtype=bool)
+    home_lineups, away_lineups = [], []
+    for g in range(len(game_bounds) - 1):
+        rows = slice(game_bounds[g], game_bounds[g+1])
+        stint[rows], home_lineup, away_lineup, complete[rows] = game_lineups(
+            period[rows], is_sub[rows], sub_out[rows], sub_in[rows], sub_team[rows],
+            appearances.iloc[appearance_bounds[g]:appearance_bounds[g+1]], home_team[game_bounds[g]])
+        # Lineups at the first event of every stint
+        first_rows = np.r_[0, np.flatnonzero(np.diff(stint[rows])) + 1]
+        home_lineups += lineup_strings(home_lineup[first_rows])
+        away_lineups += lineup_strings(away_lineup[first_rows])
+
+    events = pd.DataFrame({'game_id': pbp['game_id'].values,
+                           'stint': stint,
+                           'period': period,
+                           'home_team_abbrev': home_team,
+                           'away_team_abbrev': pbp['away_team_abbrev'].values,
+                           'end_time': elapsed,
+                           'home_points': home_points,
+                           'away_points': away_points,
+                           'home_possessions': home_poss,
+                           'away_possessions': away_poss,
+                           'complete_lineups': complete})
+    stints = events.groupby(['game_id', 'stint'], sort=False).agg({'period': 'first',
+                                                                   'home_team_abbrev': 'first',
+                                                                   'away_team_abbrev': 'first',
+                                                                   'end_time': 'max',
+                                                                   'home_points': 'sum',
+                                                                   'away_points': 'sum',
+                                                                   'home_possessions': 'sum',
+                                                                   'away_possessions': 'sum',
+                                                                   'complete_lineups': 'min'})
+    # A stint starts where the last one in the period ended
+    first_in_period = stints['period'] != stints['period'].shift(1)
+    stints['start_time'] = stints['end_time'].shift(1)
+    stints.loc[first_in_period, 'start_time'] = period_start_seconds(stints.loc[first_in_period, 'period'])
+    stints['seconds'] = stints['end_time'] - stints['start_time']
+    stints['home_lineup'] = home_lineups
+    stints['away_lineup'] = away_lineups
+    stints = stints.reset_index()
+
+    # One row per team per stint
+    home = stints.rename(columns={'home_team_abbrev': 'team_abbrv', 'away_team_abbrev': 'opp_abbrv',
+                                  'home_lineup': 'lineup', 'away_lineup': 'opp_lineup',
+                                  'home_points': 'points_for', 'away_points': 'points_against',
+                                  'home_possessions': 'possessions', 'away_possessions': 'opp_possessions'})
+    away = stints.rename(columns={'away_team_abbrev': 'team_abbrv', 'home_team_abbrev': 'opp_abbrv',
+                                  'away_lineup': 'lineup', 'home_lineup': 'opp_lineup',
+                                  'away_points': 'points_for', 'home_points': 'points_against',
+                                  'away_possessions': 'possessions', 'home_possessions': 'opp_possessions'})
+    team_stints = pd.concat([home, away], ignore_index=True)
+    return team_stints[['game_id', 'period', 'stint', 'team_abbrv', 'opp_abbrv', 'lineup', 'opp_lineup',
+                        'start_time', 'end_time', 'seconds', 'possessions', 'opp_possessions',
+                        'points_for', 'points_against', 'complete_lineups']]
+
+def calc_lineup_stats(stints):
+    '''
+    Totals for every five-man unit. Stints without five players on the court
+    for both teams (complete_lineups) are left out.
+    Input: Output of calc_lineup_stints
+    Output: DF each row is a team's lineup
+    '''
+    lineups = stints[stints['complete_lineups']].groupby(['team_abbrv', 'lineup']).agg({'game_id': 'nunique',
+                                                           'seconds': 'sum',
+                                                           'possessions': 'sum',
+                                                           'opp_possessions': 'sum',
+                                                           'points_for': 'sum',
+                                                           'points_against': 'sum'})\
+        .reset_index().rename(columns={'game_id': 'GP'})
+    lineups['plus_minus'] = lineups['points_for'] - lineups['points_against']
+    return lineups
+
+def calc_player_stints(stints):
+    '''
+    Totals for every player through the stints they were on the court for
+    Input: Output of calc_lineup_stints
+    Output: DF each row is a player
+    '''
+    players = stints.assign(player_id=stints['lineup'].str.split('-')).explode('player_id')
+    players = players.groupby(['team_abbrv', 'player_id']).agg({'game_id': 'nunique',
+                                                              'seconds': 'sum',
+                                                              'possessions': 'sum',
+                                                              'opp_possessions': 'sum',
+                                                              'points_for': 'sum',
+                                                              'points_against': 'sum'})\
+        .reset_index().rename(columns={'game_id': 'GP'})
+    players['plus_minus'] = players['points_for'] - players['points_against']
+    return players
+
+if __name__ == '__main__':
+    # Read in pbp data
+    pbp_data = load_pbp('Documents/nba_projects/data/nba/pbp/pbp_season2020_month_november.csv')
+    stints = calc_lineup_stints(pbp_data)
+    lineup_stats = calc_lineup_stats(stints)
+    player_stats = calc_player_stints(stints)
@@ -0,0 +1,128 @@
+import os
+import pandas as pd
+from calc_team_stats import load_pbp, flag_possessions, final_scores
+
+'''
+Team ratings
+The possession ledger holds one row per team per game with possessions,
+points and minutes for both sides. It is built from the pbp events once and
+saved, so ratings for any team and date window are a sum over the ledger
+instead of another pass over the events.
+
+ortg: points scored per 100 possessions
+drtg: points allowed per 100 opponent possessions
+nrtg: ortg - drtg
+pace: possessions per 48 minutes
+'''
+
+LEDGER_COLS = ['game_id', 'game_date', 'team_abbrv', 'opp_abbrv', 'home', 'minutes',
+               'possessions', 'opp_possessions', 'points_for', 'points_against']
+
+BBREF_TO_NBA = {'BRK': 'BKN', 'PHO': 'PHX', 'CHO': 'CHA'}
+
+def build_possession_ledger(data, remove_projected_heaves=True):
+    '''
+    Possessions, points and minutes for every team in every game
+    Input: PBP Data
+    Output: DF each row is a team's game
+    '''
+    if data.shape[0] == 0:
+        raise ValueError("No rows in the data")
+    # Possessions per game for each side
+    pbp = flag_possessions(data, remove_projected_heaves)
+    poss = pbp.groupby('game_id').agg({'home_team_possession': 'sum',
+                                       'away_team_possession': 'sum'}).reset_index()
+    # Final scores, and the length of the game from the overtimes played
+    end_game = final_scores(data)[['game_id', 'game_date', 'home_team_abbrev', 'away_team_abbrev',
+                                   'max_period', 'home_score', 'away_score']]
+    games = pd.merge(end_game, poss, on='game_id', how='left').fillna({'home_team_possession': 0,
+                                                                       'away_team_possession': 0})
+    games['minutes'] = 48 + 5 * (games['max_period'] - 4).clip(lower=0)
+
+    home = games.rename(columns={'home_team_abbrev': 'team_abbrv', 'away_team_abbrev': 'opp_abbrv',
+                                 'home_team_possession': 'possessions',
+                                 'away_team_possession': 'opp_possessions',
+                                 'home_score': 'points_for', 'away_score': 'points_against'})
+    home['home'] = True
+    away = games.rename(columns={'away_team_abbrev': 'team_abbrv', 'home_team_abbrev': 'opp_abbrv',
+                                 'away_team_possession': 'possessions',
+                                 'home_team_possession': 'opp_possessions',
+                                 'away_score': 'points_for', 'home_score': 'points_against'})
+    away['home'] = False
+    ledger = pd.concat([home, away], ignore_index=True)[LEDGER_COLS]
+    ledger['game_date'] = pd.to_datetime(ledger['game_date'])
+    return ledger.sort_values(['game_date', 'game_id', 'home']).reset_index(drop=True)
+
+def update_possession_ledger(data, ledger_path, remove_projected_heaves=True):
+    '''
+    Add any games not already in the saved ledger and save it again
+    Input: PBP Data, path to the ledger csv
+    Output: The full ledger
+    '''
+    if os.path.exists(ledger_path):
+        ledger = pd.read_csv(ledger_path, parse_dates=['game_date'])
+        new_games = data[~data['game_id'].isin(ledger['game_id'])]
+    else:
+        ledger = pd.DataFrame(columns=LEDGER_COLS)
+        new_games = data
+    if new_games.shape[0] > 0:
+        ledger = pd.concat([ledger, build_possession_ledger(new_games, remove_projected_heaves)],
+                           ignore_index=True)
+        ledger.to_csv(ledger_path, index=False)
+    return ledger
+
+def calc_team_ratings(ledger, start_date=None, end_date=None, teams=None):
+    '''
+    Offensive, defensive and net rating and pace over a date window
+    Input: Possession ledger, optional start and end dates (inclusive) and
+        list of team abbrvs
+    Output: DF each row is a team
+    '''
+    window = ledger
+    if start_date is not None:
+        window = window[window['game_date'] >= pd.to_datetime(start_date)]
+    if end_date is not None:
+        window = window[window['game_date'] <= pd.to_datetime(end_date)]
+    if teams is not None:
+        window = window[window['team_abbrv'].isin(teams)]
+    if window.shape[0] == 0:
+        raise ValueError("No games in the window")
+    ratings = window.groupby('team_abbrv').agg({'game_id': 'count',
+                                                'minutes': 'sum',
+                                                'possessions': 'sum',
+                                                'opp_possessions': 'sum',
+                                                'points_for': 'sum',
+                                                'points_against': 'sum'})\
+        .reset_index().rename(columns={'game_id': 'GP'})
+    ratings['ortg'] = 100 * ratings['points_for'] / ratings['possessions']
+    ratings['drtg'] = 100 * ratings['points_against'] / ratings['opp_possessions']
+    ratings['nrtg'] = ratings['ortg'] - ratings['drtg']
+    ratings['pace'] = 48 * (ratings['possessions'] + ratings['opp_possessions']) / (2 * ratings['minutes'])
+    return ratings.sort_values('nrtg', ascending=False).reset_index(drop=True)
+
+def compare_team_ratings(ratings, season, bbref_ratings_path, team_id_path):
+    '''
+    Line pbp ratings up against the scraped Basketball-Reference ratings
+    Input: Output of calc_team_ratings, season as YYYY-YYYY, paths to
+        team_ratings.csv and nba_team_id.csv
+    Output: DF each row is a team with both sets of ratings and the difference
+    '''
+    bbref = pd.read_csv(bbref_ratings_path)
+    bbref = bbref[bbref['SEASON'] == season][['TEAM', 'ORTG', 'DRTG', 'NRTG']]
+    # pbp uses NBA abbrvs, which only differ from Basketball-Reference's for
+    # three teams. Only one Charlotte name is in any season's table.
+    team_ids = pd.read_csv(team_id_path)[['team_name', 'bbref_team_id']]
+    team_ids['team_abbrv'] = team_ids['bbref_team_id'].replace(BBREF_TO_NBA)
+    bbref = pd.merge(bbref, team_ids, left_on='TEAM', right_on='team_name')
+    comparison = pd.merge(ratings[['team_abbrv', 'GP', 'ortg', 'drtg', 'nrtg', 'pace']], bbref,
+                          on='team_abbrv', how='left')
+    for rating in ['ortg', 'drtg', 'nrtg']:
+        comparison['{}_diff'.format(rating)] = comparison[rating] - comparison[rating.upper()]
+    return comparison.drop(['team_name', 'bbref_team_id'], axis=1)
+
+if __name__ == '__main__':
+    # Read in pbp data
+    pbp_data = load_pbp('Documents/nba_projects/data/nba/pbp/pbp_season2020_month_november.csv')
+    ledger = update_possession_ledger(pbp_data, 'Documents/nba_projects/data/nba/pbp/possession_ledger.csv')
+    # Last two weeks of the ledger
+    ratings = calc_team_ratings(ledger, start_date=ledger['game_date'].max() - pd.Timedelta(days=14))
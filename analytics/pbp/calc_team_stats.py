@@ -2,13 +2,16 @@ import numpy as np
 import pandas as pd
 from functools import reduce
 from datetime import datetime, timedelta
-# Read in pbp data
-pbp_data = pd.read_csv('Documents/nba_projects/data/nba/pbp/pbp_season2020_month_november.csv')
-pbp_data = pbp_data.drop(['home_score', 'away_score'], axis = 1)
-# Global list of team abbrv
-team_list = [team for team in list(pbp_data.home_team_abbrev.unique()) + list(pbp_data.away_team_abbrev.unique())]
-teams = pd.DataFrame(set(team_list),
-            columns=['team_abbrv'])
+
+def get_teams(data):
+    '''
+    List of every team abbrv that appears in the pbp data
+    Input: PBP Data
+    Output: DF with one column, team_abbrv
+    '''
+    team_list = [team for team in list(data.home_team_abbrev.unique()) + list(data.away_team_abbrev.unique())]
+    return pd.DataFrame(set(team_list),
+                        columns=['team_abbrv'])
 
 def point_diff_to_expected_wins(point_diff):
     return (point_diff*2.7)+41
@@ -27,49 +30,109 @@ Use event_type_de to remove
 
 Keeps: rebound, shot, missed-shot, turnover, period-end (only if it changes teams)
 '''
-def calc_possessions(data, remove_projected_heaves=True):
+def clock_to_seconds(pctimestring):
     '''
-    To do: Garbage Time
-    To do: Heave possessions -- when possession starts (so last possession ends) with 4 or less seconds left
+    Game clock string (MM:SS) to seconds left in the period
+    Input: Series of pctimestring
+    Output: Array of seconds
     '''
-    if data.shape[0] == 0:
-        raise ValueError("No rows in the data")
-    else:
-        stat_data = data.copy()
+    clock = pctimestring.str.split(':', expand=True)
+    return clock[0].astype(int).values * 60 + clock[1].astype(int).values
 
+def running_score(data):
+    '''
+    Home and away score after every event
+    Input: PBP Data, in event order within each game
+    Output: Two arrays, home score and away score
+    '''
+    score = data.groupby('game_id')['score'].ffill().fillna('0-0').str.split('-', n=1, expand=True)
+    return score[0].astype(int).values, score[1].astype(int).values
+
+def add_event_filters(data):
+    '''
+    Event-level filter masks, computed once so every possession and rating
+    calculation can reuse them
+    - heave_window: the previous event was with less than 4 seconds on the
+      clock in one of the first three quarters. A possession change here
+      starts a projected heave (cleaning the glass filter).
+    - garbage_time: fourth quarter with a margin of 25+ (12:00-9:00),
+      20+ (9:00-6:00) or 15+ (last 6:00)
+    - technical_free_throw: free throw from a technical foul
+    Input: PBP Data, in event order within each game
+    Output: PBP Data with the three boolean columns added
+    '''
     pbp = data.copy()
-    # Remove projected heaves by cleaning the glass filter
-    # CTG defines these possessions as those that start with 4 or fewer seconds
-    # on the game clock at the end of one of the first three quarters.
-    if remove_projected_heaves:
-        # Previous time on the clock
-        pbp['prev_time_str'] = pbp.groupby(['game_id', 'period'])['pctimestring'].shift(1, fill_value='12:00:00')
-        def new_split(row):
-            return row['prev_time_str'].split(':')
-        # String to number
-        time = [int(t[0]) * 60 + int(t[1]) for t in pbp.apply(new_split, axis=1)]
-        pbp['prev_time'] = time # Time as a number
+    seconds_left = clock_to_seconds(pbp['pctimestring'])
+    # Previous time on the clock, 12:00 at the start of the period
+    prev_time = pd.Series(seconds_left, index=pbp.index)\
+        .groupby([pbp['game_id'], pbp['period']]).shift(1, fill_value=720)
+    pbp['heave_window'] = (prev_time.values < 4) & (pbp['period'].values < 4)
+    # Margin from the running score
+    home_score, away_score = running_score(pbp)
+    margin = np.abs(home_score - away_score)
+    pbp['garbage_time'] = (pbp['period'].values == 4) & (
+        ((seconds_left >= 540) & (margin >= 25)) |
+        ((seconds_left >= 360) & (seconds_left < 540) & (margin >= 20)) |
+        ((seconds_left < 360) & (margin >= 15)))
+    technical = pbp['homedescription'].str.contains('Technical', na=False) | \
+                pbp['visitordescription'].str.contains('Technical', na=False)
+    pbp['technical_free_throw'] = (pbp['event_type_de'] == 'free-throw') & technical
+    return pbp
+
+def load_pbp(path):
+    '''
+    Read in pbp data and add the event filter masks
+    Input: Path to a pbp csv
+    Output: PBP Data
+    '''
+    pbp_data = pd.read_csv(path)
+    return add_event_filters(pbp_data)
+
+def flag_possessions(data, remove_projected_heaves=True, remove_garbage_time=False):
+    '''
+    Flag the events that end a possession for the home or away team
+    Input: PBP Data, with the masks from add_event_filters (added here if missing)
+    Output: DF of the possession-changing events (original index kept) with
+        home_team_possession and away_team_possession flags
+    '''
+    if data.shape[0] == 0:
+        raise ValueError("No rows in the data")
+    if 'heave_window' not in data.columns:
+        data = add_event_filters(data)
 
     # Only get events that will show change in possession
-    pbp = pbp.query("event_type_de in ('rebound', 'shot', 'missed_shot', 'turnover', 'free-throw')").copy()
+    pbp = data[data['event_type_de'].isin(['rebound', 'shot', 'missed_shot', 'turnover', 'free-throw'])]
     # Remove technical fouls
-    pbp = pbp.query("not (homedescription.str.contains('Technical') or visitordescription.str.contains('Technical'))")
-    pbp = pbp.sort_values(['period','pctimestring', 'eventnum'], ascending=[True, False, True])
+    pbp = pbp[~pbp['technical_free_throw']]
+    if remove_garbage_time:
+        pbp = pbp[~pbp['garbage_time']]
+    # Sort on the clock in seconds, as 'MM:SS' strings put 9:59 after 10:00
+    pbp = pbp.assign(seconds_left=clock_to_seconds(pbp['pctimestring']))\
+        .sort_values(['game_id', 'period', 'seconds_left', 'eventnum'], ascending=[True, True, False, True])
     pbp['next_team'] = pbp.groupby(['game_id', 'period'])['event_team'].shift(-1, fill_value="XXX")
     pbp['prev_team'] = pbp.groupby(['game_id', 'period'])['event_team'].shift(1, fill_value="YYY")
+    # Remove projected heaves by cleaning the glass filter
+    # CTG defines these possessions as those that start with 4 or fewer seconds
+    # on the game clock at the end of one of the first three quarters.
     if remove_projected_heaves:
-        # Filter
-        pbp = pbp.query("(not (prev_time < 4 and period < 4 and event_team != prev_team)) or period >= 4")
+        pbp = pbp[~(pbp['heave_window'] & (pbp['event_team'] != pbp['prev_team']))]
     # Calc home possessions
-    pbp['home_team_possession'] = list(map(
-        lambda home_team, team, next_team, event: 1 if team == home_team and team != next_team
-                                                        else 0,
-        pbp.home_team_abbrev, pbp.event_team, pbp.next_team, pbp.event_type_de))
+    pbp['home_team_possession'] = ((pbp['event_team'] == pbp['home_team_abbrev']) &
+                                   (pbp['event_team'] != pbp['next_team'])).astype(int)
     # Calc away possessions
-    pbp['away_team_possession'] = list(map(
-        lambda away_team, team, next_team, prev_team: 1 if team == away_team and team != next_team
-                                                        else 0,
-        pbp.away_team_abbrev, pbp.event_team, pbp.next_team, pbp.prev_team))
+    pbp['away_team_possession'] = ((pbp['event_team'] == pbp['away_team_abbrev']) &
+                                   (pbp['event_team'] != pbp['next_team'])).astype(int)
+    return pbp
+
+def calc_possessions(data, remove_projected_heaves=True, teams=None, remove_garbage_time=False):
+    '''
+    Possessions for every team
+    Heave possessions -- when possession starts (so last possession ends) with 4 or less seconds left
+    Garbage time -- see add_event_filters
+    '''
+    if teams is None:
+        teams = get_teams(data)
+    pbp = flag_possessions(data, remove_projected_heaves, remove_garbage_time)
     # Now aggregate and join
     home_poss = pbp.groupby('home_team_abbrev')['home_team_possession'].sum().reset_index().\
         rename(columns={'home_team_abbrev': 'team_abbrv'})
@@ -82,17 +145,14 @@ def calc_possessions(data, remove_projected_heaves=True):
     return poss_df[['team_abbrv', 'possessions']]
 
 
-def calc_points_W_L(data):
+def final_scores(data):
     '''
-    NEED TO DO: Techincal Foul Points vs non technical foul points
-    Calculate Wins, Losses, Points For and Points Against for PBP Data
+    Final score of every game
     Input: PBP Data
-    Output: DF each row is a team
+    Output: DF with the last scoring row of each game, with max_period,
+        home_score and away_score
     '''
-    if data.shape[0] == 0:
-        raise ValueError("No rows in the data")
-    else:
-        stat_data = data.copy()
+    stat_data = data.copy()
     # Get the last row of each game
     stat_data['max_period'] = stat_data.groupby('game_id')['period'].transform(max)
     end_game = stat_data.query("period == max_period")
@@ -102,6 +162,20 @@ def calc_points_W_L(data):
     score = end_game['score'].str.split('-', n=1, expand = True)
     end_game['home_score'] = [int(x) for x in score[0]]
     end_game['away_score'] = [int(x) for x in score[1]]
+    return end_game
+
+def calc_points_W_L(data, teams=None):
+    '''
+    NEED TO DO: Techincal Foul Points vs non technical foul points
+    Calculate Wins, Losses, Points For and Points Against for PBP Data
+    Input: PBP Data
+    Output: DF each row is a team
+    '''
+    if data.shape[0] == 0:
+        raise ValueError("No rows in the data")
+    if teams is None:
+        teams = get_teams(data)
+    end_game = final_scores(data)
     # Calculate teams wins and losses
     home_wins = end_game.query("home_score > away_score").groupby('home_team_abbrev').size()\
         .reset_index(name='W_home').rename(columns={'home_team_abbrev':'team_abbrv'})
@@ -126,7 +200,7 @@ def calc_points_W_L(data):
     }).reset_index().rename(columns={'home_team_abbrev':'team_abbrv',
                                      'home_score': 'home_points_for',
                                      'away_score': 'home_points_against'})
-#    home_technical_points = stat_data.query("homedescription.str.contains('Technical')").\
+#    home_technical_points = data.query("homedescription.str.contains('Technical')").\
 #        groupby('home_team_abbrev').agg({'points_made':'sum'})
     away_points = end_game.groupby('away_team_abbrev').agg({
         'home_score': 'sum',
@@ -146,6 +220,8 @@ def calc_points_W_L(data):
     return fin_df
 
 def calc_last_n_days(data, start_date = None, end_date = None, last_n_days = None):
+    # Keep every team in the output, even those without a game in the window
+    teams = get_teams(data)
     # Convert game date to date
     data['game_date'] = pd.to_datetime(data['game_date'])
     # If nothing is given, calculate last two weeks from current date
@@ -196,4 +272,11 @@ def calc_last_n_days(data, start_date = None, end_date = None, last_n_days = Non
         filt_pbp = data.loc[(data.game_date <= start_date) & (data.game_date >= two_weeks_from_date)].copy()
         return filt_pbp
     # After all that (are there more cases?)
-    return calc_points_W_L(filt_pbp)
+    return calc_points_W_L(filt_pbp, teams=teams)
+
+if __name__ == '__main__':
+    # Read in pbp data
+    pbp_data = load_pbp('Documents/nba_projects/data/nba/pbp/pbp_season2020_month_november.csv')
+    pbp_data = pbp_data.drop(['home_score', 'away_score'], axis = 1)
+    # Global list of team abbrv
+    teams = get_teams(pbp_data)
@@ -0,0 +1,183 @@
+import io
+import time
+import pandas as pd
+from calc_team_ratings import LEDGER_COLS, calc_team_ratings
+from calc_lineup_stints import period_start_seconds, period_length_seconds
+
+'''
+Live pbp
+Streams events for in-progress games and keeps possessions, scores and
+ratings up to date one event at a time, instead of rerunning the batch
+functions over the whole file on every poll.
+
+Possessions follow flag_possessions: a possession event ends a possession
+when the next possession event in the period is by the other team, or when
+the period ends. Technical free throws are skipped and projected heaves
+are removed the same way.
+'''
+
+POSSESSION_EVENTS = ['rebound', 'shot', 'missed_shot', 'turnover', 'free-throw']
+
+def event_seconds(pctimestring):
+    clock = pctimestring.split(':')
+    return int(clock[0]) * 60 + int(clock[1])
+
+def is_technical_free_throw(event):
+    if 'technical_free_throw' in event:
+        return bool(event['technical_free_throw'])
+    return event['event_type_de'] == 'free-throw' and \
+        any(isinstance(event[col], str) and 'Technical' in event[col]
+            for col in ['homedescription', 'visitordescription'])
+
+class LiveTeamStats:
+    '''
+    Incremental possessions and points for every game in the feed. Events
+    for a game have to arrive in the order they happened.
+    '''
+
+    def __init__(self, remove_projected_heaves=True):
+        self.remove_projected_heaves = remove_projected_heaves
+        self.games = {}
+
+    def _new_game(self, event):
+        return {'game_date': event['game_date'],
+                'home': event['home_team_abbrev'],
+                'away': event['away_team_abbrev'],
+                'period': None,
+                'prev_clock': 720,
+                'prev_team': 'YYY',
+                'clock': 720,
+                'final': False,
+                'pending': None,
+                'home_possessions': 0,
+                'away_possessions': 0,
+                'home_score': 0,
+                'away_score': 0}
+
+    def _end_pending(self, game, next_team):
+        # The last possession event ends a possession if the ball changes teams
+        team, heave = game['pending']
+        game['pending'] = None
+        if heave or team == next_team:
+            return
+        if team == game['home']:
+            game['home_possessions'] += 1
+        elif team == game['away']:
+            game['away_possessions'] += 1
+
+    def _end_period(self, game):
+        if game['pending'] is not None:
+            self._end_pending(game, 'XXX')
+
+    def add_event(self, event):
+        '''
+        Update the totals with one event
+        Input: Mapping of pbp columns to values for a single event
+        '''
+        game_id = event['game_id']
+        if game_id not in self.games:
+            self.games[game_id] = self._new_game(event)
+        game = self.games[game_id]
+        period = event['period']
+        if period != game['period']:
+            self._end_period(game)
+            game['period'] = period
+            game['prev_clock'] = 720
+            game['prev_team'] = 'YYY'
+        # Less than 4 seconds on the clock before this event, first three quarters
+        seconds = event_seconds(event['pctimestring'])
+        heave_window = game['prev_clock'] < 4 and period < 4
+        game['prev_clock'] = seconds
+        game['clock'] = seconds
+
+        if isinstance(event['score'], str):
+            score = event['score'].split('-', 1)
+            game['home_score'], game['away_score'] = int(score[0]), int(score[1])
+
+        if event['event_type_de'] in POSSESSION_EVENTS and not is_technical_free_throw(event):
+            team = event['event_team']
+            if game['pending'] is not None:
+                self._end_pending(game, team)
+            heave = self.remove_projected_heaves and heave_window and team != game['prev_team']
+            game['pending'] = (team, heave)
+            game['prev_team'] = team
+        elif event['event_type_de'] == 'period-end':
+            self._end_period(game)
+            # Regulation or an overtime ended without a tie
+            game['final'] = period >= 4 and game['home_score'] != game['away_score']
+
+    def add_events(self, events):
+        '''
+        Update the totals with a batch of new events
+        Input: PBP DF of new events, in order
+        '''
+        for event in events.to_dict('records'):
+            self.add_event(event)
+
+    def game_totals(self):
+        '''
+        Current totals in the possession ledger format, so they can be
+        stacked on the ledger of completed games. Minutes of games still in
+        progress are the time played so far on the game clock.
+        Output: DF each row is a team's game
+        '''
+        rows = []
+        for game_id, game in self.games.items():
+            if game['final']:
+                minutes = 48 + 5 * max(game['period'] - 4, 0)
+            else:
+                # Time played so far from the game clock
+                minutes = float(period_start_seconds(game['period']) + period_length_seconds(game['period']) -
+                                game['clock']) / 60
+            for side, opp in [('home', 'away'), ('away', 'home')]:
+                rows.append({'game_id': game_id,
+                             'game_date': game['game_date'],
+                             'team_abbrv': game[side],
+                             'opp_abbrv': game[opp],
+                             'home': side == 'home',
+                             'minutes': minutes,
+                             'possessions': game['{}_possessions'.format(side)],
+                             'opp_possessions': game['{}_possessions'.format(opp)],
+                             'points_for': game['{}_score'.format(side)],
+                             'points_against': game['{}_score'.format(opp)]})
+        totals = pd.DataFrame(rows, columns=LEDGER_COLS)
+        totals['game_date'] = pd.to_datetime(totals['game_date'])
+        return totals
+
+    def team_ratings(self, ledger=None):
+        '''
+        Ratings for the live games, plus the completed games in the ledger
+        Input: Optional possession ledger
+        Output: DF each row is a team (see calc_team_ratings)
+        '''
+        totals = self.game_totals()
+        if ledger is not None:
+            totals = pd.concat([ledger[~ledger['game_id'].isin(totals['game_id'])], totals],
+                               ignore_index=True)
+        return calc_team_ratings(totals)
+
+def tail_pbp(path, poll_interval=1.0):
+    '''
+    Follow a pbp csv that another process is appending to, like tail -f
+    Input: Path to the pbp csv, seconds to wait between reads
+    Output: Generator of DFs with the rows added since the last read
+    '''
+    with open(path) as feed:
+        header = feed.readline()
+        partial = ''
+        while True:
+            chunk = feed.read()
+            if not chunk:
+                time.sleep(poll_interval)
+                continue
+            # Hold back a line that is still being written
+            lines = (partial + chunk).split('\n')
+            partial = lines.pop()
+            if lines:
+                yield pd.read_csv(io.StringIO(header + '\n'.join(lines)))
+
+if __name__ == '__main__':
+    live = LiveTeamStats()
+    for events in tail_pbp('Documents/nba_projects/data/nba/pbp/live_pbp.csv'):
+        live.add_events(events)
+        print(live.team_ratings()[['team_abbrv', 'possessions', 'points_for', 'ortg', 'drtg', 'nrtg']])
@@ -0,0 +1,222 @@
+# Project: Basketball-Reference Percentiles
+# Project Track: Data Scraping
+# Description: Transform Basketball-Reference player box-score statistics and
+# measurements into percentiles within each season, both across the entire
+# league and within each advanced position cluster (guard, wing, big). Python
+# counterpart of percentiles.R that can recompute only the seasons that change.
+# Data Sources: Basketball-Reference
+# Last Updated: 10/19/2026
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'modeling', 'player_seasons'))
+from player_seasons import collapse_traded_seasons
+
+# Percentile field name, Basketball-Reference column, and whether lower values
+# rank higher (younger players are in a higher age percentile). Names match
+# the existing nba_percentile_all.csv/nba_percentile_position.csv fields. The
+# fields are '<name>_percentile_<all|position>', except for names that already
+# hold '_percentile' (the per-100 box score stats of percentiles.R, e.g.
+# oreb_percentile_per100_all), which are '<name>_<all|position>'.
+PERCENTILE_METRICS = [('height', 'height', False),
+                      ('weight', 'weight', False),
+                      ('age', 'AGE', True),
+                      ('games_player', 'G', False),
+                      ('games_started', 'GS', False),
+                      ('minutes', 'MP', False),
+                      ('fg', 'FG', False),
+                      ('fga', 'FGA', False),
+                      ('fg_percent', 'FG%', False),
+                      ('three_point_made', '3P', False),
+                      ('three_point_attempt', '3PA', False),
+                      ('three_point_percent', '3P%', False),
+                      ('two_point_made', '2P', False),
+                      ('two_point_attempt', '2PA', False),
+                      ('two_point_percent', '2P%', False),
+                      ('efg_percent', 'eFG%', False),
+                      ('true_shooting_percent', 'TS%', False),
+                      ('free_throw_made', 'FT', False),
+                      ('free_throw_attempt', 'FTA', False),
+                      ('free_throw_percent', 'FT%', False),
+                      ('oreb', 'ORB', False),
+                      ('drb', 'DRB', False),
+                      ('total', 'TRB', False),
+                      ('ast', 'AST', False),
+                      ('stl', 'STL', False),
+                      ('blk', 'BLK', False),
+                      ('turnover', 'TOV', False),
+                      ('foul', 'PF', False),
+                      ('points', 'PTS', False),
+                      ('fg_made_per100', 'PER100_FG', False),
+                      ('fg_attempted_per100', 'PER100_FGA', False),
+                      ('three_point_made_per100', 'PER100_3P', False),
+                      ('three_point_attempt_per100', 'PER100_3PA', False),
+                      ('two_point_made_per100', 'PER100_2P', False),
+                      ('two_point_attempt_per100', 'PER100_2PA', False),
+                      ('free_throw_made_per100', 'PER100_FT', False),
+                      ('free_throw_attempt_per100', 'PER100_FTA', False),
+                      ('oreb_percentile_per100', 'PER100_ORB', False),
+                      ('drb_percentile_per100', 'PER100_DRB', False),
+                      ('total_percentile_per100', 'PER100_TRB', False),
+                      ('ast_percentile_per100', 'PER100_AST', False),
+                      ('stl_percentile_per100', 'PER100_STL', False),
+                      ('blk_percentile_per100', 'PER100_BLK', False),
+                      ('tov_percentile_per100', 'PER100_TOV', False),
+                      ('foul_percentile_per100', 'PER100_PF', False),
+                      ('points_percentile_per100', 'PER100_PTS', False),
+                      ('three_point_attempt_rate', '3PA_RATE', False),
+                      ('free_throw_rate', 'FT_RATE', False),
+                      ('orb_percent', 'ORB%', False),
+                      ('drb_percent', 'DRB%', False),
+                      ('trb_percent', 'TRB%', False),
+                      ('ast_percent', 'AST%', False),
+                      ('stl_percent', 'STL%', False),
+                      ('blk_percent', 'BLK%', False),
+                      ('tov_percent', 'TOV%', False),
+                      ('usg_percent', 'USG%', False),
+                      ('off_win_shares', 'OWS', False),
+                      ('def_win_shares', 'DWS', False),
+                      ('win_shares', 'WS', False),
+                      ('win_sharres_per_48', 'WS/48', False),
+                      ('off_bpm', 'OBPM', False),
+                      ('def_bpm', 'DBPM', False),
+                      ('bpm', 'BPM', False),
+                      ('vorp', 'VORP', False)]
+
+def percentile_field(name, suffix):
+    """
+    Field name of a PERCENTILE_METRICS entry.
+
+    Args:
+        name (str): Percentile field name from PERCENTILE_METRICS
+        suffix (str): Field name suffix, 'all' or 'position'
+
+    Returns:
+        field (str): Column name in the percentile csv
+    """
+    if '_percentile' in name:
+        return '{0}_{1}'.format(name, suffix)
+    return '{0}_percentile_{1}'.format(name, suffix)
+
+def load_percentile_inputs(stats_path, measurements_path):
+    """
+    Read Basketball-Reference player statistics, keep the TOT row for players
+    traded mid-season, and join on player measurements.
+
+    Args:
+        stats_path (str): Path to bbref_player_data.csv
+        measurements_path (str): Path to player_measurements.csv
+
+    Returns:
+        stats (pandas DataFrame): One row per player/season
+    """
+    stats = collapse_traded_seasons(pd.read_csv(stats_path))
+    measurements = pd.read_csv(measurements_path)[['bbref_id', 'height', 'weight']]
+    return pd.merge(stats, measurements, how='left', left_on='BBREF_ID', right_on='bbref_id')\
+             .drop('bbref_id', axis=1)
+
+def calc_percentiles(stats, group_cols, suffix):
+    """
+    Percentile of every metric in PERCENTILE_METRICS within each group, with
+    the same definition as dplyr's percent_rank: (min rank - 1) / (players
+    with a value - 1), leaving nulls null. All metrics are ranked together in
+    a single grouped rank over the metric matrix.
+
+    Args:
+        stats (pandas DataFrame): One row per player/season
+        group_cols (list): Columns to rank within, e.g. ['SEASON']
+        suffix (str): Field name suffix, 'all' or 'position'
+
+    Returns:
+        percentiles (pandas DataFrame): BBREF_ID, group_cols and one
+        column per metric (see percentile_field)
+    """
+    names = [percentile_field(name, suffix) for name, _, _ in PERCENTILE_METRICS]
+    values = pd.DataFrame(np.column_stack([-stats[col].values if descending else stats[col].values
+                                           for _, col, descending in PERCENTILE_METRICS]).astype(np.float64),
+                          index=stats.index, columns=names)
+    # Players without a position cluster are ranked together, as in percentiles.R
+    grouped = values.groupby([stats[col] for col in group_cols], dropna=False)
+    ranks = grouped.rank(method='min')
+    counts = grouped.transform('count')
+    percentiles = (ranks - 1) / (counts - 1)
+    return pd.concat([stats[['BBREF_ID'] + group_cols], percentiles], axis=1)
+
+def calc_league_percentiles(stats):
+    """
+    Percentiles of every metric compared to the entire league each season.
+
+    Args:
+        stats (pandas DataFrame): Output of load_percentile_inputs
+
+    Returns:
+        percentiles (pandas DataFrame): One row per player/season
+    """
+    return calc_percentiles(stats, ['SEASON'], 'all')
+
+def calc_position_percentiles(stats, positions):
+    """
+    Percentiles of every metric compared to players in the same advanced
+    position cluster each season. Players without a positional estimate are
+    left out.
+
+    Args:
+        stats (pandas DataFrame): Output of load_percentile_inputs
+        positions (pandas DataFrame): player_position_estimates.csv
+
+    Returns:
+        percentiles (pandas DataFrame): One row per player/season
+    """
+    stats = stats.assign(season_end=stats['SEASON'].str[5:].astype(int))
+    stats = pd.merge(stats, positions[['bbref_id', 'season', 'advanced_position_cluster']],
+                     left_on=['BBREF_ID', 'season_end'], right_on=['bbref_id', 'season'])
+    return calc_percentiles(stats, ['SEASON', 'advanced_position_cluster'], 'position')
+
+def update_percentile_file(path, stats, positions=None, seasons=None):
+    """
+    Recompute percentiles for only the seasons that changed and write them
+    into a percentile file. Percentiles only compare players within the same
+    season, so every other season's rows are kept as they are.
+
+    Args:
+        path (str): Path to the percentile csv
+        stats (pandas DataFrame): Output of load_percentile_inputs
+        positions (pandas DataFrame): player_position_estimates.csv for
+        position percentiles, None for league percentiles (Default=None)
+        seasons (list): Seasons (YYYY-YYYY) to recompute. Defaults to the
+        seasons in stats that are not in the file yet plus the latest season,
+        which may still be in progress.
+
+    Returns:
+        percentiles (pandas DataFrame): The full percentile table
+    """
+    existing = pd.read_csv(path) if os.path.exists(path) else None
+    if seasons is None:
+        seasons = set(stats['SEASON'])
+        if existing is not None:
+            seasons = (seasons - set(existing['SEASON'])) | {stats['SEASON'].max()}
+    stats = stats[stats['SEASON'].isin(seasons)]
+    if positions is None:
+        updated = calc_league_percentiles(stats)
+    else:
+        updated = calc_position_percentiles(stats, positions)
+    if existing is not None:
+        updated = pd.concat([existing[~existing['SEASON'].isin(seasons)], updated],
+                            ignore_index=True, sort=False)
+    updated = updated.sort_values(['SEASON', 'BBREF_ID']).reset_index(drop=True)
+    updated.to_csv(path, index=False)
+    return updated
+
+if __name__=='__main__':
+    # Read in player statistics and measurements, and positional estimates
+    stats = load_percentile_inputs('../../data/nba/basketball_reference/player_data/combined/bbref_player_data.csv',
+                                   '../../data/nba/basketball_reference/player_data/measurements/player_measurements.csv')
+    positions = pd.read_csv('../../data/nba/basketball_reference/player_data/positional_estimates/player_position_estimates.csv')
+
+    # Add percentiles for new seasons and recompute the latest season
+    update_percentile_file('../../data/nba/basketball_reference/player_data/percentile/nba_percentile_all.csv',
+                           stats)
+    update_percentile_file('../../data/nba/basketball_reference/player_data/percentile/nba_percentile_position.csv',
+                           stats, positions)
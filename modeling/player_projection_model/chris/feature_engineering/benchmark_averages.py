@@ -0,0 +1,50 @@
+# Project: Feature Engineering Benchmark
+# Description: Time the three-season average engine (rolling_averages) against
+# the previous column-by-column groupby/rolling/apply approach on the complete
+# feature matrix, and check both return the same values.
+# Data Sources: Basketball-Reference and ESPN
+# Last Updated: 10/19/2026
+
+import time
+import numpy as np
+import pandas as pd
+from feature_engineering import rolling_averages
+
+def legacy_weighted_average(df, col):
+    """
+    Column-at-a-time three-season weighted average with a Python function
+    applied to every rolling window. Kept only as the benchmark baseline.
+
+    Args:
+        df: pandas DataFrame with statistics at the player/season level
+        col: column on with which to calculate the three-season weighted average.
+
+    Returns:
+        Series of three-season weighted averages on the same index as df
+    """
+    wts3 = np.array([1, 2, 3])
+    wts2 = np.array([1, 2])
+    three_season_avg = df.groupby('BBREF_ID')[col].transform(lambda x: x.rolling(window=3).apply(lambda w: (wts3*w).sum()/6, raw=True).round(3))
+    two_season_avg = df.groupby('BBREF_ID')[col].transform(lambda x: x.rolling(window=2).apply(lambda w: (wts2*w).sum()/3, raw=True).round(3))
+    return three_season_avg.fillna(two_season_avg).fillna(df[col])
+
+if __name__=='__main__':
+    # Read in the complete feature matrix and benchmark every metric that has
+    # a three-season weighted average
+    complete_feature_matrix = pd.read_csv('../feature_selection/featurized_inputs/complete_feature_matrix.csv')
+    metric_cols = [col for col in complete_feature_matrix.columns
+                   if '{}_3WAVG'.format(col) in complete_feature_matrix.columns]
+
+    start = time.time()
+    legacy = pd.DataFrame({'{}_3WAVG'.format(col): legacy_weighted_average(complete_feature_matrix, col)
+                           for col in metric_cols})
+    legacy_time = time.time() - start
+
+    start = time.time()
+    vectorized = rolling_averages(complete_feature_matrix, metric_cols, weighted=True)
+    vectorized_time = time.time() - start
+
+    print('Rows: {0}, Metrics: {1}'.format(len(complete_feature_matrix), len(metric_cols)))
+    print('Column-by-column rolling apply: {0:.2f}s'.format(legacy_time))
+    print('rolling_averages: {0:.3f}s ({1:.0f}x faster)'.format(vectorized_time, legacy_time / vectorized_time))
+    print('Max absolute difference: {0}'.format(np.nanmax(np.abs(legacy.values - vectorized.values))))
@@ -0,0 +1,206 @@
+# Project: Feature Engineering DAG
+# Description: Rebuild the complete feature matrix incrementally. Each feature
+# block declares the data files and upstream blocks it is built from, and is
+# only recomputed when the hash of one of those inputs, or of the code that
+# builds it, changes. Every other block is read back from the cache.
+# Data Sources: Basketball-Reference and ESPN
+# Last Updated: 10/19/2026
+
+import os
+import sys
+import json
+import hashlib
+import pandas as pd
+import feature_engineering
+from feature_engineering import (DATA_SOURCE_PATHS, load_data_source, join_data_sources,
+                                 metric_averages, refresh_targets, save_feature_matrix)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', '..',
+                             'data_scraping', 'basketball_reference'))
+import percentiles
+from percentiles import load_percentile_inputs, update_percentile_file
+import player_seasons
+
+# Feature blocks: data files (keys of DATA_SOURCE_PATHS) and upstream blocks
+# each one is built from. The percentiles are derived from the box score,
+# measurements (and positions), and rewritten whenever those change.
+FEATURE_BLOCKS = {'targets': {'files': ['targets'], 'blocks': []},
+                  'bbref_box_score': {'files': ['bbref_box_score'], 'blocks': []},
+                  'bbref_league_percentile': {'files': ['bbref_box_score', 'bbref_measurements'],
+                                              'blocks': []},
+                  'bbref_position_percentile': {'files': ['bbref_box_score', 'bbref_measurements',
+                                                          'bbref_position_estimates'],
+                                                'blocks': []},
+                  'bbref_measurements': {'files': ['bbref_measurements'], 'blocks': []},
+                  'bbref_salary': {'files': ['bbref_salary'], 'blocks': []},
+                  'bbref_position_estimates': {'files': ['bbref_position_estimates'], 'blocks': []},
+                  'espn_advance': {'files': ['espn_advance', 'player_table'], 'blocks': []},
+                  # Joined and imputed single-season features
+                  'model_input': {'files': [], 'blocks': ['targets', 'bbref_box_score',
+                                                          'bbref_league_percentile',
+                                                          'bbref_position_percentile',
+                                                          'bbref_measurements', 'bbref_salary',
+                                                          'bbref_position_estimates',
+                                                          'espn_advance']},
+                  # Three-season weighted averages (3WAVG/3MWAVG)
+                  'averages': {'files': [], 'blocks': ['model_input']},
+                  'feature_matrix': {'files': [], 'blocks': ['model_input', 'averages']}}
+
+# Modules whose code builds the blocks. Their source is part of every block's
+# key, so a change to the code rebuilds the blocks as a change to the data does
+BLOCK_MODULES = {block: [feature_engineering, player_seasons] for block in FEATURE_BLOCKS}
+BLOCK_MODULES['bbref_league_percentile'] = [feature_engineering, player_seasons, percentiles]
+BLOCK_MODULES['bbref_position_percentile'] = [feature_engineering, player_seasons, percentiles]
+
+def code_hash(modules):
+    """
+    md5 of the source of this module and the given modules.
+
+    Args:
+        modules (list): Modules that build a block
+
+    Returns:
+        md5 (str): Hash of their source files
+    """
+    md5 = hashlib.md5()
+    for module in [sys.modules[__name__]] + list(modules):
+        with open(os.path.splitext(module.__file__)[0] + '.py', 'rb') as f:
+            md5.update(f.read())
+    return md5.hexdigest()
+
+def file_hash(path, previous=None):
+    """
+    md5 of a file's contents. The file is only read again if its size or
+    modification time differ from the previous entry.
+
+    Args:
+        path (str): Path of the file
+        previous (dict): Previous entry from the manifest (Default=None)
+
+    Returns:
+        entry (dict): md5, size and mtime of the file
+    """
+    stat = os.stat(path)
+    if previous is not None and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime:
+        return previous
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            md5.update(chunk)
+    return {'md5': md5.hexdigest(), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+def build_block(block, inputs, data_source_list, weighted, reliability_weight):
+    """
+    Builds one feature block from its upstream blocks.
+
+    Args:
+        block (str): Name of the block in FEATURE_BLOCKS
+        inputs (dict): Upstream block name to DataFrame
+        data_source_list (list): Data sources in the feature matrix
+        weighted (boolean): Whether to weight the statistical average
+        reliability_weight (str): 'MP', 'POSS' or None
+
+    Returns:
+        df (pandas DataFrame): The block
+    """
+    if block == 'model_input':
+        data_sources = {source: inputs[source] for source in data_source_list}
+        return join_data_sources(inputs['targets'], data_sources, inputs['bbref_position_estimates'])
+    if block == 'averages':
+        return metric_averages(inputs['model_input'], weighted=weighted,
+                               reliability_weight=reliability_weight)
+    if block == 'feature_matrix':
+        return pd.concat([inputs['model_input'], inputs['averages']], axis=1)
+    if block in ['bbref_league_percentile', 'bbref_position_percentile']:
+        # Recompute every season, as any of them may have been revised
+        stats = load_percentile_inputs(DATA_SOURCE_PATHS['bbref_box_score'],
+                                       DATA_SOURCE_PATHS['bbref_measurements'])
+        positions = None
+        if block == 'bbref_position_percentile':
+            positions = pd.read_csv(DATA_SOURCE_PATHS['bbref_position_estimates'])
+        path = DATA_SOURCE_PATHS[block]
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        update_percentile_file(path, stats, positions, seasons=set(stats['SEASON']))
+    return load_data_source(block)
+
+def build_feature_matrix(data_source_list, cache_dir, weighted=True, reliability_weight='MP'):
+    """
+    Builds the complete feature matrix (see create_feature_matrix), rebuilding
+    only the blocks whose input files, upstream blocks or code changed since
+    the last build. Block keys and file hashes are kept in cache_dir/manifest.json
+    and the blocks as pickles in cache_dir.
+
+    Args:
+        data_source_list (list): Data sources to join onto the target variable
+        cache_dir (str): Directory for the cached blocks
+        weighted (boolean): Whether to weight the statistical average (Default=True)
+        reliability_weight (str): 'MP' or 'POSS' to add reliability-weighted
+        averages, or None (Default='MP')
+
+    Returns:
+        complete_feature_matrix (pandas DataFrame): The feature matrix
+        rebuilt (list): Blocks that were recomputed
+    """
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    # Rebuild the targets before hashing them if their sources changed
+    refresh_targets()
+    manifest_path = os.path.join(cache_dir, 'manifest.json')
+    manifest = {'files': {}, 'blocks': {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    # Positional estimates are always needed to impute
+    sources = set(data_source_list) | {'targets', 'bbref_position_estimates'}
+    params = {'model_input': sorted(data_source_list),
+              'averages': [weighted, reliability_weight]}
+    files = {}
+    keys = {}
+    blocks = {}
+    rebuilt = []
+    # Blocks in dependency order
+    for block in [block for block in FEATURE_BLOCKS if block in sources] + ['model_input', 'averages', 'feature_matrix']:
+        for name in FEATURE_BLOCKS[block]['files']:
+            files[name] = file_hash(DATA_SOURCE_PATHS[name], manifest['files'].get(name))
+        key_parts = [block, params.get(block), code_hash(BLOCK_MODULES[block])] + \
+                    [files[name]['md5'] for name in FEATURE_BLOCKS[block]['files']] + \
+                    [keys.get(upstream) for upstream in FEATURE_BLOCKS[block]['blocks']]
+        keys[block] = hashlib.md5(json.dumps(key_parts).encode()).hexdigest()
+
+        block_path = os.path.join(cache_dir, '{}.pkl'.format(block))
+        if manifest['blocks'].get(block) == keys[block] and os.path.exists(block_path):
+            blocks[block] = None
+            continue
+        inputs = {upstream: blocks[upstream] if blocks[upstream] is not None
+                  else pd.read_pickle(os.path.join(cache_dir, '{}.pkl'.format(upstream)))
+                  for upstream in FEATURE_BLOCKS[block]['blocks'] if upstream in keys}
+        blocks[block] = build_block(block, inputs, data_source_list, weighted, reliability_weight)
+        blocks[block].to_pickle(block_path)
+        rebuilt.append(block)
+
+    manifest['files'].update(files)
+    manifest['blocks'].update(keys)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    complete_feature_matrix = blocks['feature_matrix']
+    if complete_feature_matrix is None:
+        complete_feature_matrix = pd.read_pickle(os.path.join(cache_dir, 'feature_matrix.pkl'))
+    return complete_feature_matrix, rebuilt
+
+if __name__=='__main__':
+    # Rebuild the feature blocks whose data changed and write out the complete
+    # feature matrix
+    complete_feature_matrix, rebuilt = build_feature_matrix(['bbref_box_score',
+                                                             'bbref_measurements',
+                                                             'bbref_league_percentile',
+                                                             'bbref_position_percentile',
+                                                             'bbref_position_estimates',
+                                                             'bbref_salary',
+                                                             'espn_advance'],
+                                                            '../feature_selection/featurized_inputs/feature_cache')
+    print('Rebuilt blocks: {}'.format(', '.join(rebuilt) if rebuilt else 'none'))
+    matrix_path = '../feature_selection/featurized_inputs/complete_feature_matrix.csv'
+    if rebuilt or not os.path.exists(matrix_path):
+        save_feature_matrix(complete_feature_matrix, matrix_path)
@@ -4,13 +4,591 @@
 # Data Sources: Basketball-Reference and ESPN
 # Last Updated: 7/31/2019
 
+import os
+import sys
 import numpy as np
 import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'player_seasons'))
+from player_seasons import collapse_traded_seasons, load_player_seasons
+from player_panel import PlayerPanel
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'target_metric'))
+from modeling_targets import update_modeling_targets
 
 import warnings
 from pandas.core.common import SettingWithCopyWarning
 warnings.filterwarnings(action='ignore', category=SettingWithCopyWarning)
 
+# Shooting fields in which null values will be imputed with
+# zero as they are typically a result of zero field goal attempts.
+SHOOTING_FIELDS = ['FG', 'FGA', 'FG%' ,'2P', '2PA', '2P%',
+                   '3P', '3PA', '3P%', 'FT', 'FTA', 'FT%',
+                   'PER100_FG', 'PER100_FGA',
+                   'PER100_FG%', 'PER100_2P', 'PER100_2PA',
+                   'PER100_2P%', 'PER100_3P', 'PER100_3PA',
+                   'PER100_3P%', 'PER100_FT', 'PER100_FTA',
+                   'PER100_FT%', 'eFG%', 'TS%', '3PA_RATE',
+                   'FT_RATE', 'fg_percentile_all', 'fga_percentile_all',
+                   'fg_percent_percentile_all', 'three_point_made_percentile_all',
+                   'three_point_attempt_percentile_all',
+                   'three_point_percent_percentile_all',
+                   'two_point_made_percentile_all',
+                   'two_point_attempt_percentile_all',
+                   'two_point_percent_percentile_all',
+                   'efg_percent_percentile_all',
+                   'true_shooting_percent_percentile_all',
+                   'free_throw_made_percentile_all',
+                   'free_throw_attempt_percentile_all',
+                   'free_throw_percent_percentile_all',
+                   'fg_made_per100_percentile_all',
+                   'fg_attempted_per100_percentile_all',
+                   'three_point_made_per100_percentile_all',
+                   'three_point_attempt_per100_percentile_all',
+                   'two_point_made_per100_percentile_all',
+                   'two_point_attempt_per100_percentile_all',
+                   'free_throw_made_per100_percentile_all',
+                   'free_throw_attempt_per100_percentile_all',
+                   'three_point_attempt_rate_percentile_all',
+                   'free_throw_rate_percentile_all',
+                   'fg_percentile_position',
+                   'fga_percentile_position',
+                   'fg_percent_percentile_position',
+                   'three_point_made_percentile_position',
+                   'three_point_attempt_percentile_position',
+                   'three_point_percent_percentile_position',
+                   'two_point_made_percentile_position',
+                   'two_point_attempt_percentile_position',
+                   'two_point_percent_percentile_position',
+                   'efg_percent_percentile_position',
+                   'true_shooting_percent_percentile_position',
+                   'free_throw_made_percentile_position',
+                   'free_throw_attempt_percentile_position',
+                   'free_throw_percent_percentile_position',
+                   'fg_made_per100_percentile_position',
+                   'fg_attempted_per100_percentile_position',
+                   'three_point_made_per100_percentile_position',
+                   'three_point_attempt_per100_percentile_position',
+                   'two_point_made_per100_percentile_position',
+                   'two_point_attempt_per100_percentile_position',
+                   'free_throw_made_per100_percentile_position',
+                   'free_throw_attempt_per100_percentile_position',
+                   'three_point_attempt_rate_percentile_position',
+                   'free_throw_rate_percentile_position']
+
+# Non-shooting fields in which nulls will be imputed with
+# the mean of the season/advance_position_cluster grouping
+BOX_SCORE_FIELDS = ['AST',
+                    'AST%',
+                    'BLK',
+                    'BLK%',
+                    'BPM',
+                    'DBPM',
+                    'DRB',
+                    'DRB%',
+                    'DWS',
+                    'G',
+                    'GS',
+                    'IMPACT_PLAY_RATE',
+                    'MP',
+                    'OBPM',
+                    'ORB',
+                    'ORB%',
+                    'OWS',
+                    'PER',
+                    'PER100_AST',
+                    'PER100_BLK',
+                    'PER100_DRB',
+                    'PER100_DRtg',
+                    'PER100_ORB',
+                    'PER100_ORtg',
+                    'PER100_PF',
+                    'PER100_PTS',
+                    'PER100_STL',
+                    'PER100_TOV',
+                    'PER100_TRB',
+                    'PF',
+                    'PSA',
+                    'PTS',
+                    'STL',
+                    'STL%',
+                    'TOV',
+                    'TOV%',
+                    'TRB',
+                    'TRB%',
+                    'USG%',
+                    'VORP',
+                    'WS',
+                    'WS/48',
+                    'age',
+                    'age_percentile_all',
+                    'age_percentile_position',
+                    'ast_percent_percentile_all',
+                    'ast_percent_percentile_position',
+                    'ast_percentile_all',
+                    'ast_percentile_position',
+                    'blk_percent_percentile_all',
+                    'blk_percent_percentile_position',
+                    'blk_percentile_all',
+                    'blk_percentile_position',
+                    'bpm_percentile_all',
+                    'bpm_percentile_position',
+                    'def_bpm_percentile_all',
+                    'def_bpm_percentile_position',
+                    'def_win_shares_percentile_all',
+                    'def_win_shares_percentile_position',
+                    'drb_percent_percentile_all',
+                    'drb_percent_percentile_position',
+                    'drb_percentile_all',
+                    'drb_percentile_position',
+                    'experience',
+                    'foul_percentile_all',
+                    'foul_percentile_position',
+                    'games_player_percentile_all',
+                    'games_player_percentile_position',
+                    'games_started_percentile_all',
+                    'games_started_percentile_position',
+                    'height',
+                    'height_percentile_all',
+                    'height_percentile_position',
+                    'minutes_c',
+                    'minutes_percentile_all',
+                    'minutes_percentile_position',
+                    'minutes_pf',
+                    'minutes_pg',
+                    'minutes_sf',
+                    'minutes_sg',
+                    'off_bpm_percentile_all',
+                    'off_bpm_percentile_position',
+                    'off_court_plus_minus',
+                    'off_win_shares_percentile_all',
+                    'off_win_shares_percentile_position',
+                    'on_court_plus_minus',
+                    'orb_percent_percentile_all',
+                    'orb_percent_percentile_position',
+                    'oreb_percentile_all',
+                    'oreb_percentile_position',
+                    'points_percentile_all',
+                    'points_percentile_position',
+                    'position_numeric',
+                    'prop_c',
+                    'prop_pf',
+                    'prop_pg',
+                    'prop_sf',
+                    'prop_sg',
+                    'salary',
+                    'salary_prop_cap',
+                    'stl_percent_percentile_all',
+                    'stl_percent_percentile_position',
+                    'stl_percentile_all',
+                    'stl_percentile_position',
+                    'total_percentile_all',
+                    'total_percentile_position',
+                    'tov_percent_percentile_all',
+                    'tov_percent_percentile_position',
+                    'trb_percent_percentile_all',
+                    'trb_percent_percentile_position',
+                    'turnover_percentile_all',
+                    'turnover_percentile_position',
+                    'usg_percent_percentile_all',
+                    'usg_percent_percentile_position',
+                    'vorp_percentile_all',
+                    'vorp_percentile_position',
+                    'weight',
+                    'weight_percentile_all',
+                    'weight_percentile_position',
+                    'win_shares_percentile_all',
+                    'win_shares_percentile_position',
+                    'win_sharres_per_48_percentile_all',
+                    'win_sharres_per_48_percentile_position']
+
+# Comprehensive list of metrics to transform from season-level to
+# either unweighted or weighted three-season averages
+METRIC_FIELDS = ['G',
+                'GS',
+                'MP',
+                'FG',
+                'FGA',
+                'FG%',
+                '3P',
+                '3PA',
+                '3P%',
+                '2P',
+                '2PA',
+                '2P%',
+                'EFG%',
+                'FT',
+                'FTA',
+                'FT%',
+                'ORB',
+                'DRB',
+                'TRB',
+                'AST',
+                'STL',
+                'BLK',
+                'TOV',
+                'PF',
+                'PTS',
+                'PER100_FG',
+                'PER100_FGA',
+                'PER100_FG%',
+                'PER100_3P',
+                'PER100_3PA',
+                'PER100_3P%',
+                'PER100_2P',
+                'PER100_2PA',
+                'PER100_2P%',
+                'PER100_FT',
+                'PER100_FTA',
+                'PER100_FT%',
+                'PER100_ORB',
+                'PER100_DRB',
+                'PER100_TRB',
+                'PER100_AST',
+                'PER100_STL',
+                'PER100_BLK',
+                'PER100_TOV',
+                'PER100_PF',
+                'PER100_PTS',
+                'PER100_ORTG',
+                'PER100_DRTG',
+                'PER',
+                'TS%',
+                '3PA_RATE',
+                'FT_RATE',
+                'ORB%',
+                'DRB%',
+                'TRB%',
+                'AST%',
+                'STL%',
+                'BLK%',
+                'TOV%',
+                'USG%',
+                'OWS',
+                'DWS',
+                'WS',
+                'WS/48',
+                'OBPM',
+                'DBPM',
+                'BPM',
+                'VORP',
+                'GAMES_PLAYER_PERCENTILE_ALL',
+                'GAMES_STARTED_PERCENTILE_ALL',
+                'MINUTES_PERCENTILE_ALL',
+                'FG_PERCENTILE_ALL',
+                'FGA_PERCENTILE_ALL',
+                'FG_PERCENT_PERCENTILE_ALL',
+                'THREE_POINT_MADE_PERCENTILE_ALL',
+                'THREE_POINT_ATTEMPT_PERCENTILE_ALL',
+                'THREE_POINT_PERCENT_PERCENTILE_ALL',
+                'TWO_POINT_MADE_PERCENTILE_ALL',
+                'TWO_POINT_ATTEMPT_PERCENTILE_ALL',
+                'TWO_POINT_PERCENT_PERCENTILE_ALL',
+                'EFG_PERCENT_PERCENTILE_ALL',
+                'TRUE_SHOOTING_PERCENT_PERCENTILE_ALL',
+                'FREE_THROW_MADE_PERCENTILE_ALL',
+                'FREE_THROW_ATTEMPT_PERCENTILE_ALL',
+                'FREE_THROW_PERCENT_PERCENTILE_ALL',
+                'OREB_PERCENTILE_ALL',
+                'DRB_PERCENTILE_ALL',
+                'TOTAL_PERCENTILE_ALL',
+                'AST_PERCENTILE_ALL',
+                'STL_PERCENTILE_ALL',
+                'BLK_PERCENTILE_ALL',
+                'TURNOVER_PERCENTILE_ALL',
+                'FOUL_PERCENTILE_ALL',
+                'POINTS_PERCENTILE_ALL',
+                'FG_MADE_PER100_PERCENTILE_ALL',
+                'FG_ATTEMPTED_PER100_PERCENTILE_ALL',
+                'THREE_POINT_MADE_PER100_PERCENTILE_ALL',
+                'THREE_POINT_ATTEMPT_PER100_PERCENTILE_ALL',
+                'TWO_POINT_MADE_PER100_PERCENTILE_ALL',
+                'TWO_POINT_ATTEMPT_PER100_PERCENTILE_ALL',
+                'FREE_THROW_MADE_PER100_PERCENTILE_ALL',
+                'FREE_THROW_ATTEMPT_PER100_PERCENTILE_ALL',
+                'THREE_POINT_ATTEMPT_RATE_PERCENTILE_ALL',
+                'FREE_THROW_RATE_PERCENTILE_ALL',
+                'ORB_PERCENT_PERCENTILE_ALL',
+                'DRB_PERCENT_PERCENTILE_ALL',
+                'TRB_PERCENT_PERCENTILE_ALL',
+                'AST_PERCENT_PERCENTILE_ALL',
+                'STL_PERCENT_PERCENTILE_ALL',
+                'BLK_PERCENT_PERCENTILE_ALL',
+                'TOV_PERCENT_PERCENTILE_ALL',
+                'USG_PERCENT_PERCENTILE_ALL',
+                'OFF_WIN_SHARES_PERCENTILE_ALL',
+                'DEF_WIN_SHARES_PERCENTILE_ALL',
+                'WIN_SHARES_PERCENTILE_ALL',
+                'WIN_SHARRES_PER_48_PERCENTILE_ALL',
+                'OFF_BPM_PERCENTILE_ALL',
+                'DEF_BPM_PERCENTILE_ALL',
+                'BPM_PERCENTILE_ALL',
+                'VORP_PERCENTILE_ALL',
+                'GAMES_PLAYER_PERCENTILE_POSITION',
+                'GAMES_STARTED_PERCENTILE_POSITION',
+                'MINUTES_PERCENTILE_POSITION',
+                'FG_PERCENTILE_POSITION',
+                'FGA_PERCENTILE_POSITION',
+                'FG_PERCENT_PERCENTILE_POSITION',
+                'THREE_POINT_MADE_PERCENTILE_POSITION',
+                'THREE_POINT_ATTEMPT_PERCENTILE_POSITION',
+                'THREE_POINT_PERCENT_PERCENTILE_POSITION',
+                'TWO_POINT_MADE_PERCENTILE_POSITION',
+                'TWO_POINT_ATTEMPT_PERCENTILE_POSITION',
+                'TWO_POINT_PERCENT_PERCENTILE_POSITION',
+                'EFG_PERCENT_PERCENTILE_POSITION',
+                'TRUE_SHOOTING_PERCENT_PERCENTILE_POSITION',
+                'FREE_THROW_MADE_PERCENTILE_POSITION',
+                'FREE_THROW_ATTEMPT_PERCENTILE_POSITION',
+                'FREE_THROW_PERCENT_PERCENTILE_POSITION',
+                'OREB_PERCENTILE_POSITION',
+                'DRB_PERCENTILE_POSITION',
+                'TOTAL_PERCENTILE_POSITION',
+                'AST_PERCENTILE_POSITION',
+                'STL_PERCENTILE_POSITION',
+                'BLK_PERCENTILE_POSITION',
+                'TURNOVER_PERCENTILE_POSITION',
+                'FOUL_PERCENTILE_POSITION',
+                'POINTS_PERCENTILE_POSITION',
+                'FG_MADE_PER100_PERCENTILE_POSITION',
+                'FG_ATTEMPTED_PER100_PERCENTILE_POSITION',
+                'THREE_POINT_MADE_PER100_PERCENTILE_POSITION',
+                'THREE_POINT_ATTEMPT_PER100_PERCENTILE_POSITION',
+                'TWO_POINT_MADE_PER100_PERCENTILE_POSITION',
+                'TWO_POINT_ATTEMPT_PER100_PERCENTILE_POSITION',
+                'FREE_THROW_MADE_PER100_PERCENTILE_POSITION',
+                'FREE_THROW_ATTEMPT_PER100_PERCENTILE_POSITION',
+                'THREE_POINT_ATTEMPT_RATE_PERCENTILE_POSITION',
+                'FREE_THROW_RATE_PERCENTILE_POSITION',
+                'ORB_PERCENT_PERCENTILE_POSITION',
+                'DRB_PERCENT_PERCENTILE_POSITION',
+                'TRB_PERCENT_PERCENTILE_POSITION',
+                'AST_PERCENT_PERCENTILE_POSITION',
+                'STL_PERCENT_PERCENTILE_POSITION',
+                'BLK_PERCENT_PERCENTILE_POSITION',
+                'TOV_PERCENT_PERCENTILE_POSITION',
+                'USG_PERCENT_PERCENTILE_POSITION',
+                'OFF_WIN_SHARES_PERCENTILE_POSITION',
+                'DEF_WIN_SHARES_PERCENTILE_POSITION',
+                'WIN_SHARES_PERCENTILE_POSITION',
+                'WIN_SHARRES_PER_48_PERCENTILE_POSITION',
+                'OFF_BPM_PERCENTILE_POSITION',
+                'DEF_BPM_PERCENTILE_POSITION',
+                'BPM_PERCENTILE_POSITION',
+                'VORP_PERCENTILE_POSITION',
+                'SALARY',
+                'SALARY_PROP_CAP',
+                'GAMES_PLAYED',
+                'MINUTES_PLAYED',
+                'ON_COURT_PLUS_MINUS',
+                'OFF_COURT_PLUS_MINUS',
+                'PROP_PG',
+                'PROP_SG',
+                'PROP_SF',
+                'PROP_PF',
+                'PROP_C',
+                'MINUTES_PG',
+                'MINUTES_SG',
+                'MINUTES_SF',
+                'MINUTES_PF',
+                'MINUTES_C',
+                'POSITION_NUMERIC',
+                'ORPM',
+                'DRPM',
+                'RPM',
+                'WINS']
+
+def season_weights(window=3, kernel='linear', decay=0.5):
+    """
+    Weights given to each season in a window, ordered oldest to most recent.
+
+    Args:
+        window (int): Number of seasons in the window (Default=3)
+        kernel (str): 'linear' weights seasons 1, 2, ..., window, 'uniform'
+        weights every season equally, and 'exponential' multiplies the weight
+        by `decay` for every season back from the most recent (Default='linear')
+        decay (float): Decay rate for the exponential kernel (Default=0.5)
+
+    Returns:
+        weights (numpy array): Un-normalized weights of length `window`
+    """
+    if kernel == 'linear':
+        return np.arange(1, window + 1, dtype=np.float64)
+    if kernel == 'uniform':
+        return np.ones(window)
+    if kernel == 'exponential':
+        return decay ** np.arange(window - 1, -1, -1, dtype=np.float64)
+    raise ValueError("Unknown kernel '{}'".format(kernel))
+
+def season_lags(df, cols, window=3, weight_col=None):
+    """
+    Line up each player-season with that player's previous seasons. Rows are
+    sorted by player (keeping each player's season order) into a PlayerPanel,
+    and the season k years back is the panel shifted down k rows within each
+    player.
+
+    Args:
+        df: pandas DataFrame with statistics at the player/season level with
+        partial seasons resulting from trades removed.
+        cols (list): statistics to line up.
+        window (int): Number of seasons to line up, including the current one.
+        weight_col (str): Optional column (e.g. 'MP') to line up alongside the
+        statistics for minutes-weighted averages.
+
+    Returns:
+        order (numpy array): Positions of the sorted rows in df
+        lags (numpy array): window x rows x columns array, lags[k] holding the
+        statistics from k seasons back (NaN if the player has no such season)
+        weight_lags (numpy array): window x rows x 1 array of weight_col values,
+        or None
+    """
+    # Players keep their seasons in their original order
+    panel = PlayerPanel(df, 'BBREF_ID', cols + ([weight_col] if weight_col is not None else []))
+    order = panel.order
+    lags = np.stack([panel.shift(k) for k in range(window)])
+
+    if weight_col is not None:
+        return order, lags[:, :, :-1], lags[:, :, -1:]
+    return order, lags, None
+
+def apply_kernel(order, lags, weight_lags=None, kernel='linear', decay=0.5):
+    """
+    Kernel-weighted average over the output of season_lags. Each row gets the
+    average over the longest window (up to the full window) in which none of
+    the player's seasons are null, with the kernel truncated to that length.
+    The result is rounded to three decimals, except where only the current
+    season is available.
+
+    Args:
+        order, lags, weight_lags: Output of season_lags
+        kernel (str): Kernel passed to season_weights (Default='linear')
+        decay (float): Decay rate for the exponential kernel (Default=0.5)
+
+    Returns:
+        averages (numpy array): rows x columns array in the original row order
+    """
+    window = lags.shape[0]
+    averages = lags[0].copy()
+    for length in range(2, window + 1):
+        weights = season_weights(length, kernel, decay)
+        total = 0
+        norm = weights.sum() if weight_lags is None else 0
+        # Add the seasons oldest first
+        for j, weight in enumerate(weights):
+            lag = length - 1 - j
+            if weight_lags is not None:
+                weight = weight * weight_lags[lag]
+                norm = norm + weight
+            total = total + weight * lags[lag]
+        length_avg = np.round(total / norm, 3)
+        averages = np.where(np.isnan(length_avg), averages, length_avg)
+
+    # Return rows to the original order of df
+    result = np.empty_like(averages)
+    result[order] = averages
+    return result
+
+def average_suffix(window=3, kernel='linear', weight_col=None):
+    """
+    Column suffix for a kernel average: '_3WAVG' for the linear kernel,
+    '_3AVG' for uniform and '_3EWAVG' for exponential, with an 'M' in front
+    for averages weighted by minutes or possessions (e.g. '_3MWAVG').
+    """
+    suffix = {'linear': 'WAVG', 'uniform': 'AVG', 'exponential': 'EWAVG'}[kernel]
+    if weight_col is not None:
+        suffix = 'M' + suffix
+    return '_{0}{1}'.format(window, suffix)
+
+def kernel_average(df, cols, window=3, kernel='linear', decay=0.5, weight_col=None):
+    """
+    Calculate kernel-weighted averages of a player's last `window` seasons for
+    many statistics at once. If a player has played fewer seasons than the
+    window then the average is taken over the seasons available.
+
+    The linear kernel over three seasons gives (3*x_t + 2*x_t-1 + x_t-2)/6,
+    falling back to (2*x_t + x_t-1)/3. With `weight_col` each season's kernel
+    weight is multiplied by that season's value of `weight_col`, so with 'MP'
+    seasons count in proportion to the minutes played in them.
+
+    Args:
+        df: pandas DataFrame with statistics at the player/season level with
+        partial seasons resulting from trades removed.
+        cols (list): columns with which to calculate the average.
+        window (int): Number of seasons to average over (Default=3)
+        kernel (str): 'linear', 'uniform' or 'exponential' (Default='linear')
+        decay (float): Decay rate for the exponential kernel (Default=0.5)
+        weight_col (str): Optional column to weight seasons by (Default=None)
+
+    Returns:
+        averages: pandas DataFrame on the same index as df with one column per
+        statistic, named with the suffix from average_suffix.
+    """
+    order, lags, weight_lags = season_lags(df, cols, window, weight_col)
+    averages = apply_kernel(order, lags, weight_lags, kernel, decay)
+    suffix = average_suffix(window, kernel, weight_col)
+    return pd.DataFrame(averages, index=df.index, columns=[col + suffix for col in cols])
+
+def estimate_possessions(df):
+    """
+    Estimate the possessions a player was on the court for in a season from
+    season totals and their per-100 possession rates (e.g. 100*PTS/PER100_PTS),
+    trying points, then field goal attempts, rebounds and fouls for players
+    without any of the earlier stats.
+
+    Args:
+        df: pandas DataFrame with Basketball-Reference totals and per-100
+        possession statistics at the player/season level
+
+    Returns:
+        possessions (pandas Series): Estimated possessions on the same index as df
+    """
+    possessions = pd.Series(np.nan, index=df.index)
+    for stat in ['PTS', 'FGA', 'TRB', 'PF']:
+        estimate = 100 * df[stat] / df['PER100_{}'.format(stat)].where(df['PER100_{}'.format(stat)] > 0)
+        possessions = possessions.fillna(estimate)
+    # Players who never got on the court
+    return possessions.mask(df['MP'] == 0, 0)
+
+def kernel_sweep(df, cols, decays, window=3, weight_col=None):
+    """
+    Exponential kernel averages for several decay rates, lining up the
+    player-seasons only once.
+
+    Args:
+        df: pandas DataFrame with statistics at the player/season level with
+        partial seasons resulting from trades removed.
+        cols (list): columns with which to calculate the average.
+        decays (list): Decay rates to calculate the averages for.
+        window (int): Number of seasons to average over (Default=3)
+        weight_col (str): Optional column to weight seasons by (Default=None)
+
+    Returns:
+        sweep (dict): Decay rate to pandas DataFrame of averages (see
+        kernel_average)
+    """
+    order, lags, weight_lags = season_lags(df, cols, window, weight_col)
+    suffix = average_suffix(window, 'exponential', weight_col)
+    columns = [col + suffix for col in cols]
+    return {decay: pd.DataFrame(apply_kernel(order, lags, weight_lags, 'exponential', decay),
+                                index=df.index, columns=columns)
+            for decay in decays}
+
+def rolling_averages(df, cols, weighted=True):
+    """
+    Calculate the three-season average of many statistics at once, either
+    weighted (linear kernel) or unweighted (uniform kernel).
+
+    Args:
+        df: pandas DataFrame with statistics at the player/season level with
+        partial seasons resulting from trades removed.
+        cols (list): columns with which to calculate the three-season average.
+        weighted (boolean): Whether to weight the statistical average (Default=True)
+
+    Returns:
+        averages: pandas DataFrame on the same index as df with one column per
+        statistic, named 'column_3WAVG' if weighted and 'column_3AVG' if not.
+    """
+    return kernel_average(df, cols, window=3, kernel='linear' if weighted else 'uniform')
+
 def unweighted_average(df, col):
     """
     Calculate average of previous three seasons for a given statistic. If a player
@@ -26,28 +604,9 @@ def unweighted_average(df, col):
         df: Original pandas Dataframe with three-season average added as new
         column with the naming convention 'column_3AVG'
     """
-    df['3_season_avg'] = df.groupby('BBREF_ID')[col].apply(lambda x: x.rolling(window=3).mean().round(3))
-    df['2_season_avg'] = df.groupby('BBREF_ID')[col].apply(lambda x: x.rolling(window=2).mean().round(3))
-    df['{}_3AVG'.format(col)] = df['3_season_avg'].fillna(df['2_season_avg']).fillna(df[col])
-    df.drop(['3_season_avg', '2_season_avg'], axis=1, inplace=True)
+    df['{}_3AVG'.format(col)] = rolling_averages(df, [col], weighted=False).iloc[:, 0]
     return df
 
-def weight_2seasons(w):
-    """
-    Helper function to calculate weighted average for previous two seasons of a statistic.
-    """
-    def g(x):
-        return (w*x).sum()/3
-    return g
-
-def weight_3season(w):
-    """
-    Helper function to calculate weighted average for previous three seasons of a statistic.
-    """
-    def g(x):
-        return (w*x).sum()/5
-    return g
-
 def weighted_average(df, col):
     """
     Calculate weighted average of previous three seasons for a given statistic.
@@ -63,14 +622,158 @@ def weighted_average(df, col):
         df: Original pandas Dataframe with three-season weighted average added
         as new column with the naming convention 'column_3WAVG'
     """
-    wts3 = np.array([1, 2, 3])
-    wts2 = np.array([1, 2])
-    df['3_season_avg'] = df.groupby('BBREF_ID')[col].apply(lambda x: x.rolling(window=3).apply(weight_3season(wts3), raw=True).round(3))
-    df['2_season_avg'] = df.groupby('BBREF_ID')[col].apply(lambda x: x.rolling(window=2).apply(weight_2seasons(wts2), raw=True).round(3))
-    df['{}_3WAVG'.format(col)] = df['3_season_avg'].fillna(df['2_season_avg']).fillna(df[col])
-    df.drop(['3_season_avg', '2_season_avg'], axis=1, inplace=True)
+    df['{}_3WAVG'.format(col)] = rolling_averages(df, [col], weighted=True).iloc[:, 0]
     return df
 
+# Data source paths, relative to this directory
+DATA_SOURCE_PATHS = {'targets': '../../../../data/nba/modeling_targets/modeling_targets.csv',
+                     'bbref_box_score': '../../../../data/nba/basketball_reference/player_data/combined/bbref_player_data.csv',
+                     'bbref_measurements': '../../../../data/nba/basketball_reference/player_data/measurements/player_measurements.csv',
+                     'bbref_league_percentile': '../../../../data/nba/basketball_reference/player_data/percentile/nba_percentile_all.csv',
+                     'bbref_position_percentile': '../../../../data/nba/basketball_reference/player_data/percentile/nba_percentile_position.csv',
+                     'bbref_position_estimates': '../../../../data/nba/basketball_reference/player_data/positional_estimates/player_position_estimates.csv',
+                     'bbref_salary': '../../../../data/nba/basketball_reference/player_data/salary/salary_info.csv',
+                     'espn_advance': '../../../../data/nba/espn/espn_nba_rpm.csv',
+                     'player_table': '../../../../data/player_ids/player_table.csv'}
+
+# Order in which data sources are joined onto the targets
+DATA_SOURCE_ORDER = ['bbref_box_score',
+                     'bbref_league_percentile',
+                     'bbref_position_percentile',
+                     'bbref_measurements',
+                     'bbref_salary',
+                     'bbref_position_estimates',
+                     'espn_advance']
+
+def refresh_targets(paths=DATA_SOURCE_PATHS):
+    """
+    Rebuilds the modeling targets (RPM/BPM blend and its leads) if the content
+    of the ESPN, Basketball-Reference or player id data changed since they
+    were last built.
+
+    Args:
+        paths (dict): Data source paths (Default=DATA_SOURCE_PATHS)
+    """
+    update_modeling_targets(paths['targets'], paths['espn_advance'],
+                            paths['bbref_box_score'], paths['player_table'])
+
+def load_data_source(data_source, paths=DATA_SOURCE_PATHS):
+    """
+    Reads in a single data source (or the targets) and reformats it to be
+    joined onto the targets.
+
+    Args:
+        data_source (str): 'targets' or one of the data sources listed in
+        create_model_input
+        paths (dict): Data source paths (Default=DATA_SOURCE_PATHS)
+
+    Returns:
+        df (pandas DataFrame): The data source with seasons as YYYY-YYYY
+    """
+    if data_source == 'targets':
+        # Read in Targets and reformat season to YYYY-YYYY
+        targets = pd.read_csv(paths['targets'])
+        targets['season'] = targets[targets['season'].notnull()].apply(lambda row: str(int(row['season'] - 1)) +  '-' +  str(int(row['season'])), axis=1)
+        return targets
+
+    if data_source == 'bbref_box_score':
+        # Read in Basketball-Reference Box-Score Data with partial seasons
+        # resulting from in-season trades removed (TOT only)
+        return load_player_seasons(paths['bbref_box_score'])
+
+    if data_source == 'bbref_salary':
+        # Read in Salary Data and Reformat Season to YYYY-YYYY
+        bbref_salary = pd.read_csv(paths['bbref_salary'])
+        bbref_salary['season'] = bbref_salary[bbref_salary['season'].notnull()].apply(lambda row: str(int(row['season'] - 1)) +  '-' +  str(int(row['season'])), axis=1)
+        return bbref_salary
+
+    if data_source == 'bbref_position_estimates':
+        # Read in Position Data and Reformat Season to YYYY-YYYY
+        bbref_position_estimates = pd.read_csv(paths['bbref_position_estimates'])
+        bbref_position_estimates['season'] = bbref_position_estimates.apply(lambda row: str(int(row['season'] - 1)) +  '-' +  str(int(row['season'])), axis=1)
+        return bbref_position_estimates
+
+    if data_source == 'espn_advance':
+        # Read in ESPN Advance Data
+        espn_advance = pd.read_csv(paths['espn_advance'])
+        # Average partial seasons resulting from in-season trades
+        espn_advance = collapse_traded_seasons(espn_advance, mode='aggregate',
+                                               keys=['name', 'pos', 'espn_link', 'season'],
+                                               team_col='team', agg_function='mean')
+        # Join bbref_id onto espn table to join onto other dataframes
+        player_table = pd.read_csv(paths['player_table'])
+        espn_advance['season'] = espn_advance.apply(lambda row: str(int(row['season'] - 1)) +  '-' +  str(int(row['season'])), axis=1)
+        return (pd.merge(espn_advance, player_table,
+                            how='left', on='espn_link')
+                            [['orpm', 'drpm', 'rpm', 'wins',
+                            'bbref_id', 'season']])
+
+    # League/Position Percentiles and Measurements are joined as they are read
+    return pd.read_csv(paths[data_source])
+
+def merge_data_sources(targets, data_sources, position_estimates):
+    """
+    Joins loaded data sources and `advanced_position_cluster` onto the
+    targets and drops duplicate and irrelevant fields, leaving nulls in place.
+
+    Args:
+        targets (pandas DataFrame): Targets from load_data_source
+        data_sources (dict): Data source name to DataFrame from load_data_source
+        position_estimates (pandas DataFrame): Positional estimates from
+        load_data_source, used to group players when imputing
+
+    Returns:
+        targets (pandas DataFrame): Data sources joined onto the targets
+    """
+    for data_source in [source for source in DATA_SOURCE_ORDER if source in data_sources]:
+        df = data_sources[data_source]
+        if data_source in ['bbref_box_score', 'bbref_league_percentile', 'bbref_position_percentile']:
+            targets = pd.merge(targets, df, how='left',
+                                            left_on=['bbref_id', 'season'],
+                                            right_on=['BBREF_ID', 'SEASON'],
+                                            suffixes=('', '_duplicate'))
+        elif data_source == 'bbref_measurements':
+            targets = pd.merge(targets, df, how='left',
+                                            on='bbref_id',
+                                            suffixes=('', '_duplicate'))
+        else:
+            targets = pd.merge(targets, df, how='left',
+                                            on=['bbref_id', 'season'],
+                                            suffixes=('', '_duplicate'))
+
+    # Drop duplicate fields
+    targets.drop([col for col in targets.columns if '_duplicate' in col],
+                    axis=1,
+                        inplace=True)
+    # Drop irrelivent and duplicate fields
+    targets.drop([col for col in ['team_flag', 'contract_type', 'league', 'BBREF_ID', 'SEASON', 'RANK', 'POSITION_MINUTES'] if col in targets.columns], axis=1, inplace=True)
+    return add_position_cluster(targets, position_estimates)
+
+def join_data_sources(targets, data_sources, position_estimates, imputer=None):
+    """
+    Joins loaded data sources onto the targets, drops duplicate and irrelevant
+    fields and imputes missing values.
+
+    Args:
+        targets (pandas DataFrame): Targets from load_data_source
+        data_sources (dict): Data source name to DataFrame from load_data_source
+        position_estimates (pandas DataFrame): Positional estimates from
+        load_data_source, used to group players when imputing
+        imputer (GroupMeanImputer): Fitted imputer to fill nulls with, or None
+        to fit one on the targets (Default=None)
+
+    Returns:
+        targets (pandas DataFrame): Data sources joined onto the targets
+    """
+    targets = merge_data_sources(targets, data_sources, position_estimates)
+    # Impute missing values
+    if imputer is None:
+        imputer = GroupMeanImputer().fit(targets)
+    targets = imputer.transform(targets)
+    # Change all field names to uppercase
+    targets.columns = targets.columns.str.upper()
+    return targets
+
 def create_model_input(data_source_list):
     """
     Reads in a list of data sources and merges those features with the target
@@ -100,123 +803,94 @@ def create_model_input(data_source_list):
         joined onto the target variable for player projection modeling will
         all nulls imputed.
     """
-    # Dictionary of data source paths
-    data_source_dict = {'targets': '../../../../data/nba/modeling_targets/modeling_targets.csv',
-                        'bbref_box_score': '../../../../data/nba/basketball_reference/player_data/combined/bbref_player_data.csv',
-                        'bbref_measurements': '../../../../data/nba/basketball_reference/player_data/measurements/player_measurements.csv',
-                        'bbref_league_percentile': '../../../../data/nba/basketball_reference/player_data/percentile/nba_percentile_all.csv',
-                        'bbref_position_percentile': '../../../../data/nba/basketball_reference/player_data/percentile/nba_percentile_position.csv',
-                        'bbref_position_estimates': '../../../../data/nba/basketball_reference/player_data/positional_estimates/player_position_estimates.csv',
-                        'bbref_salary': '../../../../data/nba/basketball_reference/player_data/salary/salary_info.csv',
-                        'espn_advance': '../../../../data/nba/espn/espn_nba_rpm.csv'}
-
-    # Read in Targets and reformat season to YYYY-YYYY
-    targets = pd.read_csv(data_source_dict['targets'])
-    targets['season'] = targets[targets['season'].notnull()].apply(lambda row: str(int(row['season'] - 1)) +  '-' +  str(int(row['season'])), axis=1)
-
-    # Join Basketball-Reference Box-Score Data to Targets if included in
-    # the function parameter `data_source_list`
-    if 'bbref_box_score' in data_source_list:
-        # Read in Basketball-Reference Box-Score Data
-        bbref_box_score = pd.read_csv(data_source_dict['bbref_box_score'])
-        # Remove partial seasons resulting from in-season trades (TOT only)
-        bbref_box_score = bbref_box_score[((bbref_box_score.groupby(['BBREF_ID', 'SEASON'])['TEAM'].transform('size')>1) &
-                                (bbref_box_score['TEAM']=='TOT')) |
-                                (bbref_box_score.groupby(['BBREF_ID', 'SEASON'])['TEAM'].transform('size')<=1)]
-        # Join onto Targets
-        targets = pd.merge(targets, bbref_box_score, how='left',
-                                                    left_on=['bbref_id', 'season'],
-                                                    right_on=['BBREF_ID', 'SEASON'],
-                                                    suffixes=('', '_duplicate'))
-
-    # Join League Percentiles to Targets if included in the function parameter
-    # `data_source_list`
-    if 'bbref_league_percentile' in data_source_list:
-        # Read in League Percentile Data
-        bbref_league_percentile = pd.read_csv(data_source_dict['bbref_league_percentile'])
-        # Join onto Targets
-        targets = pd.merge(targets, bbref_league_percentile, how='left',
-                                                            left_on=['bbref_id', 'season'],
-                                                            right_on=['BBREF_ID', 'SEASON'],
-                                                            suffixes=('', '_duplicate'))
-
-    # Join Position Percentiles to Targets if included in the function parameter
-    # `data_source_list`
-    if 'bbref_position_percentile' in data_source_list:
-        # Read in Position Percentile Data
-        bbref_position_percentile = pd.read_csv(data_source_dict['bbref_position_percentile'])
-        # Join onto Targets
-        targets = pd.merge(targets, bbref_position_percentile, how='left',
-                                                            left_on=['bbref_id', 'season'],
-                                                            right_on=['BBREF_ID', 'SEASON'],
-                                                            suffixes=('', '_duplicate'))
-
-    # Join Measurement Data to Targets if included in the function parameter
-    # `data_source_list`
-    if 'bbref_measurements' in data_source_list:
-        # Read in Measurable Data
-        bbref_measurements = pd.read_csv(data_source_dict['bbref_measurements'])
-        # Join onto Targets
-        targets = pd.merge(targets, bbref_measurements, how='left',
-                                                        on='bbref_id',
-                                                        suffixes=('', '_duplicate'))
-
-    # Join Salary Data to Targets if included in the function parameter
-    # `data_source_list`
-    if 'bbref_salary' in data_source_list:
-        # Read in Salary Data and Reformat Season to YYYY-YYYY
-        bbref_salary = pd.read_csv(data_source_dict['bbref_salary'])
-        bbref_salary['season'] = bbref_salary[bbref_salary['season'].notnull()].apply(lambda row: str(int(row['season'] - 1)) +  '-' +  str(int(row['season'])), axis=1)
-        # Join onto Targets
-        targets = pd.merge(targets, bbref_salary, how='left',
-                                                on=['bbref_id', 'season'],
-                                                suffixes=('', '_duplicate'))
-
-    # Join Positional Estimates to Targets if included in the function parameter
-    # `data_source_list`
+    refresh_targets()
+    targets = load_data_source('targets')
+    # Positional estimates are read whether or not they are in
+    # `data_source_list` as imputation groups players by
+    # `advanced_position_cluster`
+    data_sources = {data_source: load_data_source(data_source)
+                    for data_source in data_source_list if data_source != 'bbref_position_estimates'}
+    bbref_position_estimates = load_data_source('bbref_position_estimates')
     if 'bbref_position_estimates' in data_source_list:
-        # Read in Position Data and Reformat Season to YYYY-YYYY
-        bbref_position_estimates = pd.read_csv(data_source_dict['bbref_position_estimates'])
-        bbref_position_estimates['season'] = bbref_position_estimates.apply(lambda row: str(int(row['season'] - 1)) +  '-' +  str(int(row['season'])), axis=1)
-        # Join onto Targets
-        targets = pd.merge(targets, bbref_position_estimates, how='left',
-                                                on=['bbref_id', 'season'],
-                                                suffixes=('', '_duplicate'))
-
-    # Join Advanced ESPN data to Targets if included in the function parameter
-    # `data_source_list`
-    if 'espn_advance' in data_source_list:
-        # Read in ESPN Advance Data
-        espn_advance = pd.read_csv(data_source_dict['espn_advance'])
-        # Remove partial seasons resulting from in-season trades (TOT only)
-        espn_advance = (espn_advance.groupby(['name', 'pos', 'espn_link', 'season'])
-                                    .mean()
-                                    .reset_index())
-        # Join bbref_id onto espn table to join onto other dataframes
-        player_table = pd.read_csv('../../../../data/player_ids/player_table.csv')
-        espn_advance['season'] = espn_advance.apply(lambda row: str(int(row['season'] - 1)) +  '-' +  str(int(row['season'])), axis=1)
-        espn_advance = (pd.merge(espn_advance, player_table,
-                                    how='left', on='espn_link')
-                                    [['orpm', 'drpm', 'rpm', 'wins',
-                                    'bbref_id', 'season']])
-        # Join onto Targets
-        targets = pd.merge(targets, espn_advance, how='left',
-                                                on=['bbref_id', 'season'],
-                                                suffixes=('', '_duplicate'))
+        data_sources['bbref_position_estimates'] = bbref_position_estimates
+    return join_data_sources(targets, data_sources, bbref_position_estimates)
 
-    # Drop duplicate fields
-    targets.drop([col for col in targets.columns if '_duplicate' in col],
-                    axis=1,
-                        inplace=True)
-    # Drop irrelivent and duplicate fields
-    targets.drop([col for col in ['team_flag', 'contract_type', 'league', 'BBREF_ID', 'SEASON', 'RANK', 'POSITION_MINUTES'] if col in targets.columns], axis=1, inplace=True)
-    # Impute missing values
-    targets = impute_missing_values(targets)
-    # Change all field names to uppercase
-    targets.columns = targets.columns.str.upper()
-    return targets
+class GroupMeanImputer(TransformerMixin, BaseEstimator):
+    '''
+    Imputes nulls in shooting metrics with zero and nulls in non-shooting
+    metrics with the mean of a player's season/advanced position cluster
+    grouping. Group means are calculated for every column in one groupby when
+    fit, and filled in by aligning each row to its group, so means learned on
+    training data can be applied to new data.
+    '''
+
+    def __init__(self, group_cols=('advanced_position_cluster', 'season'),
+                 zero_fields=SHOOTING_FIELDS, mean_fields=BOX_SCORE_FIELDS):
+        self.group_cols = group_cols
+        self.zero_fields = zero_fields
+        self.mean_fields = mean_fields
+
+    def fit(self, X, y=None):
+        self.zero_cols_ = [col for col in X.columns if col in self.zero_fields]
+        self.mean_cols_ = [col for col in X.columns if col in self.mean_fields]
+        self.group_means_ = X.groupby(list(self.group_cols))[self.mean_cols_].mean()
+        return self
+
+    def partial_fit(self, X, y=None):
+        # Accumulate group sums and counts one chunk of rows at a time, so the
+        # means match fitting on every chunk at once
+        grouped = X.groupby(list(self.group_cols))
+        if not hasattr(self, 'group_sums_'):
+            self.zero_cols_ = [col for col in X.columns if col in self.zero_fields]
+            self.mean_cols_ = [col for col in X.columns if col in self.mean_fields]
+            self.group_sums_ = grouped[self.mean_cols_].sum()
+            self.group_counts_ = grouped[self.mean_cols_].count()
+        else:
+            self.group_sums_ = self.group_sums_.add(grouped[self.mean_cols_].sum(), fill_value=0)
+            self.group_counts_ = self.group_counts_.add(grouped[self.mean_cols_].count(), fill_value=0)
+        self.group_means_ = self.group_sums_ / self.group_counts_
+        return self
+
+    def transform(self, X):
+        X = X.copy()
+        # Impute shooting fields with zero
+        X[self.zero_cols_] = X[self.zero_cols_].fillna(0)
+        # Look up each row's group means and fill nulls from them. Rows in a
+        # group that was not seen in fit are left null.
+        groups = pd.MultiIndex.from_frame(X[list(self.group_cols)])
+        means = self.group_means_.reindex(groups)
+        means.index = X.index
+        X[self.mean_cols_] = X[self.mean_cols_].fillna(means)
+        return X
+
+def add_position_cluster(df, position_estimates=None):
+    """
+    Joins `advanced_position_cluster`, which imputation groups players by,
+    onto df if it is not already there.
+
+    Args:
+        df (pandas DataFrame): DataFrame with bbref_id and season
+        position_estimates (pandas DataFrame): Positional estimates with
+        seasons formatted as YYYY-YYYY. Read in if not given. (Default=None)
+
+    Returns:
+        df (pandas DataFrame): df with `advanced_position_cluster`
+    """
+    if 'advanced_position_cluster' in df.columns:
+        return df
+    if position_estimates is None:
+        # Read in Position Data and Reformat Season to YYYY-YYYY
+        position_estimates = pd.read_csv('../../../../data/nba/basketball_reference/player_data/positional_estimates/player_position_estimates.csv')
+        position_estimates['season'] = position_estimates.apply(lambda row: str(int(row['season'] - 1)) +  '-' +  str(int(row['season'])), axis=1)
+    # Join onto Targets
+    df = pd.merge(df, position_estimates[['bbref_id', 'season', 'advanced_position_cluster']],
+                                            how='left',
+                                            on=['bbref_id', 'season'],
+                                            suffixes=('', '_duplicate'))
+    df.drop([col for col in df.columns if '_duplicate' in col], axis=1, inplace=True)
+    return df
 
-def impute_missing_values(df):
+def impute_missing_values(df, position_estimates=None):
     """
     Imputes missing values in the model_input dataframe. Fills nulls in any shooting
     metrics with zero and nulls in non-shooting metrics with the mean of a player's
@@ -224,470 +898,172 @@ def impute_missing_values(df):
 
     Args:
         df (pandas DataFrame): DataFrame containing null values.
+        position_estimates (pandas DataFrame): Positional estimates with
+        seasons formatted as YYYY-YYYY, used to join `advanced_position_cluster`
+        if it is not already in df. Read in if not given. (Default=None)
 
     Returns:
         df (pandas DataFrame): DataFrame with null values imputed.
     """
-    # Define list of shooting fields in which null values will be imputed with
-    # zero as they are typically a result of zero field goal attempts.
-    shooting_fields = ['FG', 'FGA', 'FG%' ,'2P', '2PA', '2P%',
-                        '3P', '3PA', '3P%', 'FT', 'FTA', 'FT%',
-                        'PER100_FG', 'PER100_FGA',
-                        'PER100_FG%', 'PER100_2P', 'PER100_2PA',
-                        'PER100_2P%', 'PER100_3P', 'PER100_3PA',
-                        'PER100_3P%', 'PER100_FT', 'PER100_FTA',
-                        'PER100_FT%', 'eFG%', 'TS%', '3PA_RATE',
-                        'FT_RATE', 'fg_percentile_all', 'fga_percentile_all',
-                        'fg_percent_percentile_all', 'three_point_made_percentile_all',
-                        'three_point_attempt_percentile_all',
-                        'three_point_percent_percentile_all',
-                        'two_point_made_percentile_all',
-                        'two_point_attempt_percentile_all',
-                        'two_point_percent_percentile_all',
-                        'efg_percent_percentile_all',
-                        'true_shooting_percent_percentile_all',
-                        'free_throw_made_percentile_all',
-                        'free_throw_attempt_percentile_all',
-                        'free_throw_percent_percentile_all',
-                        'fg_made_per100_percentile_all',
-                        'fg_attempted_per100_percentile_all',
-                        'three_point_made_per100_percentile_all',
-                        'three_point_attempt_per100_percentile_all',
-                        'two_point_made_per100_percentile_all',
-                        'two_point_attempt_per100_percentile_all',
-                        'free_throw_made_per100_percentile_all',
-                        'free_throw_attempt_per100_percentile_all',
-                        'three_point_attempt_rate_percentile_all',
-                        'free_throw_rate_percentile_all',
-                        'fg_percentile_position',
-                        'fga_percentile_position',
-                        'fg_percent_percentile_position',
-                        'three_point_made_percentile_position',
-                        'three_point_attempt_percentile_position',
-                        'three_point_percent_percentile_position',
-                        'two_point_made_percentile_position',
-                        'two_point_attempt_percentile_position',
-                        'two_point_percent_percentile_position',
-                        'efg_percent_percentile_position',
-                        'true_shooting_percent_percentile_position',
-                        'free_throw_made_percentile_position',
-                        'free_throw_attempt_percentile_position',
-                        'free_throw_percent_percentile_position',
-                        'fg_made_per100_percentile_position',
-                        'fg_attempted_per100_percentile_position',
-                        'three_point_made_per100_percentile_position',
-                        'three_point_attempt_per100_percentile_position',
-                        'two_point_made_per100_percentile_position',
-                        'two_point_attempt_per100_percentile_position',
-                        'free_throw_made_per100_percentile_position',
-                        'free_throw_attempt_per100_percentile_position',
-                        'three_point_attempt_rate_percentile_position',
-                        'free_throw_rate_percentile_position']
-
-    # Define list of non-shooting fields in which nulls will be imputed with
-    # the mean of the season/advance_position_cluster grouping
-    box_score_fields = ['AST',
-                         'AST%',
-                         'BLK',
-                         'BLK%',
-                         'BPM',
-                         'DBPM',
-                         'DRB',
-                         'DRB%',
-                         'DWS',
-                         'G',
-                         'GS',
-                         'IMPACT_PLAY_RATE',
-                         'MP',
-                         'OBPM',
-                         'ORB',
-                         'ORB%',
-                         'OWS',
-                         'PER',
-                         'PER100_AST',
-                         'PER100_BLK',
-                         'PER100_DRB',
-                         'PER100_DRtg',
-                         'PER100_ORB',
-                         'PER100_ORtg',
-                         'PER100_PF',
-                         'PER100_PTS',
-                         'PER100_STL',
-                         'PER100_TOV',
-                         'PER100_TRB',
-                         'PF',
-                         'PSA',
-                         'PTS',
-                         'STL',
-                         'STL%',
-                         'TOV',
-                         'TOV%',
-                         'TRB',
-                         'TRB%',
-                         'USG%',
-                         'VORP',
-                         'WS',
-                         'WS/48',
-                         'age',
-                         'age_percentile_all',
-                         'age_percentile_position',
-                         'ast_percent_percentile_all',
-                         'ast_percent_percentile_position',
-                         'ast_percentile_all',
-                         'ast_percentile_position',
-                         'blk_percent_percentile_all',
-                         'blk_percent_percentile_position',
-                         'blk_percentile_all',
-                         'blk_percentile_position',
-                         'bpm_percentile_all',
-                         'bpm_percentile_position',
-                         'def_bpm_percentile_all',
-                         'def_bpm_percentile_position',
-                         'def_win_shares_percentile_all',
-                         'def_win_shares_percentile_position',
-                         'drb_percent_percentile_all',
-                         'drb_percent_percentile_position',
-                         'drb_percentile_all',
-                         'drb_percentile_position',
-                         'experience',
-                         'foul_percentile_all',
-                         'foul_percentile_position',
-                         'games_player_percentile_all',
-                         'games_player_percentile_position',
-                         'games_started_percentile_all',
-                         'games_started_percentile_position',
-                         'height',
-                         'height_percentile_all',
-                         'height_percentile_position',
-                         'minutes_c',
-                         'minutes_percentile_all',
-                         'minutes_percentile_position',
-                         'minutes_pf',
-                         'minutes_pg',
-                         'minutes_sf',
-                         'minutes_sg',
-                         'off_bpm_percentile_all',
-                         'off_bpm_percentile_position',
-                         'off_court_plus_minus',
-                         'off_win_shares_percentile_all',
-                         'off_win_shares_percentile_position',
-                         'on_court_plus_minus',
-                         'orb_percent_percentile_all',
-                         'orb_percent_percentile_position',
-                         'oreb_percentile_all',
-                         'oreb_percentile_position',
-                         'points_percentile_all',
-                         'points_percentile_position',
-                         'position_numeric',
-                         'prop_c',
-                         'prop_pf',
-                         'prop_pg',
-                         'prop_sf',
-                         'prop_sg',
-                         'salary',
-                         'salary_prop_cap',
-                         'stl_percent_percentile_all',
-                         'stl_percent_percentile_position',
-                         'stl_percentile_all',
-                         'stl_percentile_position',
-                         'total_percentile_all',
-                         'total_percentile_position',
-                         'tov_percent_percentile_all',
-                         'tov_percent_percentile_position',
-                         'trb_percent_percentile_all',
-                         'trb_percent_percentile_position',
-                         'turnover_percentile_all',
-                         'turnover_percentile_position',
-                         'usg_percent_percentile_all',
-                         'usg_percent_percentile_position',
-                         'vorp_percentile_all',
-                         'vorp_percentile_position',
-                         'weight',
-                         'weight_percentile_all',
-                         'weight_percentile_position',
-                         'win_shares_percentile_all',
-                         'win_shares_percentile_position',
-                         'win_sharres_per_48_percentile_all',
-                         'win_sharres_per_48_percentile_position']
-
-    # Check to see if `advanced_position_cluster` was joined onto Targets dataframe
-    # in the create_model_input function. Will use `advanced_position_cluster` field
-    # to groupby when filling null values to impute mean of season/position.
-    if 'advanced_position_cluster' in df.columns:
-        # Impute shooting fields with zero
-        df.update(df[[col for col in df.columns if col in shooting_fields]].fillna(0))
-        # Impute non-shooting fields with mean of season/advance_position_cluster
-        df[[col for col in df.columns if col in box_score_fields]] = df.groupby(['advanced_position_cluster', 'season'])[[col for col in df.columns if col in box_score_fields]].transform(lambda x: x.fillna(x.mean()))
-        return df
+    return GroupMeanImputer().fit_transform(add_position_cluster(df, position_estimates))
 
-    else:
-        # Read in Position Data and Reformat Season to YYYY-YYYY
-        bbref_position_estimates = pd.read_csv('../../../../data/nba/basketball_reference/player_data/positional_estimates/player_position_estimates.csv')
-        bbref_position_estimates['season'] = bbref_position_estimates.apply(lambda row: str(int(row['season'] - 1)) +  '-' +  str(int(row['season'])), axis=1)
-        bbref_position_estimates = bbref_position_estimates[['bbref_id', 'season', 'advanced_position_cluster']]
-        # Join onto Targets
-        df = pd.merge(df, bbref_position_estimates, how='left',
-                                                on=['bbref_id', 'season'],
-                                                suffixes=('', '_duplicate'))
-        df.drop([col for col in df.columns if '_duplicate' in col], axis=1, inplace=True)
+def metric_averages(df, weighted=True, window=3, kernel=None, decay=0.5,
+                    reliability_weight=None):
+    """
+    Calculates either unweighted or weighted three-season averages of the
+    season-level statistics in METRIC_FIELDS. With `reliability_weight` the
+    averages are also calculated with every season's weight multiplied by the
+    minutes ('MP') or estimated possessions ('POSS') played in it, so short
+    seasons count for less, and added as 'column_3MWAVG' columns.
 
-        # Impute shooting fields with zero
-        df.update(df[[col for col in df.columns if col in shooting_fields]].fillna(0))
-        # Impute non-shooting fields with mean of season/advance_position_cluster
-        df[[col for col in df.columns if col in box_score_fields]] = df.groupby(['advanced_position_cluster', 'season'])[[col for col in df.columns if col in box_score_fields]].transform(lambda x: x.fillna(x.mean()))
-        return df
+    Args:
+        df (pandas DataFrame): DataFrame containing season-level statistics
+        weighted (boolean): Whether to weight the statistical average (Default=True)
+        window (int): Number of seasons to average over (Default=3)
+        kernel (str): Overrides `weighted` with a kernel from season_weights,
+        e.g. 'exponential' (Default=None)
+        decay (float): Decay rate for the exponential kernel (Default=0.5)
+        reliability_weight (str): 'MP' or 'POSS' to add reliability-weighted
+        averages (Default=None)
 
-def metrics_to_averages(df, weighted=True):
+    Returns:
+        averages (pandas DataFrame): Average columns on the same index as df
+    """
+    # Create three-season weighted or un-weighted average columns for every
+    # metric in one pass
+    metric_cols = [col for col in df.columns if col in METRIC_FIELDS]
+    if kernel is None:
+        kernel = 'linear' if weighted else 'uniform'
+    if reliability_weight is None:
+        return kernel_average(df, metric_cols, window=window, kernel=kernel, decay=decay)
+
+    weights = df['MP'] if reliability_weight == 'MP' else estimate_possessions(df)
+    # Line up the seasons once for both the recency and reliability-weighted
+    # averages
+    order, lags, weight_lags = season_lags(df.assign(SEASON_WEIGHT=weights), metric_cols,
+                                           window, 'SEASON_WEIGHT')
+    suffix = average_suffix(window, kernel)
+    reliability_suffix = average_suffix(window, kernel, reliability_weight)
+    return pd.concat([pd.DataFrame(apply_kernel(order, lags, None, kernel, decay),
+                                   index=df.index,
+                                   columns=[col + suffix for col in metric_cols]),
+                      pd.DataFrame(apply_kernel(order, lags, weight_lags, kernel, decay),
+                                   index=df.index,
+                                   columns=[col + reliability_suffix for col in metric_cols])],
+                     axis=1)
+
+def metrics_to_averages(df, weighted=True, window=3, kernel=None, decay=0.5,
+                        reliability_weight=None):
     """
     Transforms fields from season-level statistics to either unweighted or weighted
-    three-season averages.
+    three-season averages (see metric_averages for the arguments).
 
     Args:
         df (pandas DataFrame): DataFrame containing season-level statistics
-        weighted (boolean): Whether to weight the statistical average (Default=True)
 
     Returns:
         df (pandas DataFrame): DataFrame with season-level statistics transformed
         to either unweighted or weighted three-season averages.
     """
-    # Define comprehensive list of metrics to transform from season-level to
-    # either unweighted or weighted three-season averages
-    metric_fields = ['G',
-                    'GS',
-                    'MP',
-                    'FG',
-                    'FGA',
-                    'FG%',
-                    '3P',
-                    '3PA',
-                    '3P%',
-                    '2P',
-                    '2PA',
-                    '2P%',
-                    'EFG%',
-                    'FT',
-                    'FTA',
-                    'FT%',
-                    'ORB',
-                    'DRB',
-                    'TRB',
-                    'AST',
-                    'STL',
-                    'BLK',
-                    'TOV',
-                    'PF',
-                    'PTS',
-                    'PER100_FG',
-                    'PER100_FGA',
-                    'PER100_FG%',
-                    'PER100_3P',
-                    'PER100_3PA',
-                    'PER100_3P%',
-                    'PER100_2P',
-                    'PER100_2PA',
-                    'PER100_2P%',
-                    'PER100_FT',
-                    'PER100_FTA',
-                    'PER100_FT%',
-                    'PER100_ORB',
-                    'PER100_DRB',
-                    'PER100_TRB',
-                    'PER100_AST',
-                    'PER100_STL',
-                    'PER100_BLK',
-                    'PER100_TOV',
-                    'PER100_PF',
-                    'PER100_PTS',
-                    'PER100_ORTG',
-                    'PER100_DRTG',
-                    'PER',
-                    'TS%',
-                    '3PA_RATE',
-                    'FT_RATE',
-                    'ORB%',
-                    'DRB%',
-                    'TRB%',
-                    'AST%',
-                    'STL%',
-                    'BLK%',
-                    'TOV%',
-                    'USG%',
-                    'OWS',
-                    'DWS',
-                    'WS',
-                    'WS/48',
-                    'OBPM',
-                    'DBPM',
-                    'BPM',
-                    'VORP',
-                    'GAMES_PLAYER_PERCENTILE_ALL',
-                    'GAMES_STARTED_PERCENTILE_ALL',
-                    'MINUTES_PERCENTILE_ALL',
-                    'FG_PERCENTILE_ALL',
-                    'FGA_PERCENTILE_ALL',
-                    'FG_PERCENT_PERCENTILE_ALL',
-                    'THREE_POINT_MADE_PERCENTILE_ALL',
-                    'THREE_POINT_ATTEMPT_PERCENTILE_ALL',
-                    'THREE_POINT_PERCENT_PERCENTILE_ALL',
-                    'TWO_POINT_MADE_PERCENTILE_ALL',
-                    'TWO_POINT_ATTEMPT_PERCENTILE_ALL',
-                    'TWO_POINT_PERCENT_PERCENTILE_ALL',
-                    'EFG_PERCENT_PERCENTILE_ALL',
-                    'TRUE_SHOOTING_PERCENT_PERCENTILE_ALL',
-                    'FREE_THROW_MADE_PERCENTILE_ALL',
-                    'FREE_THROW_ATTEMPT_PERCENTILE_ALL',
-                    'FREE_THROW_PERCENT_PERCENTILE_ALL',
-                    'OREB_PERCENTILE_ALL',
-                    'DRB_PERCENTILE_ALL',
-                    'TOTAL_PERCENTILE_ALL',
-                    'AST_PERCENTILE_ALL',
-                    'STL_PERCENTILE_ALL',
-                    'BLK_PERCENTILE_ALL',
-                    'TURNOVER_PERCENTILE_ALL',
-                    'FOUL_PERCENTILE_ALL',
-                    'POINTS_PERCENTILE_ALL',
-                    'FG_MADE_PER100_PERCENTILE_ALL',
-                    'FG_ATTEMPTED_PER100_PERCENTILE_ALL',
-                    'THREE_POINT_MADE_PER100_PERCENTILE_ALL',
-                    'THREE_POINT_ATTEMPT_PER100_PERCENTILE_ALL',
-                    'TWO_POINT_MADE_PER100_PERCENTILE_ALL',
-                    'TWO_POINT_ATTEMPT_PER100_PERCENTILE_ALL',
-                    'FREE_THROW_MADE_PER100_PERCENTILE_ALL',
-                    'FREE_THROW_ATTEMPT_PER100_PERCENTILE_ALL',
-                    'THREE_POINT_ATTEMPT_RATE_PERCENTILE_ALL',
-                    'FREE_THROW_RATE_PERCENTILE_ALL',
-                    'ORB_PERCENT_PERCENTILE_ALL',
-                    'DRB_PERCENT_PERCENTILE_ALL',
-                    'TRB_PERCENT_PERCENTILE_ALL',
-                    'AST_PERCENT_PERCENTILE_ALL',
-                    'STL_PERCENT_PERCENTILE_ALL',
-                    'BLK_PERCENT_PERCENTILE_ALL',
-                    'TOV_PERCENT_PERCENTILE_ALL',
-                    'USG_PERCENT_PERCENTILE_ALL',
-                    'OFF_WIN_SHARES_PERCENTILE_ALL',
-                    'DEF_WIN_SHARES_PERCENTILE_ALL',
-                    'WIN_SHARES_PERCENTILE_ALL',
-                    'WIN_SHARRES_PER_48_PERCENTILE_ALL',
-                    'OFF_BPM_PERCENTILE_ALL',
-                    'DEF_BPM_PERCENTILE_ALL',
-                    'BPM_PERCENTILE_ALL',
-                    'VORP_PERCENTILE_ALL',
-                    'GAMES_PLAYER_PERCENTILE_POSITION',
-                    'GAMES_STARTED_PERCENTILE_POSITION',
-                    'MINUTES_PERCENTILE_POSITION',
-                    'FG_PERCENTILE_POSITION',
-                    'FGA_PERCENTILE_POSITION',
-                    'FG_PERCENT_PERCENTILE_POSITION',
-                    'THREE_POINT_MADE_PERCENTILE_POSITION',
-                    'THREE_POINT_ATTEMPT_PERCENTILE_POSITION',
-                    'THREE_POINT_PERCENT_PERCENTILE_POSITION',
-                    'TWO_POINT_MADE_PERCENTILE_POSITION',
-                    'TWO_POINT_ATTEMPT_PERCENTILE_POSITION',
-                    'TWO_POINT_PERCENT_PERCENTILE_POSITION',
-                    'EFG_PERCENT_PERCENTILE_POSITION',
-                    'TRUE_SHOOTING_PERCENT_PERCENTILE_POSITION',
-                    'FREE_THROW_MADE_PERCENTILE_POSITION',
-                    'FREE_THROW_ATTEMPT_PERCENTILE_POSITION',
-                    'FREE_THROW_PERCENT_PERCENTILE_POSITION',
-                    'OREB_PERCENTILE_POSITION',
-                    'DRB_PERCENTILE_POSITION',
-                    'TOTAL_PERCENTILE_POSITION',
-                    'AST_PERCENTILE_POSITION',
-                    'STL_PERCENTILE_POSITION',
-                    'BLK_PERCENTILE_POSITION',
-                    'TURNOVER_PERCENTILE_POSITION',
-                    'FOUL_PERCENTILE_POSITION',
-                    'POINTS_PERCENTILE_POSITION',
-                    'FG_MADE_PER100_PERCENTILE_POSITION',
-                    'FG_ATTEMPTED_PER100_PERCENTILE_POSITION',
-                    'THREE_POINT_MADE_PER100_PERCENTILE_POSITION',
-                    'THREE_POINT_ATTEMPT_PER100_PERCENTILE_POSITION',
-                    'TWO_POINT_MADE_PER100_PERCENTILE_POSITION',
-                    'TWO_POINT_ATTEMPT_PER100_PERCENTILE_POSITION',
-                    'FREE_THROW_MADE_PER100_PERCENTILE_POSITION',
-                    'FREE_THROW_ATTEMPT_PER100_PERCENTILE_POSITION',
-                    'THREE_POINT_ATTEMPT_RATE_PERCENTILE_POSITION',
-                    'FREE_THROW_RATE_PERCENTILE_POSITION',
-                    'ORB_PERCENT_PERCENTILE_POSITION',
-                    'DRB_PERCENT_PERCENTILE_POSITION',
-                    'TRB_PERCENT_PERCENTILE_POSITION',
-                    'AST_PERCENT_PERCENTILE_POSITION',
-                    'STL_PERCENT_PERCENTILE_POSITION',
-                    'BLK_PERCENT_PERCENTILE_POSITION',
-                    'TOV_PERCENT_PERCENTILE_POSITION',
-                    'USG_PERCENT_PERCENTILE_POSITION',
-                    'OFF_WIN_SHARES_PERCENTILE_POSITION',
-                    'DEF_WIN_SHARES_PERCENTILE_POSITION',
-                    'WIN_SHARES_PERCENTILE_POSITION',
-                    'WIN_SHARRES_PER_48_PERCENTILE_POSITION',
-                    'OFF_BPM_PERCENTILE_POSITION',
-                    'DEF_BPM_PERCENTILE_POSITION',
-                    'BPM_PERCENTILE_POSITION',
-                    'VORP_PERCENTILE_POSITION',
-                    'SALARY',
-                    'SALARY_PROP_CAP',
-                    'GAMES_PLAYED',
-                    'MINUTES_PLAYED',
-                    'ON_COURT_PLUS_MINUS',
-                    'OFF_COURT_PLUS_MINUS',
-                    'PROP_PG',
-                    'PROP_SG',
-                    'PROP_SF',
-                    'PROP_PF',
-                    'PROP_C',
-                    'MINUTES_PG',
-                    'MINUTES_SG',
-                    'MINUTES_SF',
-                    'MINUTES_PF',
-                    'MINUTES_C',
-                    'POSITION_NUMERIC',
-                    'ORPM',
-                    'DRPM',
-                    'RPM',
-                    'WINS']
-    if weighted:
-        # Create three-season weighted average columns
-        for col in [col for col in df.columns if col in metric_fields]:
-            weighted_average(df, col)
-        # Drop original season-level columns
-        df.drop([col for col in df.columns if col in metric_fields], axis=1, inplace=True)
-    else:
-        # Create three-season un-weighted average columns
-        for col in [col for col in df.columns if col in metric_fields]:
-            unweighted_average(df, col)
-        # Drop original season-level columns
-        df.drop([col for col in df.columns if col in metric_fields], axis=1, inplace=True)
+    averages = metric_averages(df, weighted, window, kernel, decay, reliability_weight)
+    # Drop original season-level columns
+    df = pd.concat([df.drop([col for col in df.columns if col in METRIC_FIELDS], axis=1),
+                    averages], axis=1)
     return df
 
-if __name__=='__main__':
-    # Transform single-season features into three-season weighted averages
-    model_input = create_model_input(['bbref_box_score',
-                                      'bbref_measurements',
-                                      'bbref_league_percentile',
-                                      'bbref_position_percentile',
-                                      'bbref_position_estimates',
-                                      'bbref_salary',
-                                      'espn_advance'])
-    model_input_3WAVG = metrics_to_averages(model_input)
+def create_feature_matrix(data_source_list, weighted=True, reliability_weight='MP'):
+    """
+    Builds the complete feature matrix: the single-season features from
+    create_model_input next to three-season averages of the season-level
+    metrics, with the data sources read, joined and imputed only once for
+    both blocks.
+
+    Args:
+        data_source_list (list): Data sources to join onto the target variable
+        (see create_model_input)
+        weighted (boolean): Whether to weight the statistical average (Default=True)
+        reliability_weight (str): 'MP' or 'POSS' to add reliability-weighted
+        averages, or None (Default='MP')
+
+    Returns:
+        complete_feature_matrix (pandas DataFrame): Single-season features
+        followed by the three-season average columns
+    """
+    model_input = create_model_input(data_source_list)
+    averages = metric_averages(model_input, weighted=weighted,
+                               reliability_weight=reliability_weight)
+    return pd.concat([model_input, averages], axis=1)
+
+def compact_feature_matrix(df):
+    """
+    Shrinks the feature matrix in memory: float64 columns become float32,
+    integer columns the smallest integer type that holds them, string columns
+    (PLAYER, POSITION, ADVANCED_POSITION_CLUSTER, BBREF_ID) categoricals, and
+    SEASON an ordered categorical, so each season is stored as a small integer
+    code while still comparing equal to 'YYYY-YYYY'.
+
+    Args:
+        df (pandas DataFrame): Feature matrix from create_feature_matrix
+
+    Returns:
+        df (pandas DataFrame): Feature matrix with compact column types
+    """
+    # Column by column by position, as the matrix can repeat a column name
+    columns = []
+    for i in range(df.shape[1]):
+        column = df.iloc[:, i]
+        if column.dtype == np.float64:
+            column = column.astype(np.float32)
+        elif column.dtype.kind in 'iu':
+            column = pd.to_numeric(column, downcast='integer')
+        elif column.name == 'SEASON':
+            column = column.astype(pd.CategoricalDtype(sorted(column.dropna().unique()), ordered=True))
+        elif pd.api.types.is_object_dtype(column) or pd.api.types.is_string_dtype(column):
+            column = column.astype('category')
+        columns.append(column)
+    return pd.concat(columns, axis=1)
+
+def save_feature_matrix(df, path):
+    """
+    Writes the feature matrix to csv, and in its compact form to a pickle
+    next to it (same name, .pkl extension) that load_feature_matrix reads
+    without re-parsing or re-typing any columns.
+
+    Args:
+        df (pandas DataFrame): Feature matrix from create_feature_matrix
+        path (str): Path of the csv
+    """
+    df.to_csv(path, index=False)
+    compact_feature_matrix(df).to_pickle(os.path.splitext(path)[0] + '.pkl')
 
+def load_feature_matrix(path):
+    """
+    Reads the feature matrix in its compact form (see compact_feature_matrix).
+    Uses the pickle written by save_feature_matrix unless the csv is newer.
+
+    Args:
+        path (str): Path of the csv
+
+    Returns:
+        df (pandas DataFrame): Feature matrix with compact column types
+    """
+    pickle_path = os.path.splitext(path)[0] + '.pkl'
+    if os.path.exists(pickle_path) and os.path.getmtime(pickle_path) >= os.path.getmtime(path):
+        return pd.read_pickle(pickle_path)
+    return compact_feature_matrix(pd.read_csv(path))
+
+if __name__=='__main__':
     # Create single-season features from Box Score, League Percentiles,
     # Position_Percentiles, ESPN Advance, Positional Estimates, Measurements,
-    # and Salary data sources
-    model_input = create_model_input(['bbref_box_score',
-                                      'bbref_measurements',
-                                      'bbref_league_percentile',
-                                      'bbref_position_percentile',
-                                      'bbref_position_estimates',
-                                      'bbref_salary',
-                                      'espn_advance'])
-
-    # Join single-season and three-season weighted average features into single
+    # and Salary data sources, joined with three-season weighted averages
+    # (by recency alone and by recency and minutes played) into a single
     # feature matrix to use in model_selection and model_pipeline scripts
-    complete_feature_matrix = pd.merge(model_input, model_input_3WAVG,
-                                        on=['BBREF_ID', 'SEASON'],
-                                        suffixes=('', '_duplicate'))
-    complete_feature_matrix.drop([col for col in complete_feature_matrix.columns if '_duplicate' in col],
-                                axis=1,
-                                inplace=True)
-    complete_feature_matrix.to_csv('../feature_selection/featurized_inputs/complete_feature_matrix.csv',
-                                    index=False)
+    complete_feature_matrix = create_feature_matrix(['bbref_box_score',
+                                                     'bbref_measurements',
+                                                     'bbref_league_percentile',
+                                                     'bbref_position_percentile',
+                                                     'bbref_position_estimates',
+                                                     'bbref_salary',
+                                                     'espn_advance'])
+    save_feature_matrix(complete_feature_matrix,
+                        '../feature_selection/featurized_inputs/complete_feature_matrix.csv')
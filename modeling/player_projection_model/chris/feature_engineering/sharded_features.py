@@ -0,0 +1,218 @@
+# Project: Sharded Feature Engineering
+# Description: Out-of-core build of the complete feature matrix. Players are
+# split into shards by a stable hash of their id, every data source is streamed
+# into per-shard files in chunks, and the feature matrix is built one shard at a
+# time. Rolling averages never cross a player, so only the imputation means are
+# shared between shards; they are accumulated from every shard before any of
+# them are filled. Shard outputs are written to a partitioned store, listed in
+# a manifest that readers go through.
+# Data Sources: Basketball-Reference and ESPN
+# Last Updated: 10/19/2026
+
+import os
+import json
+import zlib
+import shutil
+import numpy as np
+import pandas as pd
+from feature_engineering import (DATA_SOURCE_PATHS, GroupMeanImputer, load_data_source,
+                                 merge_data_sources, metric_averages, refresh_targets)
+
+def player_shards(ids, n_shards):
+    """
+    Shard of every player id. crc32 of the id is used rather than hash() so
+    players land in the same shard in every run. Missing ids are all put in
+    the same shard.
+
+    Args:
+        ids (pandas Series): Player ids
+        n_shards (int): Number of shards
+
+    Returns:
+        shards (numpy array): Shard of every id
+    """
+    ids = ids.fillna('').astype(str)
+    unique_ids = ids.unique()
+    unique_shards = np.array([zlib.crc32(player_id.encode()) % n_shards for player_id in unique_ids])
+    return unique_shards[pd.Index(unique_ids).get_indexer(ids)]
+
+def shard_path(store_dir, part, shard, extension='csv'):
+    """
+    Path of one shard of one part of the store, e.g.
+    store_dir/raw/targets/shard=00003.csv.
+
+    Args:
+        store_dir (str): Root directory of the store
+        part (str): Part of the store, e.g. 'raw/targets' or 'feature_matrix'
+        shard (int): Shard number
+        extension (str): File extension (Default='csv')
+
+    Returns:
+        path (str): Path of the shard file
+    """
+    return os.path.join(store_dir, part, 'shard={0:05d}.{1}'.format(shard, extension))
+
+def clear_part(store_dir, part):
+    """
+    Removes one part of the store left over from an earlier build and
+    recreates it empty, so shards that are not written again are not read
+    back.
+
+    Args:
+        store_dir (str): Root directory of the store
+        part (str): Part of the store, e.g. 'raw/targets' or 'feature_matrix'
+    """
+    part_dir = os.path.join(store_dir, part)
+    if os.path.exists(part_dir):
+        shutil.rmtree(part_dir)
+    os.makedirs(part_dir)
+
+def partition_data_sources(data_source_list, store_dir, n_shards=16, chunksize=100000,
+                           paths=DATA_SOURCE_PATHS):
+    """
+    Streams the targets and every data source into one csv per shard under
+    store_dir/raw, reading chunksize rows at a time. ESPN rows are sharded by
+    the bbref_id of their espn_link in the player table. Each source's shards
+    from an earlier run are removed first.
+
+    Args:
+        data_source_list (list): Data sources to partition (see create_model_input)
+        store_dir (str): Root directory of the store
+        n_shards (int): Number of shards (Default=16)
+        chunksize (int): Rows to read at a time (Default=100000)
+        paths (dict): Data source paths (Default=DATA_SOURCE_PATHS)
+
+    Returns:
+        shard_rows (dict): Data source name to the number of rows in every shard
+    """
+    player_table = pd.read_csv(paths['player_table'], usecols=['espn_link', 'bbref_id'])\
+                     .drop_duplicates('espn_link').set_index('espn_link')['bbref_id']
+    shard_rows = {}
+    for data_source in ['targets', 'bbref_position_estimates'] + \
+                       [source for source in data_source_list if source != 'bbref_position_estimates']:
+        part = os.path.join('raw', data_source)
+        clear_part(store_dir, part)
+        shard_rows[data_source] = np.zeros(n_shards, dtype=int)
+        for i, chunk in enumerate(pd.read_csv(paths[data_source], chunksize=chunksize)):
+            if i == 0:
+                # Every shard gets a file with the header, even if no rows
+                for shard in range(n_shards):
+                    chunk.iloc[:0].to_csv(shard_path(store_dir, part, shard), index=False)
+            if data_source == 'espn_advance':
+                ids = chunk['espn_link'].map(player_table)
+            else:
+                ids = chunk['bbref_id' if 'bbref_id' in chunk.columns else 'BBREF_ID']
+            for shard, rows in chunk.groupby(player_shards(ids, n_shards)):
+                rows.to_csv(shard_path(store_dir, part, shard), mode='a', header=False, index=False)
+                shard_rows[data_source][shard] += len(rows)
+    return shard_rows
+
+def create_feature_matrix_sharded(data_source_list, store_dir, n_shards=16, chunksize=100000,
+                                  weighted=True, reliability_weight='MP', paths=DATA_SOURCE_PATHS):
+    """
+    Builds the complete feature matrix (see create_feature_matrix) one shard
+    of players at a time and writes every shard to
+    store_dir/feature_matrix/shard=NNNNN.pkl. Only one shard is held in memory
+    at once. The model_input and feature_matrix parts are cleared first, and
+    the shards written are listed in store_dir/feature_matrix/manifest.json.
+
+    The first pass joins the data sources onto each shard's targets
+    (create_model_input without imputing), writes the result to
+    store_dir/model_input and adds the shard's group sums and counts to the
+    imputer. The second pass fills each shard with the means of every shard
+    and adds its three-season averages (metrics_to_averages), so the output
+    matches the in-memory build apart from row order.
+
+    Args:
+        data_source_list (list): Data sources to join onto the target variable
+        store_dir (str): Root directory of the store
+        n_shards (int): Number of shards (Default=16)
+        chunksize (int): Rows to read at a time while partitioning (Default=100000)
+        weighted (boolean): Whether to weight the statistical average (Default=True)
+        reliability_weight (str): 'MP' or 'POSS' to add reliability-weighted
+        averages, or None (Default='MP')
+        paths (dict): Data source paths (Default=DATA_SOURCE_PATHS)
+
+    Returns:
+        shard_paths (list): Paths of the feature matrix shards
+    """
+    refresh_targets(paths)
+    shard_rows = partition_data_sources(data_source_list, store_dir, n_shards, chunksize, paths)
+    # Shards without any targets have nothing to build
+    shards = [shard for shard in range(n_shards) if shard_rows['targets'][shard] > 0]
+    for part in ['model_input', 'feature_matrix']:
+        clear_part(store_dir, part)
+
+    # First pass: join the data sources and accumulate the imputation means
+    imputer = GroupMeanImputer()
+    for shard in shards:
+        shard_paths = {source: shard_path(store_dir, os.path.join('raw', source), shard)
+                       for source in shard_rows}
+        shard_paths['player_table'] = paths['player_table']
+        data_sources = {source: load_data_source(source, shard_paths)
+                        for source in data_source_list if source != 'bbref_position_estimates'}
+        position_estimates = load_data_source('bbref_position_estimates', shard_paths)
+        if 'bbref_position_estimates' in data_source_list:
+            data_sources['bbref_position_estimates'] = position_estimates
+        model_input = merge_data_sources(load_data_source('targets', shard_paths),
+                                         data_sources, position_estimates)
+        imputer.partial_fit(model_input)
+        model_input.to_pickle(shard_path(store_dir, 'model_input', shard, 'pkl'))
+
+    # Second pass: impute and add the three-season averages
+    feature_paths = []
+    for shard in shards:
+        model_input = imputer.transform(pd.read_pickle(shard_path(store_dir, 'model_input', shard, 'pkl')))
+        model_input.columns = model_input.columns.str.upper()
+        averages = metric_averages(model_input, weighted=weighted,
+                                   reliability_weight=reliability_weight)
+        feature_paths.append(shard_path(store_dir, 'feature_matrix', shard, 'pkl'))
+        pd.concat([model_input, averages], axis=1).to_pickle(feature_paths[-1])
+    with open(os.path.join(store_dir, 'feature_matrix', 'manifest.json'), 'w') as f:
+        json.dump({'n_shards': n_shards,
+                   'shards': [os.path.basename(path) for path in feature_paths]}, f, indent=2)
+    return feature_paths
+
+def iter_feature_shards(store_dir, columns=None):
+    """
+    Reads the feature matrix shards listed in the manifest of the last build
+    back one at a time.
+
+    Args:
+        store_dir (str): Root directory of the store
+        columns (list): Columns to keep, or None for all (Default=None)
+
+    Yields:
+        shard (pandas DataFrame): One shard of the feature matrix
+    """
+    part_dir = os.path.join(store_dir, 'feature_matrix')
+    with open(os.path.join(part_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    for name in manifest['shards']:
+        shard = pd.read_pickle(os.path.join(part_dir, name))
+        yield shard if columns is None else shard[columns]
+
+def load_feature_shards(store_dir, columns=None):
+    """
+    Concatenates the feature matrix shards. Rows are grouped by shard.
+
+    Args:
+        store_dir (str): Root directory of the store
+        columns (list): Columns to keep, or None for all (Default=None)
+
+    Returns:
+        complete_feature_matrix (pandas DataFrame): The feature matrix
+    """
+    return pd.concat(iter_feature_shards(store_dir, columns), ignore_index=True)
+
+if __name__=='__main__':
+    # Build the complete feature matrix shard by shard
+    feature_paths = create_feature_matrix_sharded(['bbref_box_score',
+                                                   'bbref_measurements',
+                                                   'bbref_league_percentile',
+                                                   'bbref_position_percentile',
+                                                   'bbref_position_estimates',
+                                                   'bbref_salary',
+                                                   'espn_advance'],
+                                                  '../feature_selection/featurized_inputs/feature_shards')
+    print('Wrote {} feature matrix shards'.format(len(feature_paths)))
@@ -11,13 +11,85 @@ import imgkit
 import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error
-from sklearn.ensemble.partial_dependence import plot_partial_dependence
+from joblib import Parallel, delayed, effective_n_jobs
+from partial_dependence import compute_partial_dependence, plot_partial_dependence_curves
 
 # Plotting Style
 plt.style.use('fivethirtyeight')
 
+def masked_correlations(X, Y):
+    """
+    Pearson correlation of every column of X with every column of Y, each
+    pair over the rows where both are not null (as in DataFrame.corr), from
+    a handful of matrix products instead of a full correlation matrix.
+
+    Args:
+        X: rows x features numpy array
+        Y: rows x targets numpy array
+
+    Returns:
+        features x targets numpy array of correlations, NaN where a feature
+        or target is constant over the shared rows
+    """
+    x_mask = ~np.isnan(X)
+    y_mask = ~np.isnan(Y)
+    # Center on column means so the sums stay well conditioned
+    X = np.where(x_mask, X - np.nanmean(X, axis=0), 0.0)
+    Y = np.where(y_mask, Y - np.nanmean(Y, axis=0), 0.0)
+    x_mask = x_mask.astype(np.float64)
+    y_mask = y_mask.astype(np.float64)
+    n = x_mask.T @ y_mask
+    sum_x = X.T @ y_mask
+    sum_y = x_mask.T @ Y
+    sum_xx = (X ** 2).T @ y_mask
+    sum_yy = x_mask.T @ (Y ** 2)
+    sum_xy = X.T @ Y
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sum_xy - sum_x * sum_y / n
+        var_x = sum_xx - sum_x ** 2 / n
+        var_y = sum_yy - sum_y ** 2 / n
+        corr = cov / np.sqrt(var_x * var_y)
+    corr[(var_x <= 0) | (var_y <= 0) | (n < 2)] = np.nan
+    return np.clip(corr, -1, 1)
+
+def target_correlations(df, targets):
+    """
+    Pearson and Spearman correlations of every numeric column in df with
+    each target. Every column is ranked once per target, over the rows where
+    the target is not null, and both correlations are then calculated for all
+    columns at once. Columns with nulls in those rows are ranked again
+    together with the target over their shared rows, so the results match
+    DataFrame.corr.
+
+    Args:
+        df: pandas DataFrame contaning features and target variables.
+        targets (list): Names of target variables.
+
+    Returns:
+        pearson: pandas DataFrame of correlations, numeric columns x targets
+        spearman: pandas DataFrame of correlations, numeric columns x targets
+    """
+    numeric_df = df.select_dtypes(include=[np.number, 'bool'])
+    values = numeric_df.to_numpy(dtype=np.float64)
+    pearson = pd.DataFrame(masked_correlations(values, numeric_df[targets].to_numpy(dtype=np.float64)),
+                           index=numeric_df.columns, columns=targets)
+
+    spearman = pd.DataFrame(np.nan, index=numeric_df.columns, columns=targets)
+    for target in targets:
+        rows = numeric_df[target].notnull().values
+        ranks = numeric_df[rows].rank().to_numpy()
+        complete = ~np.isnan(ranks).any(axis=0)
+        spearman.loc[complete, target] = masked_correlations(
+            ranks[:, complete], ranks[:, [numeric_df.columns.get_loc(target)]])[:, 0]
+        for col in np.flatnonzero(~complete):
+            pair = numeric_df.iloc[rows, [col]].assign(TARGET=numeric_df.loc[rows, target]).dropna()
+            pair_ranks = pair.rank().to_numpy()
+            spearman.iloc[col, spearman.columns.get_loc(target)] = \
+                masked_correlations(pair_ranks[:, :1], pair_ranks[:, 1:])[0, 0]
+    return pearson, spearman
+
 def calculate_target_correlations(df, target):
     """
     Calculate pearson and spearman correlations between each feature and
@@ -26,54 +98,54 @@ def calculate_target_correlations(df, target):
 
     Args:
         df: pandas DataFrame contaning features and target variable.
-        target (string): Name of target variable to which all correlations
-        are calculated.
+        target (string or list): Name of target variable to which all
+        correlations are calculated, or a list of target variables (e.g.
+        SEASON_PLUS_1 to SEASON_PLUS_5) to rank against in one call.
 
     Returns:
         corr_df: pandas Dataframe with rank order of features from most to
-        least correlated with the target variable.
+        least correlated with the target variable. For a list of targets, the
+        rankings for every target stacked with a TARGET column.
     """
-    # Calculate pearson correlation of all numerical metrics in df
-    pearson_corr_df = df.corr(method='pearson')
-    # Select only correlations with target variable
-    pearson_corr_df = pearson_corr_df[target].reset_index()
-    pearson_corr_df.columns = ['STATISTIC', 'PEARSON_CORRELATION']
-    # Calculate absolute value of pearson correlation to create rank order of metrics
-    pearson_corr_df['PEARSON_CORRELATION_ABS'] = abs(pearson_corr_df['PEARSON_CORRELATION'])
-
-    # Calculate spearman correlation of all numberical metrics in df
-    spearman_corr_df = df.corr(method='spearman')
-    # Select only correlations with target variable
-    spearman_corr_df = spearman_corr_df[target].reset_index()
-    spearman_corr_df.columns = ['STATISTIC', 'SPEARMAN_CORRELATION']
-    # Calculate absolute value of spearman correlation to create rank order of metrics
-    spearman_corr_df['SPEARMAN_CORRELATION_ABS'] = abs(spearman_corr_df['SPEARMAN_CORRELATION'])
-
-    # Join pearson and spearman correlations
-    corr_df = (pearson_corr_df.merge(spearman_corr_df, on='STATISTIC')
-                              .sort_values(by='PEARSON_CORRELATION_ABS', ascending=False)
-                              .dropna()
-                              .round(3))
-    # Remove irrelivent metric RANK and target variable as that will always have
-    # a perfect correlation with itself
-    corr_df = corr_df[~corr_df['STATISTIC'].isin(['RANK', target])]
-    # Create rank of relationship strength based on absolute value of pearson correlation
-    corr_df['PEARSON_CORRELATION_RANK'] = range(1, 1+len(corr_df))
-    corr_df.sort_values(by='SPEARMAN_CORRELATION_ABS', ascending=False, inplace=True)
-    # Create rank of relationship strength based on absolute value of spearman correlation
-    corr_df['SPEARMAN_CORRELATION_RANK'] = range(1, 1+len(corr_df))
-    # Create an average rank based on correlation ranks
-    corr_df['AVERAGE_RANK'] = (corr_df[['PEARSON_CORRELATION_RANK',
-                                        'SPEARMAN_CORRELATION_RANK']]
-                                            .mean(axis=1)
-                                            .round(1))
-    corr_df.sort_values(by='AVERAGE_RANK', inplace=True)
-    corr_df = corr_df[['STATISTIC', 'PEARSON_CORRELATION',
-                       'PEARSON_CORRELATION_ABS', 'SPEARMAN_CORRELATION',
-                       'SPEARMAN_CORRELATION_ABS', 'PEARSON_CORRELATION_RANK',
-                       'SPEARMAN_CORRELATION_RANK', 'AVERAGE_RANK']]
-
-    return corr_df
+    targets = [target] if isinstance(target, str) else list(target)
+    # Calculate pearson and spearman correlations of all numerical metrics in
+    # df with the target variables
+    pearson, spearman = target_correlations(df, targets)
+
+    corr_dfs = []
+    for target_name in targets:
+        corr_df = pd.DataFrame({'STATISTIC': pearson.index,
+                                'PEARSON_CORRELATION': pearson[target_name].values,
+                                'SPEARMAN_CORRELATION': spearman[target_name].values})
+        # Calculate absolute value of correlations to create rank order of metrics
+        corr_df['PEARSON_CORRELATION_ABS'] = abs(corr_df['PEARSON_CORRELATION'])
+        corr_df['SPEARMAN_CORRELATION_ABS'] = abs(corr_df['SPEARMAN_CORRELATION'])
+        corr_df = (corr_df.sort_values(by='PEARSON_CORRELATION_ABS', ascending=False)
+                          .dropna()
+                          .round(3))
+        # Remove irrelivent metric RANK and target variable as that will always have
+        # a perfect correlation with itself
+        corr_df = corr_df[~corr_df['STATISTIC'].isin(['RANK', target_name])]
+        # Create rank of relationship strength based on absolute value of pearson correlation
+        corr_df['PEARSON_CORRELATION_RANK'] = range(1, 1+len(corr_df))
+        corr_df.sort_values(by='SPEARMAN_CORRELATION_ABS', ascending=False, inplace=True)
+        # Create rank of relationship strength based on absolute value of spearman correlation
+        corr_df['SPEARMAN_CORRELATION_RANK'] = range(1, 1+len(corr_df))
+        # Create an average rank based on correlation ranks
+        corr_df['AVERAGE_RANK'] = (corr_df[['PEARSON_CORRELATION_RANK',
+                                            'SPEARMAN_CORRELATION_RANK']]
+                                                .mean(axis=1)
+                                                .round(1))
+        corr_df.sort_values(by='AVERAGE_RANK', inplace=True)
+        corr_dfs.append(corr_df[['STATISTIC', 'PEARSON_CORRELATION',
+                                 'PEARSON_CORRELATION_ABS', 'SPEARMAN_CORRELATION',
+                                 'SPEARMAN_CORRELATION_ABS', 'PEARSON_CORRELATION_RANK',
+                                 'SPEARMAN_CORRELATION_RANK', 'AVERAGE_RANK']])
+
+    if isinstance(target, str):
+        return corr_dfs[0]
+    return pd.concat([corr_df.assign(TARGET=target_name) for corr_df, target_name in zip(corr_dfs, targets)],
+                     ignore_index=True)[['TARGET'] + list(corr_dfs[0].columns)]
 
 def plot_correlation_matrix(df, title):
     """
@@ -103,51 +175,121 @@ def plot_correlation_matrix(df, title):
     plt.tight_layout()
     plt.show()
 
-def permutation_importance(df, target, predictors):
+def feature_families(predictors, suffixes=('_3WAVG', '_3MWAVG', '_3AVG')):
+    """
+    Group predictors into feature families by suffix, e.g. every three-season
+    weighted average column, to permute together in permutation_importance.
+
+    Args:
+        predictors (list): List of features
+        suffixes (tuple): Suffixes that define the families
+
+    Returns:
+        groups: dict of family name (the suffix) to its features, for the
+        families with any predictors
+    """
+    groups = {suffix: [col for col in predictors if col.endswith(suffix)] for suffix in suffixes}
+    return {name: cols for name, cols in groups.items() if cols}
+
+def permuted_scores(model, X, y, column_sets, n_repeats, seeds):
+    """
+    RMSE of a fitted model with each set of columns shuffled, n_repeats times
+    per set. The shuffled values are written into one copy of X and put back
+    after every repeat, instead of copying the data for each shuffle.
+
+    Args:
+        model: Fitted regressor
+        X: rows x predictors numpy array of test data
+        y: numpy array of test targets
+        column_sets (list): Lists of column positions to shuffle together
+        n_repeats (int): Number of shuffles of each set
+        seeds (list): Seed for the numpy random Generator of each set
+
+    Returns:
+        len(column_sets) x n_repeats numpy array of RMSEs
+    """
+    buffer = X.copy()
+    scores = np.empty((len(column_sets), n_repeats))
+    for i, (cols, seed) in enumerate(zip(column_sets, seeds)):
+        rng = np.random.default_rng(seed)
+        for repeat in range(n_repeats):
+            # Rows of a set are shuffled together so families move as one
+            buffer[:, cols] = X[rng.permutation(len(X))[:, None], cols]
+            scores[i, repeat] = np.sqrt(mean_squared_error(y, model.predict(buffer)))
+        buffer[:, cols] = X[:, cols]
+    return scores
+
+def permutation_importance(df, target, predictors, n_repeats=10, groups=None,
+                           n_jobs=-1, random_state=None):
     """
     Calculate permutation importance by fitting a baseline model and then
     scoring the model with individual features randomly shuffled to determine
-    the increase in the overall error metric.
+    the increase in the overall error metric. A random column is added as a
+    reference for noise. The fitted model is shared by a pool of workers,
+    each shuffling its share of the features n_repeats times.
 
     Args:
         df: pandas DataFrame contaning features and target variable
         target (string): Name of target variable in the model
         predictors (list): List of features to use as predictors in the model
+        n_repeats (int): Number of times each feature is shuffled (Default=10)
+        groups (dict): Name to list of predictors to also shuffle together as
+        one, e.g. from feature_families. Names must differ from the predictors
+        and 'RANDOM' (Default=None)
+        n_jobs (int): Number of workers, -1 for all cores (Default=-1)
+        random_state (int): Seed for the split, model and shuffles (Default=None)
 
     Returns:
         scores_df: pandas Dataframe with rank order of features from most to
-        least predictive based on permutation importance.
+        least predictive based on permutation importance, with the mean and
+        standard deviation over the repeats.
     """
+    predictors = list(predictors)
+    rng = np.random.default_rng(random_state)
     # Train/Test Split
-    df_train, df_test = train_test_split(df, test_size=0.2)
-    X_train, y_train = df_train[predictors], df_train['SEASON_PLUS_1']
-    X_test, y_test = df_test[predictors], df_test['SEASON_PLUS_1']
-
+    df_train, df_test = train_test_split(df, test_size=0.2, random_state=random_state)
     # Add random column
-    X_train['RANDOM'] = np.random.random(size=len(X_train))
-    X_test['RANDOM'] = np.random.random(size=len(X_test))
-    predictors.append('RANDOM')
+    fields = list(predictors) + ['RANDOM']
+    X_train = np.column_stack([df_train[predictors].to_numpy(dtype=np.float64),
+                               rng.random(len(df_train))])
+    X_test = np.column_stack([df_test[predictors].to_numpy(dtype=np.float64),
+                              rng.random(len(df_test))])
+    y_train, y_test = df_train[target].values, df_test[target].values
 
     # Fit and score baseline model
-    rf = RandomForestRegressor()
+    rf = RandomForestRegressor(random_state=random_state)
     rf.fit(X_train, y_train)
-    y_pred = rf.predict(X_test)
-    baseline_score = np.sqrt(mean_squared_error(y_test, y_pred))
-
-    scores = {}
-    # Loop through columns, randomizing each and re-scoring model
-    for col in predictors:
-        temp_df = X_test.copy()
-        temp_df[[col]] = np.random.permutation(temp_df[[col]].values)
-        y_pred = rf.predict(temp_df)
-        scores[col] = round(np.sqrt(mean_squared_error(y_test, y_pred)), 4)
-
-    scores_df = pd.DataFrame.from_dict(scores, orient='index')\
-                            .reset_index()
-    # Calcukate difference in model error rmse between baseline model and
+    baseline_score = np.sqrt(mean_squared_error(y_test, rf.predict(X_test)))
+
+    # Each feature on its own, then each group of features together
+    column_sets = [[i] for i in range(len(fields))]
+    if groups is not None:
+        duplicates = [name for name in groups if name in fields]
+        if duplicates:
+            raise ValueError('Group names {} are also predictors, rename the groups'.format(duplicates))
+        for name, cols in groups.items():
+            missing = [col for col in cols if col not in predictors]
+            if missing:
+                raise ValueError("Group '{0}' has columns that are not predictors: {1}".format(name, missing))
+        column_sets = column_sets + [[fields.index(col) for col in cols] for cols in groups.values()]
+        fields = fields + list(groups)
+
+    # Split the features between the workers. Every feature has its own random
+    # stream, so the scores do not depend on the number of workers.
+    n_workers = min(len(column_sets), effective_n_jobs(n_jobs))
+    chunks = np.array_split(np.arange(len(column_sets)), n_workers)
+    seeds = np.random.SeedSequence(rng.integers(2**32)).spawn(len(column_sets))
+    scores = np.vstack(Parallel(n_jobs=n_workers)(
+        delayed(permuted_scores)(rf, X_test, y_test, [column_sets[i] for i in chunk], n_repeats,
+                                 [seeds[i] for i in chunk])
+        for chunk in chunks))
+
+    # Calculate difference in model error rmse between baseline model and
     # re-scored model
-    scores_df['baseline_diff'] = round(scores_df[0] - baseline_score, 4)
-    scores_df.columns = ['FIELD', 'RMSE', 'BASELINE_DIFFERENCE']
+    scores_df = pd.DataFrame({'FIELD': fields,
+                              'RMSE': scores.mean(axis=1).round(4),
+                              'BASELINE_DIFFERENCE': (scores.mean(axis=1) - baseline_score).round(4),
+                              'BASELINE_DIFFERENCE_STD': scores.std(axis=1).round(4)})
     scores_df.sort_values(by='BASELINE_DIFFERENCE', ascending=False, inplace=True)
     return scores_df
 
@@ -246,25 +388,15 @@ if __name__=='__main__':
     imgkit.from_string(html, 'plots/permutation_importance.png', {'width': 1})
 
     # Partial Dependence Plots
-    # List of curated feautres to examine independently
+    # List of curated feautres to examine independently. One model is fit on
+    # all of them and its curves are cached, so the plots below only read them
     curated_features = ['MP', 'TS%', 'PER100_3PA', 'PER100_FTA', 'PER100_ORTG', 'PER100_DRTG', 'PER100_AST', 'PER100_STL', 'PER100_BLK', 'PER100_ORB']
+    curves = compute_partial_dependence(bbref_box_score, 'SEASON_PLUS_1', curated_features,
+                                        'featurized_inputs/partial_dependence_curves.pkl')
     for feature in curated_features:
-        features = [feature]
-        gb = GradientBoostingRegressor()
-        gb.fit(bbref_box_score[features], bbref_box_score['SEASON_PLUS_1'])
-        fig, ax = plot_partial_dependence(gb, bbref_box_score[features], [0], feature_names=features, figsize=(8, 4))
-        plt.suptitle('{0} Partial Dependence Plot'.format(features[0]))
-        plt.tight_layout()
-        plt.show()
-
-    # Partial Dependence plot of model built on entire curated_features list
-    gb = GradientBoostingRegressor()
-    gb.fit(bbref_box_score[curated_features], bbref_box_score['SEASON_PLUS_1'])
-    fig, ax = plot_partial_dependence(gb, bbref_box_score[curated_features], [0, 1, 2, 3, 4, 5], feature_names=curated_features, figsize=(15, 8))
-    plt.suptitle('Partial Dependence Plots (Curated Features)')
-    plt.tight_layout()
-    plt.show()
+        plot_partial_dependence_curves(curves, [feature], '{0} Partial Dependence Plot'.format(feature),
+                                       n_cols=1, figsize=(8, 4))
 
-    fig, ax = plot_partial_dependence(gb, bbref_box_score[curated_features], [6, 7, 8, 9], feature_names=curated_features, figsize=(15, 8))
-    plt.tight_layout()
-    plt.show()
+    # Partial Dependence plots of the model built on entire curated_features list
+    plot_partial_dependence_curves(curves, curated_features[:6], 'Partial Dependence Plots (Curated Features)')
+    plot_partial_dependence_curves(curves, curated_features[6:], 'Partial Dependence Plots (Curated Features)')
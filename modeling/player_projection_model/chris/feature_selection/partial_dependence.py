@@ -0,0 +1,170 @@
+# Project: Partial Dependence
+# Description: Compute partial dependence (PD) and individual conditional
+# expectation (ICE) curves from one fitted model. Every grid point of a feature
+# is evaluated in batched predict calls, features are spread across cores, and
+# the curves are cached to disk so plots and reports read them back without
+# refitting.
+# Data Sources: Basketball-Reference and ESPN
+# Last Updated: 10/19/2026
+
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from sklearn.ensemble import GradientBoostingRegressor
+from joblib import Parallel, delayed
+
+def feature_grid(values, grid_resolution=100, percentiles=(0.05, 0.95)):
+    """
+    Grid of values to evaluate a feature at: its unique values if there are
+    fewer than grid_resolution, otherwise evenly spaced values between the
+    given percentiles.
+
+    Args:
+        values: numpy array of the feature
+        grid_resolution (int): Maximum number of grid points (Default=100)
+        percentiles (tuple): Lower and upper percentile of the grid
+        (Default=(0.05, 0.95))
+
+    Returns:
+        numpy array of grid values
+    """
+    values = values[~np.isnan(values)]
+    unique_values = np.unique(values)
+    if len(unique_values) < grid_resolution:
+        return unique_values
+    lower, upper = np.percentile(values, [100 * percentiles[0], 100 * percentiles[1]])
+    return np.linspace(lower, upper, grid_resolution)
+
+def feature_curves(model, X, col, grid, batch_size=1000000):
+    """
+    ICE curves of one feature: the prediction for every row with the feature
+    set to each grid value. Rows are stacked for as many grid values as fit
+    in batch_size rows and predicted in one call.
+
+    Args:
+        model: Fitted regressor
+        X: rows x features numpy array
+        col (int): Position of the feature in X
+        grid: numpy array of grid values
+        batch_size (int): Maximum number of rows per predict call
+        (Default=1000000)
+
+    Returns:
+        rows x grid numpy array of predictions
+    """
+    n_rows = len(X)
+    points_per_batch = max(1, batch_size // max(n_rows, 1))
+    individual = np.empty((n_rows, len(grid)))
+    for start in range(0, len(grid), points_per_batch):
+        points = grid[start:start + points_per_batch]
+        stacked = np.tile(X, (len(points), 1))
+        stacked[:, col] = np.repeat(points, n_rows)
+        individual[:, start:start + len(points)] = model.predict(stacked).reshape(len(points), n_rows).T
+    return individual
+
+def partial_dependence_curves(model, X, features, grid_resolution=100, percentiles=(0.05, 0.95),
+                              n_jobs=-1):
+    """
+    PD and ICE curves of every feature of a fitted model, in parallel across
+    features.
+
+    Args:
+        model: Fitted regressor
+        X: pandas DataFrame the model was fit on
+        features (list): Features to compute curves for
+        grid_resolution (int): Maximum number of grid points (Default=100)
+        percentiles (tuple): Lower and upper percentile of the grid
+        (Default=(0.05, 0.95))
+        n_jobs (int): Number of processes, -1 for all cores (Default=-1)
+
+    Returns:
+        curves (dict): Feature to its grid, average (PD) and individual (ICE)
+        curves
+    """
+    values = X.to_numpy(dtype=np.float64)
+    cols = [X.columns.get_loc(feature) for feature in features]
+    grids = [feature_grid(values[:, col], grid_resolution, percentiles) for col in cols]
+    individuals = Parallel(n_jobs=n_jobs)(delayed(feature_curves)(model, values, col, grid)
+                                          for col, grid in zip(cols, grids))
+    return {feature: {'grid': grid, 'average': individual.mean(axis=0), 'individual': individual}
+            for feature, grid, individual in zip(features, grids, individuals)}
+
+def compute_partial_dependence(df, target, model_features, cache_path, features=None,
+                               grid_resolution=100, percentiles=(0.05, 0.95), n_jobs=-1,
+                               random_state=0):
+    """
+    Fits a GradientBoostingRegressor once on model_features and computes the
+    PD and ICE curves of features. The curves are cached in cache_path with a
+    key of the data, features and settings, and read back from the cache
+    while none of them change.
+
+    Args:
+        df: pandas DataFrame contaning features and target variable
+        target (string): Name of target variable in the model
+        model_features (list): Features to fit the model on
+        cache_path (string): Path of the pickled curves
+        features (list): Features to compute curves for, or None for every
+        model feature (Default=None)
+        grid_resolution (int): Maximum number of grid points (Default=100)
+        percentiles (tuple): Lower and upper percentile of the grid
+        (Default=(0.05, 0.95))
+        n_jobs (int): Number of processes, -1 for all cores (Default=-1)
+        random_state (int): Seed of the model, so cached curves can be
+        reproduced (Default=0)
+
+    Returns:
+        curves (dict): Feature to its grid, average (PD) and individual (ICE)
+        curves
+    """
+    if features is None:
+        features = list(model_features)
+    data = df[list(model_features) + [target]]
+    key = hashlib.md5(pd.util.hash_pandas_object(data, index=False).values.tobytes() +
+                      json.dumps([target, list(model_features), list(features),
+                                  grid_resolution, list(percentiles), random_state]).encode()).hexdigest()
+    if os.path.exists(cache_path):
+        cached = pd.read_pickle(cache_path)
+        if cached['key'] == key:
+            return cached['curves']
+
+    gb = GradientBoostingRegressor(random_state=random_state)
+    gb.fit(data[model_features].to_numpy(dtype=np.float64), data[target].values)
+    curves = partial_dependence_curves(gb, data[model_features], features, grid_resolution,
+                                       percentiles, n_jobs)
+    pd.to_pickle({'key': key, 'curves': curves}, cache_path)
+    return curves
+
+def plot_partial_dependence_curves(curves, features, title, n_cols=3, ice_lines=50, figsize=(15, 8)):
+    """
+    Plots cached PD curves, with a sample of ICE curves behind them.
+
+    Args:
+        curves (dict): Output of compute_partial_dependence
+        features (list): Features to plot
+        title (string): Title to add to the resulting plot
+        n_cols (int): Number of plots per row (Default=3)
+        ice_lines (int): Number of ICE curves to draw per feature, 0 for none
+        (Default=50)
+        figsize (tuple): Figure size (Default=(15, 8))
+
+    Returns:
+        None
+    """
+    n_rows = int(np.ceil(len(features) / n_cols))
+    fig, axs = plt.subplots(nrows=n_rows, ncols=n_cols, figsize=figsize, squeeze=False)
+    for ax, feature in zip(axs.flat, features):
+        curve = curves[feature]
+        if ice_lines:
+            rows = np.linspace(0, len(curve['individual']) - 1, min(ice_lines, len(curve['individual']))).astype(int)
+            ax.plot(curve['grid'], curve['individual'][rows].T, color='grey', alpha=0.2, linewidth=1)
+        ax.plot(curve['grid'], curve['average'], linewidth=3)
+        ax.set_xlabel(feature, fontsize=12)
+    for ax in list(axs.flat)[len(features):]:
+        ax.axis('off')
+    axs[0, 0].set_ylabel('Partial Dependence', fontsize=12)
+    plt.suptitle(title)
+    plt.tight_layout()
+    plt.show()
@@ -5,6 +5,8 @@
 # Data Sources: Basketball-Reference and ESPN
 # Last Updated: 8/3/2019
 
+import os
+import sys
 import numpy as np
 import pandas as pd
 import imgkit
@@ -17,6 +19,10 @@ from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.metrics import mean_squared_error
 from sklearn.externals import joblib
 
+# Read the feature matrix with feature_engineering's compact loader
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'feature_engineering'))
+from feature_engineering import load_feature_matrix
+
 # Supress various warnings. Warnings won't surpress when gridsearch is run in
 # parallel
 import warnings
@@ -459,7 +465,7 @@ if __name__=='__main__':
     # Read in full dataset containing single-season and three-season weighted
     # averages for box score, league percentiles, position percentiles,
     # measurements, salary, and espn advanced data
-    complete_feature_matrix = pd.read_csv('../feature_selection/featurized_inputs/complete_feature_matrix.csv')
+    complete_feature_matrix = load_feature_matrix('../feature_selection/featurized_inputs/complete_feature_matrix.csv')
 
     # Instantiate Scoring and Parameter Dicitonaries to hold model outputs
     cross_val_scores = {}
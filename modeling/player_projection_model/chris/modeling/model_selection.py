@@ -7,6 +7,7 @@
 import numpy as np
 import pandas as pd
 import os
+import sys
 import imgkit
 import matplotlib.pyplot as plt
 from sklearn.model_selection import train_test_split, GridSearchCV, KFold, cross_val_score
@@ -17,6 +18,10 @@ from xgboost import XGBRegressor
 from catboost import CatBoostRegressor
 from sklearn.metrics import mean_squared_error
 
+# Read the feature matrix with feature_engineering's compact loader
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'feature_engineering'))
+from feature_engineering import load_feature_matrix
+
 # Avoid XGBoost Initialization Error
 os.environ['KMP_DUPLICATE_LIB_OK']='True'
 
@@ -75,7 +80,7 @@ def plot_cross_validation(X, y, models, scoring):
 
 if __name__=='__main__':
     # Read in featurized Basketball-Reference Totals, Per 100, and Advanced Data
-    bbref_box_score = pd.read_csv('../feature_selection/featurized_inputs/complete_feature_matrix.csv')
+    bbref_box_score = load_feature_matrix('../feature_selection/featurized_inputs/complete_feature_matrix.csv')
     # Filter to SEASON_PLUS_1 target variable and select relevant predictors
     bbref_box_score = (bbref_box_score[bbref_box_score['SEASON_PLUS_1'].notnull()]
                         [['BBREF_ID', 'SEASON', 'BLEND', 'SEASON_PLUS_1',
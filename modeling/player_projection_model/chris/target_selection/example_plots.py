@@ -2,6 +2,10 @@ import numpy as np
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'player_seasons'))
+from player_seasons import collapse_traded_seasons, load_player_seasons
 
 # Plotting Style
 plt.style.use('fivethirtyeight')
@@ -38,7 +42,8 @@ plt.show()
 player_table = pd.read_csv('../../../../data/player_ids/player_table.csv')
 espn_nba_rpm = pd.read_csv('../../../../data/nba/espn/espn_nba_rpm.csv')
 salary_df = pd.read_csv('../../../../data/nba/basketball_reference/player_data/salary/salary_info.csv')
-bbref_player_df = pd.read_csv('../../../../data/nba/basketball_reference/player_data/combined/bbref_player_data.csv')
+# Partial seasons resulting from trades removed (TOT only)
+bbref_player_df = load_player_seasons('../../../../data/nba/basketball_reference/player_data/combined/bbref_player_data.csv')
 
 # Convert season from yyyy to yyyy-yyyy to join on
 salary_df = salary_df[salary_df['season'].notnull()]
@@ -46,7 +51,9 @@ salary_df['season'] = salary_df.apply(lambda row: str(int(row['season'] - 1)) +
 espn_nba_rpm['season'] = espn_nba_rpm.apply(lambda row: str(row['season'] - 1) +  '-' +  str(row['season']), axis=1)
 
 # Aggregatre ESPN metrics to season level to avoid problem joining traded players
-espn_nba_rpm = espn_nba_rpm.groupby(['name', 'pos', 'espn_link', 'season']).mean().reset_index()
+espn_nba_rpm = collapse_traded_seasons(espn_nba_rpm, mode='aggregate',
+                                       keys=['name', 'pos', 'espn_link', 'season'],
+                                       team_col='team', agg_function='mean')
 
 # Join dataframes
 player_data = (pd.merge(bbref_player_df, player_table, how='left', left_on='BBREF_ID', right_on='bbref_id')
@@ -65,13 +72,8 @@ player_data['NET_RTG'] = player_data['PER100_ORtg'] - player_data['PER100_DRtg']
 # Create WOR metric
 player_data['WOR'] = player_data['VORP'] * 2.7
 
-# Remove partial seasons resulting from trades.
-player_data_no_trades = player_data[((player_data.groupby(['BBREF_ID', 'SEASON'])['TEAM'].transform('size')>1) &
-                        (player_data['TEAM']=='TOT')) |
-                        (player_data.groupby(['BBREF_ID', 'SEASON'])['TEAM'].transform('size')<=1)]
-
 # Vince Carter Example
-vince_carter_df = player_data_no_trades[player_data_no_trades['PLAYER']=='Vince Carter']
+vince_carter_df = player_data[player_data['PLAYER']=='Vince Carter']
 fig, ax = plt.subplots(figsize=(18, 5))
 sns.lineplot(x=np.arange(1, 16), y='BPM', data=vince_carter_df)
 ax.set_xticks(np.arange(1, 16))
@@ -84,7 +86,7 @@ plt.tight_layout()
 plt.show()
 
 # Kyle Korver Example
-kyle_korver_df = player_data_no_trades[player_data_no_trades['PLAYER']=='Kyle Korver']
+kyle_korver_df = player_data[player_data['PLAYER']=='Kyle Korver']
 fig, ax = plt.subplots(figsize=(18, 5))
 sns.lineplot(x=np.arange(1, 16), y='BPM', data=kyle_korver_df)
 ax.set_xticks(np.arange(1, 16))
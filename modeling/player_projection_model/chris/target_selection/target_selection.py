@@ -9,6 +9,13 @@
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+import os
+import sys
+import hashlib
+from joblib import Parallel, delayed
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'player_seasons'))
+from player_seasons import collapse_traded_seasons, load_player_seasons
+from player_panel import PlayerPanel
 
 # Plotting Style
 plt.style.use('fivethirtyeight')
@@ -100,7 +107,314 @@ def pad_corr_series(corr_list):
         too_long_start = (len(corr_list) - 10) // 2
       return np.array(corr_list[too_long_start:too_long_start+9])
 
-def plot_normalized_metric(metric, df_norm):
+def pack_player_metrics(df, metrics, player_col='PLAYER'):
+    """
+    Packs each player's season histories of every metric into one padded
+    array, players sorted by player_col and seasons in the order of df.
+
+    Args:
+        df (DataFrame): One row per player/season
+        metrics (list): Metrics to pack
+        player_col (string): Column identifying a player (Default='PLAYER')
+
+    Returns:
+        players (array): Player of every row of values
+        values (array): players x metrics x seasons array, padded with zeros
+        lengths (array): Number of seasons of every player
+    """
+    panel = PlayerPanel(df, player_col, metrics)
+    return panel.players[player_col].values, panel.padded(), panel.lengths
+
+def lagged_cross_correlations(values, lengths, other=None, max_lag=None):
+    """
+    Full discrete cross-correlation (see np.correlate) between every pair of
+    metrics for every player at once. Each lag is one batched product over
+    all players and metric pairs. As with np.correlate, a lag whose overlap
+    includes a missing value is NaN.
+
+    Args:
+        values (array): players x metrics x seasons array from pack_player_metrics
+        lengths (array): Number of seasons of every player
+        other (array): Array like values to take the second metric of each
+        pair from, or None to use values (Default=None)
+        max_lag (int): Only calculate lags up to max_lag seasons either way,
+        or None for every lag (Default=None)
+
+    Returns:
+        corr (array): players x metrics x metrics x lags array, lags running
+        from -(seasons-1) to seasons-1 (or -max_lag to max_lag). Lags longer
+        than a player's history are -inf.
+    """
+    if other is None:
+        other = values
+    n_seasons = values.shape[2]
+    observed = (np.arange(n_seasons) < lengths[:, None]).astype(np.float64)
+    missing = np.isnan(values)
+    filled = np.where(missing, 0.0, values)
+    missing = missing.astype(np.float64)
+    other_missing = np.isnan(other)
+    other_filled = np.where(other_missing, 0.0, other)
+    other_missing = other_missing.astype(np.float64)
+    n_lags = n_seasons - 1 if max_lag is None else min(max_lag, n_seasons - 1)
+    corr = np.empty(values.shape[:2] + other.shape[1:2] + (2 * n_lags + 1,))
+    for k in range(-n_lags, n_lags + 1):
+        # Seasons t + k of the first metric against seasons t of the second
+        first = slice(max(k, 0), n_seasons + min(k, 0))
+        second = slice(max(-k, 0), n_seasons - max(k, 0))
+        lag_corr = np.einsum('pit,pjt->pij', filled[:, :, first], other_filled[:, :, second])
+        # Overlapping observed seasons where either metric is missing
+        missing_pairs = np.einsum('pit,pt->pi', missing[:, :, first], observed[:, second])[:, :, None] + \
+                        np.einsum('pt,pjt->pj', observed[:, first], other_missing[:, :, second])[:, None, :] - \
+                        np.einsum('pit,pjt->pij', missing[:, :, first], other_missing[:, :, second])
+        lag_corr[missing_pairs > 0] = np.nan
+        lag_corr[np.abs(k) >= lengths] = -np.inf
+        corr[:, :, :, k + n_lags] = lag_corr
+    return corr
+
+def cross_correlation_lags(corr):
+    """
+    Season lag at which every pair of metrics is most correlated for every
+    player (see cross_correlation).
+
+    Args:
+        corr (array): Output of lagged_cross_correlations
+
+    Returns:
+        Integer array of players x metrics x metrics lags
+    """
+    n_seasons = (corr.shape[3] + 1) // 2
+    # np.argmax returns the first NaN, as in cross_correlation
+    return -(np.argmax(corr, axis=3) - (n_seasons - 1))
+
+def norm_cross_correlations(corr):
+    """
+    Normalized cross-correlation of every pair of metrics for every player
+    at the nine central lags, -4 to 4, padded with zeros where a player's
+    history is shorter (see norm_cross_correlation and pad_corr_series).
+
+    Args:
+        corr (array): Output of lagged_cross_correlations, with every lag or
+        a max_lag of at least 4
+
+    Returns:
+        players x metrics x metrics x 9 array of normalized correlations
+    """
+    n_seasons = (corr.shape[3] + 1) // 2
+    # Pad out to at least the nine central lags
+    if n_seasons < 5:
+        corr = np.pad(corr, ((0, 0), (0, 0), (0, 0), (5 - n_seasons, 5 - n_seasons)),
+                      mode='constant', constant_values=-np.inf)
+        n_seasons = 5
+    central_corr = np.abs(corr[:, :, :, n_seasons-5:n_seasons+4])
+    central_corr[np.isinf(central_corr)] = 0.0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.nan_to_num(central_corr / np.sum(central_corr, axis=3, keepdims=True))
+
+def shuffle_seasons(values, lengths, n_permutations, rng):
+    """
+    Shuffles the order of each player's seasons, independently for every
+    permutation. Padding past a player's last season stays in place.
+
+    Args:
+        values (array): players x seasons array
+        lengths (array): Number of seasons of every player
+        n_permutations (int): Number of shuffles
+        rng (Generator): numpy random Generator
+
+    Returns:
+        permutations x players x seasons array of shuffled histories
+    """
+    n_players, n_seasons = values.shape
+    keys = rng.random((n_permutations, n_players, n_seasons))
+    keys[:, np.arange(n_seasons) >= lengths[:, None]] = np.inf
+    return np.take_along_axis(np.broadcast_to(values, keys.shape), np.argsort(keys, axis=2), axis=2)
+
+def pair_permutation_test(first, second, lengths, n_permutations=1000, n_bootstrap=1000,
+                          batch_size=100, seed=None):
+    """
+    Permutation and bootstrap test of the normalized cross-correlation between
+    two metrics at each of the nine central lags (see norm_cross_correlations).
+
+    The null distribution shuffles the order of the second metric's seasons
+    within each player, which keeps each player's values but breaks any lead
+    or lag. Each batch of permutations is cross-correlated for every player
+    at once. The bootstrap resamples players to put a confidence band on the
+    observed density.
+
+    Args:
+        first (array): players x seasons array of the first metric
+        second (array): players x seasons array of the second metric
+        lengths (array): Number of seasons of every player
+        n_permutations (int): Number of within-player shuffles (Default=1000)
+        n_bootstrap (int): Number of player resamples (Default=1000)
+        batch_size (int): Permutations cross-correlated at once (Default=100)
+        seed: Seed for the numpy random Generator (Default=None)
+
+    Returns:
+        test (dict): observed density at each lag, one-sided p_values that
+        the density is this high by chance, the 95% null band (null_lower,
+        null_upper) and the 95% bootstrap band (boot_lower, boot_upper)
+    """
+    rng = np.random.default_rng(seed)
+    n_players = len(lengths)
+    player_norm = norm_cross_correlations(
+        lagged_cross_correlations(first[:, None, :], lengths, second[:, None, :], 4))[:, 0, 0]
+    observed = player_norm.sum(axis=0)
+
+    null = np.empty((n_permutations, 9))
+    for start in range(0, n_permutations, batch_size):
+        batch = min(batch_size, n_permutations - start)
+        shuffled = shuffle_seasons(second, lengths, batch, rng).reshape(batch * n_players, -1)
+        norm = norm_cross_correlations(
+            lagged_cross_correlations(np.tile(first, (batch, 1))[:, None, :],
+                                      np.tile(lengths, batch), shuffled[:, None, :], 4))[:, 0, 0]
+        null[start:start + batch] = norm.reshape(batch, n_players, 9).sum(axis=1)
+
+    # Resample players as counts of how many times each is drawn
+    draws = rng.multinomial(n_players, np.full(n_players, 1.0 / n_players), size=n_bootstrap)
+    boot = draws @ player_norm
+    return {'observed': observed,
+            'p_values': (1 + (null >= observed).sum(axis=0)) / (1 + n_permutations),
+            'null_lower': np.percentile(null, 2.5, axis=0),
+            'null_upper': np.percentile(null, 97.5, axis=0),
+            'boot_lower': np.percentile(boot, 2.5, axis=0),
+            'boot_upper': np.percentile(boot, 97.5, axis=0)}
+
+def lag_permutation_tests(values, lengths, metrics, n_permutations=1000, n_bootstrap=1000,
+                          batch_size=100, n_jobs=-1, random_state=0):
+    """
+    Runs pair_permutation_test for every pair of metrics, in parallel across
+    pairs. Every pair gets its own random stream spawned from random_state,
+    so results do not depend on n_jobs.
+
+    Args:
+        values (array): players x metrics x seasons array from pack_player_metrics
+        lengths (array): Number of seasons of every player
+        metrics (list): Names of the metrics in values
+        n_permutations (int): Number of within-player shuffles (Default=1000)
+        n_bootstrap (int): Number of player resamples (Default=1000)
+        batch_size (int): Permutations cross-correlated at once (Default=100)
+        n_jobs (int): Number of processes, -1 for all cores (Default=-1)
+        random_state (int): Seed (Default=0)
+
+    Returns:
+        DataFrame with one row per metric pair and lag (-4 to 4) of the
+        observed density, p-value and null and bootstrap bands
+    """
+    pairs = [(i, j) for i in range(len(metrics)) for j in range(len(metrics)) if i != j]
+    seeds = np.random.SeedSequence(random_state).spawn(len(pairs))
+    tests = Parallel(n_jobs=n_jobs)(delayed(pair_permutation_test)(values[:, i], values[:, j], lengths,
+                                                                   n_permutations, n_bootstrap,
+                                                                   batch_size, seed)
+                                    for (i, j), seed in zip(pairs, seeds))
+    return pd.concat([pd.DataFrame(dict({'METRIC_PAIR': metrics[i] + '_' + metrics[j],
+                                         'SEASON_LAG': np.arange(-4, 5)},
+                                        **{key.upper(): value for key, value in test.items()}))
+                      for (i, j), test in zip(pairs, tests)], ignore_index=True)
+
+# Season lags counted in the lag histograms
+SEASON_LAGS = np.arange(-15, 15, 1)
+
+# Lag study cache, next to this module (ignored by git) wherever it is run from
+LAG_STUDY_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'lag_study_cache.pkl')
+
+def player_fingerprints(values, lengths):
+    """
+    md5 of each player's packed metric history, used as the version of the
+    player's data in the lag study cache.
+
+    Args:
+        values (array): players x metrics x seasons array from pack_player_metrics
+        lengths (array): Number of seasons of every player
+
+    Returns:
+        List of hex digests, one per player
+    """
+    return [hashlib.md5(np.ascontiguousarray(values[p, :, :lengths[p]]).tobytes()).hexdigest()
+            for p in range(len(lengths))]
+
+def lag_histograms(lags, norm_corr):
+    """
+    Per metric pair histogram of the season lags and sum of the normalized
+    cross-correlations over a set of players.
+
+    Args:
+        lags (array): players x metrics x metrics array from cross_correlation_lags
+        norm_corr (array): players x metrics x metrics x 9 array from
+        norm_cross_correlations
+
+    Returns:
+        lag_counts (array): metrics x metrics x SEASON_LAGS player counts
+        norm_sums (array): metrics x metrics x 9 summed normalized correlations
+    """
+    n_metrics = lags.shape[1]
+    lag_counts = np.zeros((n_metrics, n_metrics, len(SEASON_LAGS)), dtype=np.int64)
+    in_range = (lags >= SEASON_LAGS[0]) & (lags <= SEASON_LAGS[-1])
+    pairs = np.broadcast_to(np.arange(n_metrics * n_metrics).reshape(1, n_metrics, n_metrics), lags.shape)
+    np.add.at(lag_counts.reshape(-1, len(SEASON_LAGS)),
+              (pairs[in_range], lags[in_range] - SEASON_LAGS[0]), 1)
+    return lag_counts, norm_corr.sum(axis=0)
+
+def update_lag_study(df, metrics, cache_path=LAG_STUDY_CACHE, player_col='PLAYER'):
+    """
+    Runs the lag study, reusing the cached results of every player whose data
+    has not changed since the last run. Only new or changed players are
+    recomputed, and the lag histograms are updated by taking out the old
+    results of those players and adding their new ones.
+
+    Args:
+        df (DataFrame): One row per player/season
+        metrics (list): Metrics to cross-correlate
+        cache_path (string): Path of the pickled lag study
+        (Default=LAG_STUDY_CACHE)
+        player_col (string): Column identifying a player (Default='PLAYER')
+
+    Returns:
+        study (dict): players, fingerprints, lags and norm_corr for every
+        player, the lag_counts and norm_sums histograms, and the players that
+        were recomputed
+    """
+    players, values, lengths = pack_player_metrics(df, metrics, player_col)
+    fingerprints = player_fingerprints(values, lengths)
+    cached = pd.read_pickle(cache_path) if os.path.exists(cache_path) else None
+    if cached is None or cached['metrics'] != list(metrics):
+        cached = {'metrics': list(metrics), 'players': np.array([], dtype=object),
+                  'fingerprints': [],
+                  'lags': np.zeros((0, len(metrics), len(metrics)), dtype=np.int64),
+                  'norm_corr': np.zeros((0, len(metrics), len(metrics), 9))}
+        cached['lag_counts'], cached['norm_sums'] = lag_histograms(cached['lags'], cached['norm_corr'])
+
+    # Line up every current player with their cached results
+    cached_index = pd.Index(cached['players']).get_indexer(players)
+    cached_fingerprints = np.array(cached['fingerprints'] + [None], dtype=object)[cached_index]
+    changed = cached_fingerprints != np.array(fingerprints, dtype=object)
+    # Cached players that changed or are gone come out of the histograms
+    stale = np.ones(len(cached['players']), dtype=bool)
+    stale[cached_index[~changed]] = False
+    old_counts, old_sums = lag_histograms(cached['lags'][stale], cached['norm_corr'][stale])
+
+    lags = np.zeros((len(players), len(metrics), len(metrics)), dtype=np.int64)
+    norm_corr = np.zeros((len(players), len(metrics), len(metrics), 9))
+    lags[~changed] = cached['lags'][cached_index[~changed]]
+    norm_corr[~changed] = cached['norm_corr'][cached_index[~changed]]
+    if changed.any():
+        changed_values = values[changed][:, :, :lengths[changed].max()]
+        corr = lagged_cross_correlations(changed_values, lengths[changed])
+        lags[changed] = cross_correlation_lags(corr)
+        norm_corr[changed] = norm_cross_correlations(corr)
+    new_counts, new_sums = lag_histograms(lags[changed], norm_corr[changed])
+
+    study = {'metrics': list(metrics), 'players': players, 'fingerprints': fingerprints,
+             'lags': lags, 'norm_corr': norm_corr,
+             'lag_counts': cached['lag_counts'] - old_counts + new_counts,
+             'norm_sums': cached['norm_sums'] - old_sums + new_sums}
+    if not os.path.exists(os.path.dirname(os.path.abspath(cache_path))):
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)))
+    pd.to_pickle(study, cache_path)
+    study['recomputed'] = players[changed]
+    return study
+
+def plot_normalized_metric(metric, df_norm, lag_tests=None):
     """
     Plots eight seperate figures each displaying the season lags between a given
     metric and all other metrics.
@@ -110,6 +424,8 @@ def plot_normalized_metric(metric, df_norm):
         'RPM', 'BPM', 'VORP', 'WOR', 'MP', 'WINS', 'SALARY', and 'SALARY_PROP_CAP'
         df_norm (DataFrame): Pandas DataFrame containing normalized cross
         correlation.
+        lag_tests (DataFrame): Output of lag_permutation_tests, to shade the 95%
+        band of the density under shuffled seasons (Default=None)
 
     Returns:
         None
@@ -138,6 +454,11 @@ def plot_normalized_metric(metric, df_norm):
     axs[1, 2].set_title('{0} vs. {1}'.format(metric, metric_list[5]), fontsize=12)
     axs[2, 0].set_title('{0} vs. {1}'.format(metric, metric_list[6]), fontsize=12)
     axs[2, 1].set_title('{0} vs. {1}'.format(metric, metric_list[7]), fontsize=12)
+    if lag_tests is not None:
+        for ax, metric2 in zip(axs.flat, metric_list):
+            pair_tests = lag_tests[lag_tests['METRIC_PAIR'] == metric + '_' + metric2]
+            ax.fill_between(pair_tests['SEASON_LAG'], pair_tests['NULL_LOWER'], pair_tests['NULL_UPPER'],
+                            color='grey', alpha=0.4)
     axs[2, 2].grid(False)
     plt.suptitle('{0} Normalized Cross Correlation'.format(metric), fontsize=20)
     plt.tight_layout()
@@ -149,7 +470,8 @@ if __name__=='__main__':
     player_table = pd.read_csv('../../../../data/player_ids/player_table.csv')
     espn_nba_rpm = pd.read_csv('../../../../data/nba/espn/espn_nba_rpm.csv')
     salary_df = pd.read_csv('../../../../data/nba/basketball_reference/player_data/salary/salary_info.csv')
-    bbref_player_df = pd.read_csv('../../../../data/nba/basketball_reference/player_data/combined/bbref_player_data.csv')
+    # Partial seasons resulting from trades removed (TOT only)
+    bbref_player_df = load_player_seasons('../../../../data/nba/basketball_reference/player_data/combined/bbref_player_data.csv')
 
     # Convert season from yyyy to yyyy-yyyy to join on
     salary_df = salary_df[salary_df['season'].notnull()]
@@ -157,7 +479,9 @@ if __name__=='__main__':
     espn_nba_rpm['season'] = espn_nba_rpm.apply(lambda row: str(row['season'] - 1) +  '-' +  str(row['season']), axis=1)
 
     # Aggregatre ESPN metrics to season level to avoid problem joining traded players
-    espn_nba_rpm = espn_nba_rpm.groupby(['name', 'pos', 'espn_link', 'season']).mean().reset_index()
+    espn_nba_rpm = collapse_traded_seasons(espn_nba_rpm, mode='aggregate',
+                                           keys=['name', 'pos', 'espn_link', 'season'],
+                                           team_col='team', agg_function='mean')
 
     # Join dataframes
     player_data = (pd.merge(bbref_player_df, player_table, how='left', left_on='BBREF_ID', right_on='bbref_id')
@@ -176,31 +500,22 @@ if __name__=='__main__':
     # Create WOR metric
     player_data['WOR'] = player_data['VORP'] * 2.7
 
-    # Remove partial seasons resulting from trades.
-    player_data_no_trades = player_data[((player_data.groupby(['BBREF_ID', 'SEASON'])['TEAM'].transform('size')>1) &
-                            (player_data['TEAM']=='TOT')) |
-                            (player_data.groupby(['BBREF_ID', 'SEASON'])['TEAM'].transform('size')<=1)]
+    # Cross-correlate every pair of metrics for every player, recomputing
+    # only the players whose data changed since the cached run
+    metric_list = ['NET_RTG', 'RPM', 'BPM', 'VORP', 'WOR', 'MP', 'WINS', 'SALARY', 'SALARY_PROP_CAP']
+    study = update_lag_study(player_data, metric_list, LAG_STUDY_CACHE)
+    pairs = [(i, j, str(metric1 + '_' + metric2)) for i, metric1 in enumerate(metric_list)
+             for j, metric2 in enumerate(metric_list) if metric1 != metric2]
 
     # Non-Normalized Cross-Correlation
-    df_non_norm = player_data_no_trades.groupby(['PLAYER'])['NET_RTG'].apply(list).reset_index()
-    # For each player (row) collect each metric into a list within a column
-    for metric in ['RPM', 'BPM', 'VORP', 'WOR', 'MP', 'WINS', 'SALARY', 'SALARY_PROP_CAP']:
-        df_non_norm[metric] = player_data_no_trades.groupby(['PLAYER'])[metric].apply(list).reset_index()[metric]
-
-    for metric1 in ['NET_RTG', 'RPM', 'BPM', 'VORP', 'WOR', 'MP', 'WINS', 'SALARY', 'SALARY_PROP_CAP']:
-        for metric2 in ['NET_RTG', 'RPM', 'BPM', 'VORP', 'WOR', 'MP', 'WINS', 'SALARY', 'SALARY_PROP_CAP']:
-            if metric1 != metric2:
-                # Create a new column for each player (row) that includes the season lag between two metrics
-                df_non_norm[str(metric1 + '_' + metric2)] = df_non_norm.apply(lambda row: cross_correlation(row[metric1], row[metric2]), axis=1)
-
-    # Aggregate to one dataframe
-    corr_df = pd.DataFrame(np.arange(-15, 15, 1), columns=['SEASON_LAG'])
-    for metric1 in ['NET_RTG', 'RPM', 'BPM', 'VORP', 'WOR', 'MP', 'WINS', 'SALARY', 'SALARY_PROP_CAP']:
-        for metric2 in ['NET_RTG', 'RPM', 'BPM', 'VORP', 'WOR', 'MP', 'WINS', 'SALARY', 'SALARY_PROP_CAP']:
-            if metric1 != metric2:
-                df = df_non_norm[str(metric1 + '_' + metric2)].value_counts().reset_index().sort_values(by='index', ascending=False)
-                corr_df = pd.merge(corr_df, df, how='left', left_on='SEASON_LAG', right_on='index')
-    corr_df = corr_df[[col for col in corr_df.columns if 'index' not in col]]
+    # Season lag between each two metrics for each player (row)
+    df_non_norm = pd.DataFrame({pair: study['lags'][:, i, j] for i, j, pair in pairs})
+    df_non_norm.insert(0, 'PLAYER', study['players'])
+
+    # Aggregate to one dataframe of player counts at each lag
+    corr_df = pd.DataFrame(SEASON_LAGS, columns=['SEASON_LAG'])
+    for i, j, pair in pairs:
+        corr_df[pair] = np.where(study['lag_counts'][i, j] > 0, study['lag_counts'][i, j], np.nan)
 
     # Example: Plot Histogram of Non-Normalized Lags (MP vs. BPM, VORP, NET RATING)
     fig, axs = plt.subplots(nrows=1, ncols=3, figsize=(18, 5), sharex=True, sharey=True)
@@ -218,23 +533,16 @@ if __name__=='__main__':
     plt.show()
 
     # Normalized Cross-Correlation
-    df_norm = player_data_no_trades.groupby(['PLAYER'])['NET_RTG'].apply(list).reset_index()
-    for metric in ['RPM', 'BPM', 'VORP', 'WOR', 'MP', 'WINS', 'SALARY', 'SALARY_PROP_CAP']:
-        # For each player (row) collect each metric into a list within a column
-        df_norm[metric] = player_data_no_trades.groupby(['PLAYER'])[metric].apply(list).reset_index()[metric]
-
-    for metric1 in ['NET_RTG', 'RPM', 'BPM', 'VORP', 'WOR', 'MP', 'WINS', 'SALARY', 'SALARY_PROP_CAP']:
-        for metric2 in ['NET_RTG', 'RPM', 'BPM', 'VORP', 'WOR', 'MP', 'WINS', 'SALARY', 'SALARY_PROP_CAP']:
-            if metric1 != metric2:
-                # Create a new column for each player (row) that includes the cross-correlation between two metrics
-                df_norm[str(metric1 + '_' + metric2)] = df_norm.apply(lambda row: norm_cross_correlation(row[metric1], row[metric2]), axis=1)
-
+    # Cross-correlation between each two metrics for each player (row)
+    df_norm = pd.DataFrame({pair: list(study['norm_corr'][:, i, j]) for i, j, pair in pairs})
+    df_norm.insert(0, 'PLAYER', study['players'])
 
     # Example: Plot Histogram of Normalized Lags (MP vs. BPM, VORP, NET RATING)
     fig, axs = plt.subplots(nrows=1, ncols=3, figsize=(18, 5), sharex=True, sharey=True)
-    density_hist1 = np.sum(np.vstack(tuple(pad_corr_series(x) for x in df_norm['MP_BPM'])), axis=0)
-    density_hist2 = np.sum(np.vstack(tuple(pad_corr_series(x) for x in df_norm['MP_VORP'])), axis=0)
-    density_hist3 = np.sum(np.vstack(tuple(pad_corr_series(x) for x in df_norm['MP_NET_RTG'])), axis=0)
+    mp = metric_list.index('MP')
+    density_hist1 = study['norm_sums'][mp, metric_list.index('BPM')]
+    density_hist2 = study['norm_sums'][mp, metric_list.index('VORP')]
+    density_hist3 = study['norm_sums'][mp, metric_list.index('NET_RTG')]
     density_bins = np.arange(-4, 5)
     axs[0].bar(density_bins, density_hist1)
     axs[1].bar(density_bins, density_hist2)
@@ -249,6 +557,12 @@ if __name__=='__main__':
     plt.subplots_adjust(top=0.85)
     plt.show()
 
+    # Permutation tests: p-values and 95% bands of the density at each lag
+    # with every player's seasons shuffled
+    players, values, lengths = pack_player_metrics(player_data, metric_list)
+    lag_tests = lag_permutation_tests(values, lengths, metric_list)
+    print(lag_tests[lag_tests['METRIC_PAIR'].isin(['MP_BPM', 'MP_VORP', 'MP_NET_RTG'])])
+
     # Plot all cross-correlations for each individual metric
     for metric in ['NET_RTG', 'RPM', 'BPM', 'VORP', 'WOR', 'MP', 'WINS', 'SALARY', 'SALARY_PROP_CAP']:
-        plot_normalized_metric(metric, df_norm)
+        plot_normalized_metric(metric, df_norm, lag_tests)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PURPOSE:
+    Player time-series panel shared by the rolling features, target pivots
+    and lag studies. Rows are sorted by player once into contiguous NumPy
+    arrays, with each player's rows between two offsets, so leads, lags and
+    per-player histories are read off by position instead of regrouping the
+    data frame for every metric.
+"""
+
+import numpy as np
+import pandas as pd
+
+class PlayerPanel(object):
+    '''
+    Metrics of a player|season table sorted by player, keeping each player's
+    rows in their original order (or sorted by season_col).
+
+    Attributes:
+        players: Data.Frame of the player columns, one row per player
+        offsets: The rows of player p are offsets[p] to offsets[p + 1]
+        order: Position in the original table of every panel row
+        metrics: Names of the metric columns
+        values: rows x metrics array of the metrics in panel order
+    '''
+
+    def __init__(self, df, player_cols, metrics, season_col=None):
+        '''
+        Args:
+            df: Data.Frame with one row per player|season
+            player_cols: Column name(s) identifying a player. Rows with a
+                missing id are each their own player
+            metrics: Columns to put in the panel
+            season_col: Column to sort each player's rows by, or None to
+                keep the order of df
+        '''
+        self.player_cols = [player_cols] if isinstance(player_cols, str) else list(player_cols)
+        if len(self.player_cols) == 1:
+            codes = pd.factorize(df[self.player_cols[0]], sort=True)[0].astype(np.float64)
+            codes[codes < 0] = np.nan
+        else:
+            codes = df.groupby(self.player_cols, sort=True).ngroup().to_numpy(dtype=np.float64)
+        missing = np.isnan(codes)
+        n_ids = int(np.nanmax(codes)) + 1 if (~missing).any() else 0
+        codes[missing] = n_ids + np.arange(missing.sum())
+        codes = codes.astype(np.int64)
+
+        if season_col is None:
+            self.order = np.argsort(codes, kind='mergesort')
+        else:
+            self.order = np.lexsort((df[season_col].to_numpy(), codes))
+        codes = codes[self.order]
+        self.offsets = np.searchsorted(codes, np.arange(n_ids + missing.sum() + 1))
+        self.players = df[self.player_cols].iloc[self.order[self.offsets[:-1]]].reset_index(drop=True)
+        self.metrics = list(metrics)
+        self.values = np.ascontiguousarray(df[self.metrics].to_numpy(dtype=np.float64)[self.order])
+
+    @property
+    def lengths(self):
+        '''Number of rows of every player'''
+        return np.diff(self.offsets)
+
+    @property
+    def position(self):
+        '''Position of every panel row within its player's rows'''
+        return np.arange(len(self.order)) - np.repeat(self.offsets[:-1], self.lengths)
+
+    def columns(self, metrics=None):
+        '''
+        Args:
+            metrics: Metric name(s), or None for every metric
+        Return:
+            The values of the metrics, rows x metrics in panel order
+        '''
+        if metrics is None:
+            return self.values
+        if isinstance(metrics, str):
+            metrics = [metrics]
+        return self.values[:, [self.metrics.index(metric) for metric in metrics]]
+
+    def shift(self, k, metrics=None):
+        '''
+        Shift the metrics k rows within every player, NA where the shift runs
+        past the player's first or last row.
+
+        Args:
+            k: Rows to shift, positive for earlier rows (lags) and negative
+                for later rows (leads)
+            metrics: Metric name(s), or None for every metric
+        Return:
+            rows x metrics array in panel order
+        '''
+        values = self.columns(metrics)
+        shifted = np.full(values.shape, np.nan)
+        n = len(values)
+        if abs(k) >= n:
+            return shifted
+        if k >= 0:
+            shifted[k:] = values[:n - k]
+            shifted[self.position < k] = np.nan
+        else:
+            shifted[:n + k] = values[-k:]
+            shifted[np.repeat(self.lengths, self.lengths) - self.position <= -k] = np.nan
+        return shifted
+
+    def padded(self, metrics=None):
+        '''
+        Args:
+            metrics: Metric name(s), or None for every metric
+        Return:
+            players x metrics x rows array of every player's history, padded
+                with zeros after the player's last row
+        '''
+        values = self.columns(metrics)
+        lengths = self.lengths
+        padded = np.zeros((len(lengths), values.shape[1], lengths.max() if len(lengths) else 0))
+        player = np.repeat(np.arange(len(lengths)), lengths)
+        padded[player[:, None], np.arange(values.shape[1]), self.position[:, None]] = values
+        return padded
+
+    def restore(self, array):
+        '''
+        Args:
+            array: Array with one row per panel row
+        Return:
+            The array with rows back in the order of the original table
+        '''
+        restored = np.empty_like(array)
+        restored[self.order] = array
+        return restored
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PURPOSE:
+    Collapse the team stints of players traded mid-season down to one row per
+    player|season, once at ingest, and cache the result under cache/ in this
+    directory so every consumer reads pre-collapsed player-seasons.
+
+    Two modes:
+        tot: keep Basketball-Reference's TOT row for traded players and the
+            single row for everyone else
+        aggregate: combine the team stints, by default adding up the counting
+            stats and weighting every other numeric column by minutes played
+            (or with any groupby agg_function)
+"""
+
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+# Collapsed tables are cached here (ignored by git) rather than under data/
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+
+# Season totals that are added up over a traded player's stints: the
+# Basketball-Reference totals and win shares and ESPN games and wins
+COUNTING_COLUMNS = ['G', 'GS', 'FG', 'FGA', '3P', '3PA', '2P', '2PA', 'FT', 'FTA', 'ORB', 'DRB',
+                    'TRB', 'AST', 'STL', 'BLK', 'TOV', 'PF', 'PTS', 'OWS', 'DWS', 'WS', 'VORP',
+                    'gp', 'wins']
+
+def collapse_traded_seasons(df, mode='tot', keys=('BBREF_ID', 'SEASON'), team_col='TEAM',
+                            tot_label='TOT', weight_col='MP', sum_cols=None, agg_function=None):
+    '''
+    Reduce a player|season table with one row per team stint to one row per
+    player|season.
+
+    Args:
+        df: Data.Frame with one or more rows per player|season
+        mode: 'tot' or 'aggregate'
+        keys: Columns identifying a player|season
+        team_col: Column name of the team
+        tot_label: Team value of the combined row for traded players
+        weight_col: Aggregate mode, column to weight the averages by and sum
+        sum_cols: Aggregate mode, columns to add up instead of average. None
+            adds up the COUNTING_COLUMNS in df
+        agg_function: Aggregate mode, groupby aggregation to use for every
+            numeric column instead of the weighted average
+    Return:
+        A dataframe with one row per player|season
+    '''
+    keys = list(keys)
+    if mode == 'tot':
+        # Traded players have a row per team plus the TOT row, so keep TOT
+        # wherever a player|season has more than one row
+        traded = df.duplicated(keys, keep=False)
+        keep = (~traded | (df[team_col] == tot_label)) & df[keys].notnull().all(axis=1)
+        return df[keep]
+
+    if mode != 'aggregate':
+        raise ValueError("mode must be 'tot' or 'aggregate'")
+
+    stints = df[df[team_col] != tot_label]
+    numeric_cols = [col for col in stints.select_dtypes(include=np.number).columns if col not in keys]
+    other_cols = [col for col in stints.columns if col not in keys + numeric_cols]
+    grouped = stints.groupby(keys, sort=False)
+    if agg_function is not None:
+        collapsed = grouped[numeric_cols].agg(agg_function)
+    else:
+        # Weighted average of every numeric column in one groupby sum:
+        # sum(weight * value) / sum(weight) over the stints with a value
+        if sum_cols is None:
+            sum_cols = COUNTING_COLUMNS
+        average_cols = [col for col in numeric_cols if col not in list(sum_cols) + [weight_col]]
+        values = stints[average_cols]
+        weights = values.notnull().mul(stints[weight_col], axis=0)
+        sums = pd.concat([values.mul(stints[weight_col], axis=0), weights.add_suffix('_WEIGHT'),
+                          stints[[col for col in numeric_cols if col not in average_cols]]],
+                         axis=1).groupby([stints[key] for key in keys], sort=False).sum()
+        collapsed = sums[average_cols] / sums[[col + '_WEIGHT' for col in average_cols]].values
+        collapsed = pd.concat([collapsed, sums[[col for col in numeric_cols if col not in average_cols]]],
+                              axis=1)[numeric_cols]
+    collapsed = collapsed.join(grouped[other_cols].first())
+    # Players with more than one stint get the combined team label
+    if team_col in collapsed.columns:
+        collapsed.loc[grouped.size() > 1, team_col] = tot_label
+    return collapsed.reset_index()[[col for col in df.columns if col in keys + numeric_cols + other_cols]]
+
+def load_player_seasons(path, mode='tot', **kwargs):
+    '''
+    Read a player|season csv collapsed with collapse_traded_seasons. The
+    collapsed table is cached as a pickle in CACHE_DIR (one per csv, mode and
+    set of arguments) and rebuilt when the csv changes.
+
+    Args:
+        path: Path of the csv
+        mode: 'tot' or 'aggregate'
+        kwargs: Other arguments to collapse_traded_seasons
+    Return:
+        A dataframe with one row per player|season
+    '''
+    # Cache each csv and set of arguments separately
+    cache_name = '{0}_{1}_{2}'.format(os.path.splitext(os.path.basename(path))[0],
+                                      hashlib.md5(os.path.abspath(path).encode()).hexdigest()[:8], mode)
+    if kwargs:
+        cache_name += '_' + hashlib.md5(repr(sorted(kwargs.items())).encode()).hexdigest()[:8]
+    if not os.path.exists(CACHE_DIR):
+        os.makedirs(CACHE_DIR)
+    cache_path = os.path.join(CACHE_DIR, cache_name + '.pkl')
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+        return pd.read_pickle(cache_path)
+    player_seasons = collapse_traded_seasons(pd.read_csv(path), mode=mode, **kwargs)
+    player_seasons.to_pickle(cache_path)
+    return player_seasons
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PURPOSE:
+    Build the modeling targets (data/nba/modeling_targets/modeling_targets.csv)
+    from the raw sources: the RPM/BPM blend of each player|season and the
+    blend led out to the player's next five seasons. The feature builds call
+    update_modeling_targets, which rebuilds the csv whenever the content of
+    the ESPN, Basketball-Reference or player id files (or of the csv itself)
+    changed since it was last written.
+"""
+
+import os
+import sys
+import csv
+import json
+import hashlib
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'player_seasons'))
+from player_seasons import collapse_traded_seasons, load_player_seasons
+from player_panel import PlayerPanel
+
+# Content hashes of the sources and the csv as of the last rebuild (ignored by git)
+MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache',
+                             'modeling_targets_manifest.json')
+
+def load_blend_inputs(rpm_path, bbref_path, player_table_path):
+    '''
+    Join ESPN RPM onto Basketball-Reference BPM for every player|season with
+    both.
+
+    Args:
+        rpm_path: Path to espn_nba_rpm.csv
+        bbref_path: Path to bbref_player_data.csv
+        player_table_path: Path to player_table.csv, to look up the bbref_id
+            of every espn_link
+    Return:
+        A dataframe with bbref_id, season (end year), rpm and bpm, sorted by
+            season and espn_link
+    '''
+    # Average the team stints of players traded mid-season
+    rpm = collapse_traded_seasons(pd.read_csv(rpm_path, usecols=['espn_link', 'season', 'team', 'rpm']),
+                                  mode='aggregate', keys=['espn_link', 'season'],
+                                  team_col='team', agg_function='mean')
+    player_table = pd.read_csv(player_table_path, usecols=['espn_link', 'bbref_id'])\
+                     .drop_duplicates('espn_link')
+    rpm = pd.merge(rpm, player_table, on='espn_link').sort_values(['season', 'espn_link'])
+    # TOT row for players traded mid-season
+    bpm = load_player_seasons(bbref_path)[['BBREF_ID', 'SEASON', 'BPM']]
+    bpm = pd.DataFrame({'bbref_id': bpm['BBREF_ID'].values,
+                        'season': bpm['SEASON'].str[5:].astype(int).values,
+                        'bpm': bpm['BPM'].values})
+    return pd.merge(rpm[['bbref_id', 'season', 'rpm']], bpm, on=['bbref_id', 'season'])
+
+def blend_targets(players, rpm_weight=2, bpm_weight=1, horizons=5):
+    '''
+    Blend RPM and BPM and lead the blend out over the player's following
+    seasons. Leads step to the player's next season in the table, so a season
+    the player missed is skipped rather than left NA.
+
+    Args:
+        players: Output of load_blend_inputs
+        rpm_weight: Weight of RPM in the blend
+        bpm_weight: Weight of BPM in the blend
+        horizons: Number of seasons to lead the blend out
+    Return:
+        A dataframe with bbref_id, season, blend and season_plus_1..horizons
+    '''
+    targets = players[['bbref_id', 'season']].assign(
+        blend=(rpm_weight * players['rpm'] + bpm_weight * players['bpm']) / (rpm_weight + bpm_weight))\
+        .reset_index(drop=True)
+    panel = PlayerPanel(targets, 'bbref_id', ['blend'], season_col='season')
+    for horizon in range(1, horizons + 1):
+        targets['season_plus_{}'.format(horizon)] = panel.restore(panel.shift(-horizon))[:, 0]
+    return targets
+
+def write_targets(targets, path):
+    '''
+    Write the modeling targets in the layout of the R-written csv: quoted
+    header and ids, NA for missing values and 15 significant digits.
+
+    Args:
+        targets: Output of blend_targets
+        path: Path to modeling_targets.csv
+    '''
+    with open(path, 'w') as f:
+        f.write(','.join('"{}"'.format(col) for col in targets.columns) + '\n')
+        targets.assign(bbref_id='"' + targets['bbref_id'] + '"')\
+               .to_csv(f, index=False, header=False, na_rep='NA', quoting=csv.QUOTE_NONE,
+                       quotechar="'", float_format='%.15g')
+
+def file_md5(path):
+    '''
+    Args:
+        path: Path of the file
+    Return:
+        md5 of the file's contents
+    '''
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+def update_modeling_targets(path, rpm_path, bbref_path, player_table_path, manifest_path=MANIFEST_PATH):
+    '''
+    Read the modeling targets, rebuilding them first if the content of any
+    of the sources, of this module or of the csv changed since the last
+    rebuild. The hashes are kept in manifest_path.
+
+    Args:
+        path: Path to modeling_targets.csv
+        rpm_path: Path to espn_nba_rpm.csv
+        bbref_path: Path to bbref_player_data.csv
+        player_table_path: Path to player_table.csv
+        manifest_path: Path of the json of hashes
+    Return:
+        A dataframe of the modeling targets
+    '''
+    sources = {'rpm': file_md5(rpm_path), 'bbref': file_md5(bbref_path),
+               'player_table': file_md5(player_table_path),
+               'code': file_md5(os.path.splitext(os.path.abspath(__file__))[0] + '.py')}
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    if os.path.exists(path) and manifest.get('sources') == sources and manifest.get('targets') == file_md5(path):
+        return pd.read_csv(path)
+
+    targets = blend_targets(load_blend_inputs(rpm_path, bbref_path, player_table_path))
+    write_targets(targets, path)
+    if not os.path.exists(os.path.dirname(manifest_path)):
+        os.makedirs(os.path.dirname(manifest_path))
+    with open(manifest_path, 'w') as f:
+        json.dump({'sources': sources, 'targets': file_md5(path)}, f, indent=2)
+    return targets
+
+if __name__=='__main__':
+    # Rebuild the modeling targets if the sources changed
+    update_modeling_targets('../../data/nba/modeling_targets/modeling_targets.csv',
+                            '../../data/nba/espn/espn_nba_rpm.csv',
+                            '../../data/nba/basketball_reference/player_data/combined/bbref_player_data.csv',
+                            '../../data/player_ids/player_table.csv')
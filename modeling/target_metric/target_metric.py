@@ -9,8 +9,74 @@ PURPOSE:
 @author: tspoo1
 """
 
+import os
+import numpy as np
 import pandas as pd
 import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'player_seasons'))
+from player_seasons import collapse_traded_seasons
+from player_panel import PlayerPanel
+
+def expand_player_seasons(df, group_cols, season_name):
+    '''
+    Expand every player's seasons out to one row for each season between
+    their first and last, sorted by player and season. All ranges are built
+    with one repeat/arange and joined to df once.
+
+    Args:
+        df: Data.Frame with one row per player|season
+        group_cols: Columns identifying a player
+        season_name: Column name of the (integer) season column
+    Return:
+        A dataframe with every player|season in range and the columns of df,
+            NA for seasons the player missed
+    '''
+    player_seasons = df.groupby(group_cols)[season_name].agg(['min', 'max']).reset_index()
+    lengths = (player_seasons['max'] - player_seasons['min'] + 1).values
+    starts = np.cumsum(lengths) - lengths
+    panel = player_seasons.loc[player_seasons.index.repeat(lengths), group_cols].reset_index(drop = True)
+    panel[season_name] = np.repeat(player_seasons['min'].values, lengths) + \
+        np.arange(lengths.sum()) - np.repeat(starts, lengths)
+    return pd.merge(panel, df, how = 'left', on = group_cols + [season_name])
+
+def panel_shifts(panel, group_cols, target_names, lags = 4, leads = 4):
+    '''
+    Lead and lag target columns within each player of a panel from
+    expand_player_seasons. Every shift is read off one PlayerPanel by
+    offset, instead of re-sorting for each shift.
+
+    Args:
+        panel: Data.Frame with each player's seasons in order
+        group_cols: Columns identifying a player
+        target_names: Metric or list of metrics to shift
+        lags: Number of seasons to lag the targets (season_minus_1..lags), or
+            a list of the lags to keep
+        leads: Number of seasons to lead the targets (season_plus_1..leads),
+            or a list of the leads to keep
+    Return:
+        A dataframe on the same index as panel with season_minus_*,
+            season_plus_0 and season_plus_* columns for each target, prefixed
+            with the target name when there is more than one
+    '''
+    single = isinstance(target_names, str)
+    if single:
+        target_names = [target_names]
+    if isinstance(lags, int):
+        lags = range(1, lags + 1)
+    if isinstance(leads, int):
+        leads = range(1, leads + 1)
+    player_panel = PlayerPanel(panel, group_cols, target_names)
+    columns = {}
+    for k, target_name in enumerate(target_names):
+        prefix = '' if single else '{}_'.format(target_name)
+        for m in lags:
+            columns['{0}season_minus_{1}'.format(prefix, m)] = \
+                player_panel.restore(player_panel.shift(m, target_name)[:, 0])
+        columns['{}season_plus_0'.format(prefix)] = panel[target_name].values.astype(float)
+        for m in leads:
+            columns['{0}season_plus_{1}'.format(prefix, m)] = \
+                player_panel.restore(player_panel.shift(-m, target_name)[:, 0])
+    return pd.DataFrame(columns, index = panel.index)
 
 def pivot_target_column(df, target_name, player_name, id_name, season_name, agg_function):
     '''
@@ -33,47 +99,83 @@ def pivot_target_column(df, target_name, player_name, id_name, season_name, agg_
     if len(condition) > 0:
         sys.exit('Not all inputed column names are columns in df... Come on man!')
 
-    # Filter out total team roles, only take 3 columns
-    data_sub = df[df.team != 'TOT'][[player_name, id_name, season_name, target_name]]
-    # Remove duplicates by aggregating down
-    data_sub = data_sub.groupby([player_name, id_name, season_name]).agg(agg_function).reset_index()
-
-    # Create seperate df for all seasons between they played
-    # In case people were in and out of the league
-    player_seasons = data_sub.groupby([player_name, id_name]).season.agg(['min', 'max']).reset_index()
+    # Aggregate the team stints (not the total team rows) down to one row
+    # per player|season, only keep the target
+    data_sub = collapse_traded_seasons(df[[player_name, id_name, season_name, 'team', target_name]],
+                                       mode='aggregate',
+                                       keys=[player_name, id_name, season_name],
+                                       team_col='team',
+                                       agg_function=agg_function)[[player_name, id_name, season_name, target_name]]
 
-    player_seasons_full = pd.DataFrame(columns = [player_name, id_name, season_name])
-    for p in range(0, player_seasons.shape[0]):
-        min_season = player_seasons['min'][p]
-        max_season = player_seasons['max'][p]
-        all_seasons = [x for x in range(min_season, max_season+1)]
-        df_temp = pd.DataFrame(all_seasons, columns = [season_name])
-        df_temp[player_name] = player_seasons[player_name][p]
-        df_temp[id_name] = player_seasons[id_name][p]
-        player_seasons_full = player_seasons_full.append(df_temp,
-                                                         ignore_index = True,
-                                                         sort = False)
-        # Join together so NA values will people who jump in and out of league
-        data_sub = (
-            player_seasons_full
-                .set_index([player_name, id_name, season_name])
-                .join(data_sub.set_index([player_name, id_name, season_name]), how = 'left')
-                .reset_index()
-        )
-    # Lead and Lag the target variable out -4 to +4 
-    for m in range(0, 9):
-        if m <= 3:
-            data_sub['season_minus_{}'.format(m+1)] = (
-                data_sub.sort_values(by = [season_name])
-                    .groupby([player_name, id_name])[target_name].shift(m+1)
-                )
-        elif m == 4:
-            data_sub['season_plus_0'] = data_sub[target_name]
-        else:
-            data_sub['season_plus_{}'.format(m-4)] = (
-                data_sub.sort_values(by = [season_name])
-                    .groupby([player_name, id_name])[target_name].shift(-(m-4))
-            )
+    # Every season between a player's first and last, so the leads and lags
+    # line up for people who jump in and out of the league
+    data_sub = expand_player_seasons(data_sub, [player_name, id_name], season_name)
+    # Lead and Lag the target variable out -4 to +4
+    data_sub = pd.concat([data_sub, panel_shifts(data_sub, [player_name, id_name], target_name)],
+                         axis = 1)
     # Drop the original target variable
     data_sub = data_sub.drop(target_name, axis = 1)
-    return(data_sub)
\ No newline at end of file
+    return(data_sub)
+
+def create_target_matrix(df, target_names, id_cols, season_name, team_name = None,
+                         horizons = (1, 2, 3, 4, 5), lags = (), weight_name = 'MP',
+                         agg_function = None, tot_label = 'TOT'):
+    '''
+    Lead (and lag) many target metrics out at once. The data is collapsed to
+    one row per player|season and expanded to a panel once, and every
+    metric's shifts are read off that one sorted panel, so trying another
+    target does not mean pivoting the data again.
+
+    Args:
+        df: Data.Frame that contains all the columns
+        target_names: Metric or list of metrics to pivot out, e.g.
+            ['BPM', 'VORP', 'WS/48']
+        id_cols: Column name(s) identifying a player
+        season_name: Column name of the season column, as the integer season
+            end year
+        team_name: Column name of the team, to collapse the stints of players
+            traded mid-season. The tot_label row is kept where df has one
+            (Basketball-Reference), otherwise the stints are combined with
+            collapse_traded_seasons: counting stats added up and everything
+            else weighted by weight_name. None if df already has one row per
+            player|season
+        horizons: Seasons ahead to lead every metric out
+        lags: Seasons back to lag every metric out
+        weight_name: Column name of the minutes to weight the stints by
+        agg_function: Groupby aggregation to combine the stints with instead
+            of the weighted average
+        tot_label: Team value of the combined row for traded players
+    Return:
+        A dataframe with the id columns, season and, for every metric,
+            <metric>_season_plus_0 plus its lead and lag columns
+    '''
+    target_names = [target_names] if isinstance(target_names, str) else list(target_names)
+    id_cols = [id_cols] if isinstance(id_cols, str) else list(id_cols)
+    columns = id_cols + [season_name] + target_names
+    if team_name is not None:
+        columns += [team_name]
+        if agg_function is None and weight_name not in columns:
+            columns += [weight_name]
+    condition = list(set(columns) - set(list(df.columns)))
+    if len(condition) > 0:
+        sys.exit('Not all inputed column names are columns in df... Come on man!')
+
+    data_sub = df[columns]
+    if team_name is not None:
+        if (data_sub[team_name] == tot_label).any():
+            data_sub = collapse_traded_seasons(data_sub, mode = 'tot',
+                                               keys = id_cols + [season_name],
+                                               team_col = team_name,
+                                               tot_label = tot_label)
+        else:
+            data_sub = collapse_traded_seasons(data_sub, mode = 'aggregate',
+                                               keys = id_cols + [season_name],
+                                               team_col = team_name,
+                                               tot_label = tot_label,
+                                               weight_col = weight_name,
+                                               agg_function = agg_function)
+    data_sub = expand_player_seasons(data_sub[id_cols + [season_name] + target_names],
+                                     id_cols, season_name)
+    shifts = panel_shifts(data_sub, id_cols, target_names, lags = list(lags),
+                          leads = list(horizons))
+    return pd.concat([data_sub[id_cols + [season_name]], shifts], axis = 1)